@@ -15,6 +15,7 @@ PALETTE = [
     ('header', 'dark green,bold,underline', 'black'),
     ('status_line', 'light gray', 'black'),
     ('command_output', 'dark green', 'black'),
+    ('stats', 'light gray', 'black'),
     ('footer', 'dark green,bold', 'black'),
 ]
 VERSION = '1.0'
@@ -27,6 +28,43 @@ HIDE_COMMAND_OUTPUT = False #OPTIONAL: set this to True if you don't want to out
 HIDE_FOOTER = False #OPTIONAL: set this to True if you don't want to display the FOOTER_TEXT at the bottom
 HORIZONTAL_PADDING = 'auto' # How much padding do you want to the left and right of your button label? Set to: 'auto' to equally distribute across the full width, 0 or False (without quotes) for a compact view without padding, or a pair of integers to define the left and right amount of padding (e.g. [5, 2] for 5 padding on the left and 2 on the right)
 VERTICAL_PADDING = [1,1] # first number is the amount of lines to pad at the top of the button, second number is amount at the bottom
+OUTPUT_VISIBLE_LINES = 10 #OPTIONAL: the number of lines of command output to show below the buttons
+OUTPUT_SCROLLBACK_LINES = 1000 #OPTIONAL: the number of lines of command output that are kept (per command, and in the output pane), which you can scroll through with [ and ] (a page back or forward), { (oldest line) and } (latest line)
+OUTPUT_FILTER_KEY = 'f' #OPTIONAL: the key that shows only the output of the focused button's command in the output pane (with all of the OUTPUT_SCROLLBACK_LINES kept for that command), or all output again
+ANSI_COLORS = True #OPTIONAL: show the colours that commands set with ANSI escape sequences in their output and in dynamic labels; set this to False to show their output without colours
+MAX_REFRESH_RATE = 30 #OPTIONAL: the maximum number of times per second that command output and dynamic labels update the screen; None to update on every chunk of output
+MAX_PROCESSES = None #OPTIONAL: the maximum number of commands (dynamic labels included) that may run at the same time; None for no limit
+MAX_PROCESSES_PER_COMMAND = None #OPTIONAL: the maximum number of simultaneous runs of the same command; None for no limit
+PROCESS_LIMITS = {} #OPTIONAL: per-command overrides of MAX_PROCESSES_PER_COMMAND, keyed on the command key, e.g.: {'CURL': 1}
+COMMAND_TIMEOUT = None #OPTIONAL: the number of seconds after which a running command is stopped; None for no limit
+COMMAND_TIMEOUTS = {} #OPTIONAL: per-command overrides of COMMAND_TIMEOUT, keyed on the command key, e.g.: {'CURL': 30}
+SHELL_POOL_SIZE = 0 #OPTIONAL: the number of warm shells kept ready to run string commands in, which saves starting a new /bin/sh for every click; 0 to start a new shell for every command
+SHELL_POOL_MAX_JOBS = 100 #OPTIONAL: the number of commands a pooled shell runs before it is replaced by a fresh one
+COMMAND_INPUT = {} #OPTIONAL: commands that get the output of another command on their stdin, keyed on their command key, e.g.: {'Latest headline': 'Fetch news page', 'All headlines': 'Fetch news page'}; when that other command has a TTL in RESULT_CACHE_TTL, the commands share a single run of it
+CANCEL_KEY = 'c' #OPTIONAL: the key that stops the running command(s) of the focused button
+MACRO_PARALLELISM = 4 #OPTIONAL: the number of steps of a macro that may run at the same time, unless the macro sets its own 'parallelism'
+EVENT_LOOP = 'select' #OPTIONAL: set this to 'asyncio' to run the interface and the commands on an asyncio event loop (can also be set with --event-loop)
+SPOOL_OUTPUT = True #OPTIONAL: set this to False to not write the complete output of every command run from a button to a spool file
+SPOOL_DIRECTORY = None #OPTIONAL: where the spool files are written; None for $XDG_STATE_HOME/tui_launcher/spool (~/.local/state/tui_launcher/spool)
+SPOOL_MAX_BYTES = 256 * 1024 * 1024 #OPTIONAL: the oldest spool files are removed while all of them together are larger than this; None for no limit
+SPOOL_MAX_AGE = 7 * 24 * 60 * 60 #OPTIONAL: spool files older than this number of seconds are removed; None for no limit
+OPEN_SPOOL_KEY = 'o' #OPTIONAL: the key that opens the complete output of the last run of the focused button in a pager
+COMMAND_PALETTE_KEY = '/' #OPTIONAL: the key that opens the command palette, to find and run any command by typing part of its name
+RECENT_COMMANDS = 10 #OPTIONAL: the number of most recently run commands that the command palette ranks above other matches
+RELOAD_ON_CHANGE = True #OPTIONAL: watch this config and its layout file, and apply changes to them without restarting (settings such as EVENT_LOOP, SHELL_POOL_SIZE and the header and footer text still need a restart)
+RELOAD_POLL_INTERVAL = 1 #OPTIONAL: how often (in seconds) the config and layout file are checked for changes where inotify isn't available
+DAEMON_SOCKET = None #OPTIONAL: the Unix socket of the daemon started with --daemon, that TUIs started with --attach connect to; None for $XDG_RUNTIME_DIR/tui_launcher-<config>.sock (can also be set with --socket)
+DAEMON_CLIENT_BUFFER = 4 * 1024 * 1024 #OPTIONAL: the daemon disconnects an attached TUI that has more than this many bytes of updates waiting to be read; it gets a fresh snapshot when it reattaches
+SHOW_STATS = False #OPTIONAL: set this to True to show the command statistics panel (runs, failures, duration percentiles, time to first output, output size and last exit status per command) at startup
+STATS_KEY = 's' #OPTIONAL: the key that shows or hides the command statistics panel
+STATS_LINES = 10 #OPTIONAL: the number of (most used) commands shown in the statistics panel
+METRICS_FILE = None #OPTIONAL: a file to write the command metrics to every METRICS_EXPORT_INTERVAL seconds and on exit, e.g.: Path('metrics.json')
+METRICS_FORMAT = 'json' #OPTIONAL: the format of METRICS_FILE: 'json', or 'prometheus' for the Prometheus text format (e.g. for the textfile collector of node_exporter)
+METRICS_EXPORT_INTERVAL = 10 #OPTIONAL: how often (in seconds) METRICS_FILE is written
+SAVE_STATE = True #OPTIONAL: remember the text of the dynamic labels, the command output and the clicked button, and show them right away on the next launch until fresh output replaces them; set this to False to start with the keys of the dynamic labels and an empty output pane
+STATE_FILE = None #OPTIONAL: where that is remembered; None for $XDG_STATE_HOME/tui_launcher/state-<config>-<tmux pane or terminal>.json (~/.local/state/tui_launcher/), so launchers in different tmux panes or terminals each restore their own state
+STATE_SAVE_INTERVAL = 5 #OPTIONAL: the state file is written at most once every this many seconds while things change, and on exit
+COMPILE_CACHE = True #OPTIONAL: set this to False if this config computes values at import time (e.g. from environment variables), so it is imported on every launch instead of being loaded from the compiled cache
 
 BORDERS = {
     'top_vertical_padding_character': ' ',
@@ -61,6 +99,7 @@ BORDERS = {
 # A dict of a commands, where the key will be used as the label for the button, and the value is the command that will be executed when you click on it.
 # The command can be either a list of arguments, e.g.: ['curl', '--silent', '-v', '--location', 'https://site.example']
 # or a string (in which case it will be executed within a /bin/sh shell): 'curl --silent -v --location https://site.example'
+# or a dict, which makes it a macro that runs other commands as its 'steps', each mapped to the steps it depends on: {'steps': {'Skip': [], 'CURL': ['Skip']}, 'parallelism': 2, 'on_failure': 'stop'}
 # This default example set of commands does things like append a string to a commands.log, run Windows explorer from Windows Subsystem for Linux, curl an example site, or open my intro video in MPV.
 commands = {
   '▶ Play': 'echo "playing" >> commands.log',
@@ -16,6 +16,7 @@ PALETTE = [
     ('header', 'dark green,bold,underline', 'black'),
     ('status_line', 'light gray', 'black'),
     ('command_output', 'dark green', 'black'),
+    ('stats', 'light gray', 'black'),
     ('footer', 'dark green,bold', 'black'),
     ('dynamic_label', 'dark red,bold', 'yellow'),
     ('last_toot_header', 'yellow,bold', 'dark red'),
@@ -33,14 +34,45 @@ HIDE_FOOTER = False #OPTIONAL: set this to True if you don't want to display the
 # or a string (in which case it will be executed within a /bin/sh shell): 'curl --silent -v --location https://site.example'
 commands = {
   'Get current datetime': ['date', '+%Y%m%d%H%M.%S'],
-  'date_dynamic_label': f"""while true; do date "+%Y%m%d%H%M.%S"; sleep 1; done""",
+  'date_dynamic_label': ['date', '+%Y%m%d%H%M.%S'],
   'tail_dynamic_label': ['tail', '-f', '-n1', 'watch.txt'],
   'tail_header_dynamic_label': ['echo', 'following tail for watch.txt:'],
-  'lastfm_dynamic_label': """while true; do curl --silent https://www.last.fm/user/FiXato | pup '#recent-tracks-section .chartlist-row:first-child .chartlist-artist a, #recent-tracks-section .chartlist-row:first-child .chartlist-name a text{}' | paste -s | sed 's/\t/ — /'; sleep 60; done""",
-  'get recent scrobbles': '''curl --silent https://www.last.fm/user/FiXato | pup '#recent-tracks-section .chartlist-row json{}' | jq '.[] | "\(.children[4]| .children[]["text"]) — \(.children[3]| .children[]["text"])"' ''',
-  '''FiXato's most recent toots''': '''curl --silent https://toot.cat/@FiXato.rss | xq -r '.rss .channel .item[0:5][] | .description | gsub("</?(br|p) ?/?>"; "") | gsub("$"; "<br />")' | html2text --ignore-links --no-wrap-links -b 0 ''',
-  'last_toot_dynamic_label': """while true; do curl --silent https://toot.cat/@FiXato.rss | xq -r '.rss .channel .item[0] .description' | html2text --ignore-links --no-wrap-links -b 0; sleep 300; done""",
+  'last.fm profile page': 'curl --silent https://www.last.fm/user/FiXato',
+  'lastfm_dynamic_label': """pup '#recent-tracks-section .chartlist-row:first-child .chartlist-artist a, #recent-tracks-section .chartlist-row:first-child .chartlist-name a text{}' | paste -s | sed 's/\t/ — /'""",
+  'get recent scrobbles': '''pup '#recent-tracks-section .chartlist-row json{}' | jq '.[] | "\(.children[4]| .children[]["text"]) — \(.children[3]| .children[]["text"])"' ''',
+  'toot.cat feed': 'curl --silent https://toot.cat/@FiXato.rss',
+  '''FiXato's most recent toots''': '''xq -r '.rss .channel .item[0:5][] | .description | gsub("</?(br|p) ?/?>"; "") | gsub("$"; "<br />")' | html2text --ignore-links --no-wrap-links -b 0 ''',
+  'last_toot_dynamic_label': """xq -r '.rss .channel .item[0] .description' | html2text --ignore-links --no-wrap-links -b 0""",
   'last_toot_header_dynamic_label': 'echo "Last toot by @FiXato@toot.cat"'
 }
 
+# Per dynamic label options, keyed on the command key of the label:
+# - max_refresh_rate: the maximum number of times per second the label is updated, overriding MAX_REFRESH_RATE; the latest output wins
+# - interval: run the label's command every this many seconds, and show the output of the last run. Without an interval the command is started once, and every chunk of its output replaces the label (e.g. for tail -f)
+# - timeout: kill a run that takes longer than this many seconds
+# - jitter: add a random delay of up to this many seconds to every interval, so labels on many launchers don't all refresh at the same moment
+# - backoff: multiply the interval by this factor for every consecutive failed (non-zero exit status or timed out) run, up to max_interval seconds
+# - pause_when_hidden: skip runs while the label is not on screen (default: True)
+DYNAMIC_LABEL_OPTIONS = {
+  'date_dynamic_label': {'interval': 1, 'timeout': 1},
+  'lastfm_dynamic_label': {'interval': 60, 'timeout': 30, 'jitter': 5, 'backoff': 2, 'max_interval': 600},
+  'last_toot_dynamic_label': {'interval': 300, 'timeout': 30, 'jitter': 15, 'backoff': 2, 'max_interval': 1800},
+  'tail_dynamic_label': {'max_refresh_rate': 4},
+}
+# Commands that are run with the output of another command on their stdin, keyed on their command key. The last.fm and toot buttons and labels each show a different part of the same page, which is downloaded once, by the command they all take their input from.
+COMMAND_INPUT = {
+  'lastfm_dynamic_label': 'last.fm profile page',
+  'get recent scrobbles': 'last.fm profile page',
+  '''FiXato's most recent toots''': 'toot.cat feed',
+  'last_toot_dynamic_label': 'toot.cat feed',
+}
+# Opt-in result cache: the output of the commands listed here (keyed on the command key, with the number of seconds a result stays valid) is reused by every button and label that runs the same command within that time.
+# Requests for one of these commands while it is already running share the running process, rather than starting another one.
+RESULT_CACHE_TTL = {
+  'last.fm profile page': 60,
+  'toot.cat feed': 300,
+}
+RESULT_CACHE_SIZE = 32 #OPTIONAL: the number of cached results to keep; the least recently used ones are dropped first
+DYNAMIC_LABEL_STAGGER = 0.05 #OPTIONAL: the delay in seconds between starting successive dynamic labels at launch
+
 layout_file = Path('layouts/dynamic_labels.txt')
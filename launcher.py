@@ -2,13 +2,13 @@
 # encoding: utf-8
 # TUI-based launcher script by Filip H.F. "FiXato" Slagter
 #
-# Suggested way to launch so it gets the current terminal's width: `./launcher.py --term-width="$(tput cols)"`
+# Launch with: `./launcher.py`; the buttons are laid out across the current width of the terminal, and reflow when it is resized.
 # See README.md (https://github.com/FiXato/tui_launcher/blob/main/README.md) for more detailed launch and usage instructions.
 #
 # Want to buy me a beer? Or toss a few coins to your code-witcher for new hardware?
 # I accept paypal donations: https://www.paypal.com/donate/?hosted_button_id=ZR6T84CGV53V2
 #
-from os import getenv, pipe
+from os import chmod, close, fstat, getenv, getuid, killpg, getpid, lstat, mkfifo, open as os_open, pipe, read as os_read, replace as replace_file, set_blocking, ttyname, write as os_write, scandir, O_NONBLOCK, O_RDONLY, O_WRONLY
 import logging
 logger = logging.getLogger()
 
@@ -16,9 +16,12 @@ LOG_LEVEL = getenv('LOG_LEVEL')
 if LOG_LEVEL and hasattr(logging, LOG_LEVEL):
     logger.setLevel(getattr(logging, LOG_LEVEL))
 from math import floor, ceil
-from pathlib import Path
-from sys import exit
+from pathlib import Path, PurePath
+from types import BuiltinFunctionType, FunctionType, ModuleType
+from sys import exit, version_info
+import sys
 from importlib import import_module
+import importlib.util
 from os import environ as ENV
 import argparse
 import urwid
@@ -26,14 +29,62 @@ import subprocess
 import functools
 import re
 import unicodedata
+import time
+import hashlib
+import pickle
+import signal
+import codecs
+import random
+import statistics
+from stat import S_ISDIR
+import mmap
+from collections import Counter, deque, OrderedDict
+from itertools import compress, islice, repeat
+from bisect import bisect_left, bisect_right
+from contextlib import contextmanager
+import tempfile
+import shutil
+from shlex import quote as shlex_quote
+import tracemalloc
+import asyncio
+import json
+import queue
+import threading
+import platform
+import ctypes
+import ctypes.util
+import struct
+import difflib
+import heapq
+import operator
+import socket
+import base64
+try:
+    from os import pidfd_open
+except ImportError:
+    pidfd_open = None
 #from IPython import embed
 urwid.set_encoding("utf8")
+BENCHMARKS = ('find_command', 'startup', 'button_grid', 'display_width', 'output_throughput', 'ansi_output', 'shell_pool', 'command_palette')
 arg_parser = argparse.ArgumentParser(description='TUI-based Launcher that allows you to launch apps and run commands by clicking on self-defined buttons.')
 arg_parser.add_argument('--config-file', nargs=1)
-arg_parser.add_argument('--term-width', nargs=1)
+arg_parser.add_argument('--term-width', nargs=1, help='Deprecated and ignored: the width of the terminal is now measured, and the buttons reflow when it is resized')
 arg_parser.add_argument('--layout-file', nargs=1)
 arg_parser.add_argument('--header-text', nargs=1)
 arg_parser.add_argument('--footer-text', nargs=1)
+arg_parser.add_argument('--bench', action='store_true', help='Run the built-in benchmarks, print their results as JSON and exit')
+arg_parser.add_argument('--bench-only', nargs='+', choices=BENCHMARKS, help='Only run these benchmarks')
+arg_parser.add_argument('--bench-commands', type=int, default=2000, help='The number of generated commands in the startup benchmark')
+arg_parser.add_argument('--bench-rows', type=int, default=500, help='The number of layout rows in the startup benchmark')
+arg_parser.add_argument('--bench-labels', choices=['plain', 'wide', 'emoji', 'zwj'], default='plain', help='The kind of generated button labels in the startup benchmark')
+arg_parser.add_argument('--bench-dynamic-labels', type=int, default=0, help='The number of dynamic labels in the startup benchmark')
+arg_parser.add_argument('--bench-palette-commands', type=int, default=50000, help='The number of generated commands in the command palette benchmark')
+arg_parser.add_argument('--bench-output-rate', type=int, default=1024 * 1024, help='The bytes per second of command output in the output throughput benchmark')
+arg_parser.add_argument('--no-cache', action='store_true', help='Ignore (and do not update) the compiled config/layout cache')
+arg_parser.add_argument('--daemon', action='store_true', help='Run the commands and dynamic labels without an interface, for TUIs started with --attach to show')
+arg_parser.add_argument('--attach', action='store_true', help='Show the buttons, labels and output of a launcher started with --daemon, instead of running the commands itself')
+arg_parser.add_argument('--socket', help='The Unix socket of the daemon; overrides DAEMON_SOCKET from the config')
+arg_parser.add_argument('--event-loop', choices=['select', 'asyncio'], help='The event loop to run commands on; overrides EVENT_LOOP from the config')
 args = arg_parser.parse_args()
 warnings = []
 
@@ -52,88 +103,211 @@ def debug(*message):
 def format_exception(message, exception):
   return '\n\t'.join([message, str(type(exception)), str(exception.args), str(exception)])
 
-config_path = Path('default.py')
-if args.config_file and args.config_file[0]:
-    config_path=Path(args.config_file[0])
-    try:
-        relative_config_path = config_path.resolve().relative_to(Path('.').resolve())
-        if relative_config_path.exists():
-            module_name = relative_config_path.with_suffix('').as_posix().replace('/', '.')
-            #print(f"""Loading module from {module_name}""")
-            Config = import_module(module_name)
+# Substring index over the keys of Config.commands, so layout items can be resolved without lowercasing and scanning every key for every lookup.
+# Keys are indexed by their lowercased character n-grams; each posting list holds key positions in the original dict order, so walking the shortest posting list of a query and returning the first verified match keeps the "first match wins" behaviour of the original linear scan.
+class CommandIndex():
+    NGRAM_SIZE = 3
+
+    def __init__(self, commands):
+        self.keys = list(commands)
+        self.lowered_keys = [key.lower() for key in self.keys]
+        self.postings = {}
+        self.resolved = {}
+        for position, lowered_key in enumerate(self.lowered_keys):
+            for ngram in set(self.ngrams(lowered_key)):
+                self.postings.setdefault(ngram, []).append(position)
+
+    def ngrams(self, text):
+        return (text[i:i + self.NGRAM_SIZE] for i in range(len(text) - self.NGRAM_SIZE + 1))
+
+    def candidates(self, test_key):
+        if len(test_key) < self.NGRAM_SIZE:
+            # Too short to be covered by the n-grams; fall back to checking every (pre-lowercased) key
+            return range(len(self.keys))
+        shortest = None
+        for ngram in set(self.ngrams(test_key)):
+            posting = self.postings.get(ngram)
+            if not posting:
+                return ()
+            if shortest is None or len(posting) < len(shortest):
+                shortest = posting
+        return shortest
+
+    def find(self, command_key):
+        if command_key in self.resolved:
+            return self.resolved[command_key]
+        test_key = command_key.lower()
+        match = None
+        for position in self.candidates(test_key):
+            if test_key in self.lowered_keys[position]:
+                match = self.keys[position]
+                break
+        self.resolved[command_key] = match
+        return match
+
+# Fuzzy (subsequence) index over the keys of Config.commands, for the command palette.
+# The lowercased keys are laid out as fixed-width rows of a code per character (one byte, or more when the keys have more than 128 distinct non-ASCII characters), and for every character typed, each column (character offset) is turned into a bitset over the keys that have that character there; that takes a single translate() per column and is done once per character, the first time it's typed.
+# The matches of a query are kept as bitsets per column where their leftmost-first match ends (and, for the first character, where it starts); typing a character is then a single sweep over the columns with a few integer operations, carrying the keys still waiting for the character forward, whatever the number of commands. The matches of every prefix of the query are kept, so backspacing costs nothing.
+# Matches are ranked by their span (shorter is better), then by where they start and then by their position in the config, which is the order in which the (span, start) bitsets are combined and their keys picked out; the RECENT_COMMANDS most recently run commands get a bonus.
+class FuzzyCommandIndex():
+    SPAN_WEIGHT = 1 << 16
+    RANKED_CACHE_SIZE = 256
+    PADDING = b'\0'
+
+    def __init__(self, commands, recent_commands=()):
+        self.keys = list(commands)
+        self.lowered_keys = [key.lower() for key in self.keys]
+        self.positions = {key: position for position, key in enumerate(self.keys)}
+        self.width = max(map(len, self.lowered_keys), default=0)
+        # ASCII characters are their own code, other characters get the codes from 128 on; every code is unique, and takes as many bytes (planes) as the largest one needs
+        self.codes = {chr(code): code for code in range(1, 128)}
+        non_ascii_characters = sorted(character for character in set(''.join(key for key in self.lowered_keys if not key.isascii())) if not character.isascii())
+        self.codes.update((character, 128 + index) for index, character in enumerate(non_ascii_characters))
+        self.planes = ((127 + len(non_ascii_characters)).bit_length() + 7) // 8
+        if self.planes == 1:
+            translation = {ord(character): code for character, code in self.codes.items() if code >= 128}
+            encoded = [(key if key.isascii() else key.translate(translation)).encode('latin-1') for key in reversed(self.lowered_keys)]
         else:
-            exit(f"""Could not find config at: {relative_config_path}""")
-    except Exception as inst:
-        error(format_exception(f"""Error loading config: {args.config_file[0]}""", inst))
+            translation = {ord(character): code.to_bytes(self.planes, 'big').decode('latin-1') for character, code in self.codes.items()}
+            translation[0] = self.PADDING.decode('latin-1') * self.planes
+            encoded = [key.translate(translation).encode('latin-1') for key in reversed(self.lowered_keys)]
+        # Last key first, so that the bitsets parsed from the columns have the first key as their lowest bit
+        row_size = self.width * self.planes
+        rows = b''.join(map(bytes.ljust, encoded, repeat(row_size), repeat(self.PADDING)))
+        # Byte plane p of column c is at c * planes + p
+        self.columns = [rows[offset::row_size] for offset in range(row_size)]
+        self.column_bits = {}
+        key_count = len(self.keys)
+        # (query, starts, ends, match count) for the empty query, followed by every prefix of the current one
+        self.steps = [('', None, [(1 << key_count) - 1] + [0] * self.width, key_count)]
+        self.set_recent(recent_commands)
 
-        exit("error while loading config. Perhaps the config is not relative to the current path?")
-else:
-    import configs.default as Config
-
-Config.active_widget = None
-# backwards compatibility hack as I want to rename the 'highlight' palette key to 'focused_button'
-Config.palette_keys = [key for (key, fg, bg) in Config.PALETTE]
-if 'focused_button' not in Config.palette_keys:
-    if 'highlight' not in Config.palette_keys:
-        warn("PALETTE in your config is missing a 'focused_button' markup item")
-    else:
-        warn("PALETTE in your config is missing a 'focused_button' markup item, but has the deprecated 'highlight' item; we'll use that, but please update your config to rename 'highlight' to 'focused_button'")
-        highlight_item = [item for item in Config.PALETTE if item[0] == 'highlight'][0]
-        Config.PALETTE.append(('focused_button', highlight_item[1], highlight_item[2]))
-
-if args.layout_file and args.layout_file[0]:
-    Config.layout_file=Path(args.layout_file[0])
-elif hasattr(Config, 'layout_file'):
-    pass
-else:
-  Config.layout_file=Path('layout.txt')
+    def set_recent(self, recent_commands):
+        # Ordered from least to most recently run
+        self.recent = [key for key in recent_commands if key in self.positions]
+        self.ranked = {}
 
-if Config.layout_file and not Config.layout_file.exists():
-    exit(f"""Config file {str(Config.layout_file)} does not exist""")
+    def bits_of(self, character):
+        # The keys that have the character at each column, as one bitset per column
+        if character not in self.column_bits:
+            code = self.codes.get(character)
+            bits = None
+            if code is not None:
+                code_bytes = code.to_bytes(self.planes, 'big')
+                to_binary = [bytes(ord('1') if byte == code_byte else ord('0') for byte in range(256)) for code_byte in code_bytes]
+                bits = []
+                for column in range(self.width):
+                    # The keys that have every byte of the code in its plane of the column
+                    found = -1
+                    for plane, code_byte in enumerate(code_bytes):
+                        plane_column = self.columns[column * self.planes + plane]
+                        found &= int(plane_column.translate(to_binary[plane]), 2) if code_byte in plane_column else 0
+                        if not found:
+                            break
+                    bits.append(found)
+            self.column_bits[character] = bits
+        return self.column_bits[character]
 
-if not hasattr(Config, 'dynamic_labels'):
-  Config.dynamic_labels={}
+    def match(self, query):
+        query = query.lower()
+        while not query.startswith(self.steps[-1][0]):
+            self.steps.pop()
+        step = self.steps[-1]
+        for character in query[len(step[0]):]:
+            step = self.extend(step, character)
+            self.steps.append(step)
+        return step
 
-if args.term_width and args.term_width[0]:
-  TERM_WIDTH=args.term_width[0]
-else:
-  TERM_WIDTH=None
-BUTTON_ROWS = []
+    def extend(self, step, character):
+        query, starts, ends, count = step
+        new_ends = [0] * (self.width + 1)
+        matched = 0
+        bits = self.bits_of(character) if count else None
+        if bits:
+            waiting = 0
+            for column, (ended, at_column) in enumerate(zip(ends, bits)):
+                waiting |= ended
+                found = waiting & at_column
+                if found:
+                    new_ends[column + 1] = found
+                    waiting ^= found
+                    matched |= found
+        return (
+            query + character,
+            starts if query else new_ends[1:],
+            new_ends,
+            bin(matched).count('1'),
+        )
 
-def find_command(command_key):
-    palette_formatter, command_key = re.search(r'(?:\{([^}]+)\})?(.+)', command_key).groups()
-    test_key = command_key.lower()
-    for key in Config.commands.keys():
-        if test_key in key.lower():
-            return key
-            return None
+    def score(self, start, end):
+        return (end - start) * self.SPAN_WEIGHT + start
 
-if Config.layout_file and Config.layout_file.exists():
-    with Config.layout_file.open() as fp:
-        for line_index, line in enumerate(fp):
-            line = line.strip()
-            # Skip commented out lines
-            button_row = []
-            if line:
-              if line[0] == '#':
-                continue
-              for item in line.split(','):
-                  command_key = find_command(item.strip())
-                  if command_key:
-                      button_row.append(item.strip())
-                  else:
-                      exit(f"""could not find command key: {item.strip()}""")
-            BUTTON_ROWS.append(button_row)
+    def score_key(self, lowered_key, query):
+        # The same leftmost-first match as extend(), for a single key
+        start = end = 0
+        for index, character in enumerate(query):
+            found = lowered_key.find(character, end)
+            if found == -1:
+                return None
+            if index == 0:
+                start = found
+            end = found + 1
+        return self.score(start, end)
 
-if not BUTTON_ROWS:
-    BUTTON_ROWS.append(Config.commands.keys())
+    def best(self, step, limit):
+        query, starts, ends, count = step
+        wanted = min(limit, count)
+        if not query:
+            return {position: 0 for position in range(wanted)}
+        ranked = {}
+        span = len(query)
+        while len(ranked) < wanted and span <= self.width:
+            for start in range(self.width - span + 1):
+                found = starts[start] & ends[start + span]
+                while found and len(ranked) < wanted:
+                    lowest = found & -found
+                    ranked[lowest.bit_length() - 1] = self.score(start, start + span)
+                    found ^= lowest
+            span += 1
+        return ranked
 
-def show_or_exit(key):
-    if key in ('q', 'Q', 'esc'):
-        raise urwid.ExitMainLoop()
+    def top(self, query, limit):
+        if (query.lower(), limit) in self.ranked:
+            return self.ranked[(query.lower(), limit)]
+        step = self.match(query)
+        query, count = step[0], step[3]
+        ranked = self.best(step, limit)
+        for rank, key in enumerate(self.recent):
+            score = self.score_key(self.lowered_keys[self.positions[key]], query)
+            if score is not None:
+                ranked[self.positions[key]] = score - (rank + 1) * self.SPAN_WEIGHT
+        best = sorted(ranked, key=lambda position: (ranked[position], position))[:limit]
+        if len(self.ranked) >= self.RANKED_CACHE_SIZE:
+            self.ranked.clear()
+        result = self.ranked[(query, limit)] = (count, [self.keys[position] for position in best])
+        return result
+
+def parse_layout_item(item):
+    return re.search(r'(?:\{([^}]+)\})?(.+)', item).groups()
+
+def find_command(command_key):
+    palette_formatter, command_key = parse_layout_item(command_key)
+    if getattr(Config, 'command_index', None) is None:
+        Config.command_index = CommandIndex(Config.commands)
+    return Config.command_index.find(command_key)
+
+def resolve_layout_item(item):
+    resolved = Config.resolved_layout_items.get(item)
+    if resolved is None:
+        palette_formatter, _ = parse_layout_item(item)
+        resolved = Config.resolved_layout_items[item] = (palette_formatter, find_command(item))
+    return resolved
 
 class Borders():
-    def __init__(self,):
+    def __init__(self, border_config=None):
+        if border_config is not None:
+            self.__dict__.update(border_config)
+            return
         default_border_config = {
             'top_vertical_padding_character': ' ',
             'bottom_vertical_padding_character': ' ',
@@ -153,79 +327,124 @@ class Borders():
             debug([key, getattr(self, key)])
 
     def top(self, center_width):
-        return self.top_left + (self.top_center * center_width) + self.top_right
+        return self.top_left + fill_to_width(self.top_center, center_width) + self.top_right
 
     def bottom(self, center_width):
-        return self.bottom_left + (self.bottom_center * center_width) + self.bottom_right
+        return self.bottom_left + fill_to_width(self.bottom_center, center_width) + self.bottom_right
 
     def top_vertical_padding(self, center_width):
-        return self.middle_left + (self.top_vertical_padding_character * center_width) + self.middle_right
+        return self.middle_left + fill_to_width(self.top_vertical_padding_character, center_width) + self.middle_right
 
     def bottom_vertical_padding(self, center_width):
-        return self.middle_left + (self.bottom_vertical_padding_character * center_width) + self.middle_right
+        return self.middle_left + fill_to_width(self.bottom_vertical_padding_character, center_width) + self.middle_right
 
-# Code based on https://stackoverflow.com/a/52262369 by Elias Dorneles, licensed as https://creativecommons.org/licenses/by-sa/4.0/, modified by Filip H.F. "FiXato" Slagter
-class BoxButton(urwid.WidgetWrap):
+# Compiled config/layout snapshots.
+# Importing the config module, parsing the layout and validating the palette and padding settings is repeated on every launch, while the result only changes when the config or layout file does.
+# compile_config() normalises all of that once; the result is pickled into the user's cache directory together with the mtime, size and hash of its source files (the config, the layout and the modules the config imported), and later launches load it instead of importing the config, as long as none of those files changed.
+# A config with values that can't be stored in the snapshot, e.g. a function it defines, is never cached, as loading it from the cache would leave those values out.
+COMPILED_CACHE_VERSION = 3
+# Attributes that are (re)created at runtime, rather than being part of the compiled snapshot
+RUNTIME_CONFIG_ATTRIBUTES = ('active_widget', 'dynamic_labels', 'borders', 'command_index', 'loop', 'supervisor', 'status_text', 'status_widget', 'output_pane', 'render_scheduler', 'reported_redraws_saved', 'pile', 'result_cache', 'grid', 'active_position', 'metrics', 'stats_widget', 'spool', 'daemon', 'attached', 'watcher', 'reloaded_sources', 'recent_commands', 'command_palette_index', 'macro_runs', 'output_pipeline', 'ansi_attributes', 'state_file')
 
-    def __init__(self, label, on_press=None, user_data=None, width=None, vertical_padding=None, horizontal_padding=None, alignment=None):
-        borders = Borders()
-        number_of_wide_chars = len([char for char in list(label) if unicodedata.east_asian_width(char) == 'W'])
-        if horizontal_padding == None:
-            horizontal_padding = 'auto'
-        if not width:
-            horizontal_padding = [0, 0]
-        if horizontal_padding == 'auto':
-            label_length = len(label)
-            # Emoji tend to be wide characters, which screw up the padding and amount of border characters. A suggestion from Joe Ferndz at https://stackoverflow.com/a/63473262 fixes it for plain emoji, but compound ones such as a country flag (e.g.: 🇳🇱) still fail. Should have a look at counting graphemes instead perhaps (https://stackoverflow.com/questions/43146528/how-to-extract-all-the-emojis-from-text)
-            label_length += number_of_wide_chars
-            debug(label, 'label len', len(label), 'number_of_wide_chars', number_of_wide_chars, 'total label len', label_length)
-            half_width = (width - label_length - len(borders.middle_left) - len(borders.middle_right)) / 2
-            inner_padding_length = [ceil(half_width), floor(half_width)]
-        else:
-            inner_padding_length = horizontal_padding
+def is_plain_data(value):
+    if value is None or isinstance(value, (str, bytes, int, float, PurePath)):
+        return True
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(is_plain_data(item) for item in value)
+    if isinstance(value, dict):
+        return all(is_plain_data(key) and is_plain_data(item) for key, item in value.items())
+    return False
 
-        if isinstance(vertical_padding, int):
-            vertical_padding = [vertical_padding, vertical_padding]
-        elif isinstance(vertical_padding, list) and len(vertical_padding) == 2 and isinstance(vertical_padding[0], int) and isinstance(vertical_padding[1], int):
-            pass
-        else:
-            vertical_padding = [1, 1]
-        padded_label = f"""{borders.middle_padding_left_character * inner_padding_length[0]}{label}{borders.middle_padding_right_character * inner_padding_length[1]}"""
-        #cursor_position = len(border) + padding_size
+def source_fingerprint(path):
+    path = Path(path).resolve()
+    contents = path.read_bytes()
+    stat = path.stat()
+    return {'path': str(path), 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size, 'sha256': hashlib.sha256(contents).hexdigest()}
 
-        button_lines = []
-        button_width = len(borders.middle_left + padded_label + borders.middle_right)
-        center_width = len(padded_label) + number_of_wide_chars
-        debug('padded label len:', len(padded_label), 'button width:', button_width, 'max widget width:', width, 'inner pad len', inner_padding_length, 'center_width', center_width, 'nr of wide chars:', number_of_wide_chars)
-        button_lines.append(borders.top(center_width))
-        for _ in range(vertical_padding[0]):
-            button_lines.append(borders.top_vertical_padding(center_width))
-        button_lines.append(borders.middle_left + padded_label + borders.middle_right)
-        for _ in range(vertical_padding[1]):
-            button_lines.append(borders.bottom_vertical_padding(center_width))
-        button_lines.append(borders.bottom(center_width))
+def source_unchanged(fingerprint):
+    try:
+        stat = Path(fingerprint['path']).stat()
+        if stat.st_mtime_ns == fingerprint['mtime_ns'] and stat.st_size == fingerprint['size']:
+            return True
+        # The file was touched (e.g. by a checkout, or saved without changes); only its contents matter
+        return hashlib.sha256(Path(fingerprint['path']).read_bytes()).hexdigest() == fingerprint['sha256']
+    except OSError:
+        return False
 
-        self.widget = urwid.Pile([urwid.Text(button_line) for button_line in button_lines])
+def cache_directory():
+    return Path(getenv('XDG_CACHE_HOME') or Path.home() / '.cache') / 'tui_launcher'
 
-        self.widget = apply_markup(self.widget, 'button', 'focused_button')
+def compiled_cache_path(config_source, layout_override):
+    # The default and relative layout files are found from the current directory
+    cache_key = hashlib.sha256(f"""{config_source}\0{layout_override}\0{Path.cwd()}""".encode('utf-8')).hexdigest()[:16]
+    return cache_directory() / f"""compiled-{cache_key}.pickle"""
 
-        # here is a lil hack: use a hidden button for evt handling
-        self._hidden_btn = urwid.Button('%s' % label, on_press, user_data)
-        self._hidden_btn.wgt = self.widget
+def load_compiled_config(cache_path, module_name):
+    try:
+        with cache_path.open('rb') as fp:
+            snapshot = pickle.load(fp)
+        if snapshot['version'] != COMPILED_CACHE_VERSION or not all(source_unchanged(fingerprint) for fingerprint in snapshot['sources']):
+            return None
+    except FileNotFoundError:
+        return None
+    except Exception as inst:
+        # A corrupt or incompatible cache should never prevent the launcher from starting
+        logger.warning(format_exception(f"""Ignoring compiled config cache {cache_path}""", inst))
+        return None
+    config = ModuleType(module_name)
+    config.__file__ = snapshot['sources'][0]['path']
+    config.__dict__.update(snapshot['config'])
+    config.borders = Borders(snapshot['borders'])
+    BUTTON_ROWS.extend(snapshot['button_rows'])
+    warnings.extend(snapshot['warnings'])
+    return config
 
-        super(BoxButton, self).__init__(self.widget)
-        self.original_label = label
+def is_imported_name(value):
+    # Modules, classes and functions that the config imported, such as Path, rather than defined
+    return isinstance(value, ModuleType) or (isinstance(value, (type, FunctionType, BuiltinFunctionType)) and value.__module__ != Config.__name__)
 
-    def selectable(self):
-        return True
+def compiled_config_values():
+    values = {}
+    dropped = []
+    for name, value in vars(Config).items():
+        if name.startswith('_') or name in RUNTIME_CONFIG_ATTRIBUTES:
+            continue
+        if is_plain_data(value):
+            values[name] = value
+        elif not is_imported_name(value):
+            dropped.append(name)
+    return values, dropped
 
-    def keypress(self, *args, **kw):
-        return self._hidden_btn.keypress(*args, **kw)
+def imported_sources(modules_before):
+    # The source files of the modules that were imported along with the config, e.g. a module of shared commands
+    paths = {Path(module.__file__).resolve() for name, module in list(sys.modules.items()) if name not in modules_before and name != Config.__name__ and str(getattr(module, '__file__', None)).endswith('.py')}
+    return [source_fingerprint(path) for path in sorted(paths)]
 
-    def mouse_event(self, *args, **kw):
-        return self._hidden_btn.mouse_event(*args, **kw)
+def write_compiled_config(cache_path, sources, compile_warnings):
+    values, dropped = compiled_config_values()
+    if dropped:
+        logger.warning(f"""Not writing compiled config cache {cache_path}: these config values can't be stored in it: {', '.join(dropped)}""")
+        return False
+    snapshot = {
+        'version': COMPILED_CACHE_VERSION,
+        'sources': sources,
+        'config': values,
+        'borders': vars(Config.borders),
+        'button_rows': BUTTON_ROWS,
+        'warnings': compile_warnings,
+    }
+    temp_path = cache_path.with_name(f"""{cache_path.name}.{getpid()}.tmp""")
+    try:
+        cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with temp_path.open('wb') as fp:
+            pickle.dump(snapshot, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        replace_file(temp_path, cache_path)
+    except OSError as inst:
+        logger.warning(format_exception(f"""Could not write compiled config cache {cache_path}""", inst))
+        return False
+    return True
 
-def build_box_button(text, onclick, widget_width):
+def validate_padding():
     default_vertical_padding = [0, 0]
     default_horizontal_padding = 'auto'
     if 'VERTICAL_PADDING' not in Config.__dict__:
@@ -236,7 +455,9 @@ def build_box_button(text, onclick, widget_width):
         warn(f"""'HORIZONTAL_PADDING' not specified in your config. Defaulting to {repr(default_horizontal_padding)}. To remove this warning, add the following to your {config_path}:\nHORIZONTAL_PADDING = {repr(default_horizontal_padding)} # How much padding do you want to the left and right of your button label? Set to: 'auto' to equally distribute across the full width, 0 or False (without quotes) for a compact view without padding, or a pair of integers to define the left and right amount of padding (e.g. [5, 2] for 5 padding on the left and 2 on the right)""")
         Config.HORIZONTAL_PADDING = default_horizontal_padding
 
-    if isinstance(Config.HORIZONTAL_PADDING, int):
+    if not Config.HORIZONTAL_PADDING:
+        Config.HORIZONTAL_PADDING = [0, 0]
+    elif isinstance(Config.HORIZONTAL_PADDING, int):
         Config.HORIZONTAL_PADDING = [Config.HORIZONTAL_PADDING, Config.HORIZONTAL_PADDING]
     elif Config.HORIZONTAL_PADDING == 'auto' or (isinstance(Config.HORIZONTAL_PADDING, list) and len(Config.HORIZONTAL_PADDING) == 2 and isinstance(Config.HORIZONTAL_PADDING[0], int) and isinstance(Config.HORIZONTAL_PADDING[1], int)):
         pass
@@ -244,154 +465,4029 @@ def build_box_button(text, onclick, widget_width):
         warn(f"""HORIZONTAL_PADDING ({repr(Config.HORIZONTAL_PADDING)}) is not a valid value. Using default of {repr(default_horizontal_padding)}. Please update your {config_path} config:\nHORIZONTAL_PADDING = {repr(default_horizontal_padding)}""")
         Config.HORIZONTAL_PADDING = default_horizontal_padding
 
-    return BoxButton(text, on_press=onclick, width=widget_width, vertical_padding=Config.VERTICAL_PADDING, horizontal_padding=Config.HORIZONTAL_PADDING)
+def is_macro(command_key):
+    return isinstance(Config.commands.get(command_key), dict)
 
-def calculate_widget_width(index, item_count):
-  if not TERM_WIDTH:
-    return None
-  width = int(TERM_WIDTH) / (1.0 * item_count)
+def validate_macros():
+    for macro_key, macro in Config.commands.items():
+        if not isinstance(macro, dict):
+            continue
+        steps = macro.get('steps')
+        if not isinstance(steps, dict) or not steps:
+            exit(f"""macro {macro_key} needs a dict of 'steps', mapping command keys to the command keys they depend on""")
+        for step, dependencies in steps.items():
+            if not isinstance(Config.commands.get(step), (str, list)):
+                exit(f"""macro {macro_key} has a step that is not a command: {step}""")
+            if not isinstance(dependencies, (list, tuple)):
+                exit(f"""macro {macro_key}: the dependencies of step {step} should be a list of command keys""")
+            for dependency in dependencies:
+                if dependency not in steps:
+                    exit(f"""macro {macro_key}: step {step} depends on {dependency}, which is not one of its steps""")
+        if macro.get('on_failure', 'stop') not in ('stop', 'continue'):
+            exit(f"""macro {macro_key}: 'on_failure' should be 'stop' or 'continue', not {repr(macro['on_failure'])}""")
+        parallelism = macro.get('parallelism', getattr(Config, 'MACRO_PARALLELISM', 4))
+        if not isinstance(parallelism, int) or parallelism < 1:
+            exit(f"""macro {macro_key}: 'parallelism' should be a positive number, not {repr(parallelism)}""")
+        # Peel off the steps without (remaining) dependencies; whatever is left depends on itself
+        remaining = {step: set(dependencies) for step, dependencies in steps.items()}
+        while remaining:
+            ready = [step for step, dependencies in remaining.items() if not dependencies]
+            if not ready:
+                exit(f"""macro {macro_key} has a dependency cycle between: {', '.join(remaining)}""")
+            for step in ready:
+                del remaining[step]
+            for dependencies in remaining.values():
+                dependencies.difference_update(ready)
 
-  if index == 0: #FIXME: This should be ceil, but with 3 items it's still breaking the layout with HORIZONTAL_PADDING='auto'...
-      return floor(width)
-  else:
-      return floor(width)
+def validate_command_input():
+    for command_key, input_key in getattr(Config, 'COMMAND_INPUT', {}).items():
+        for key in (command_key, input_key):
+            if not isinstance(Config.commands.get(key), (str, list)):
+                exit(f"""COMMAND_INPUT: {key} is not a command""")
+        # Following the inputs from here should never lead back to this command
+        seen = {command_key}
+        while input_key in Config.COMMAND_INPUT:
+            if input_key in seen:
+                exit(f"""COMMAND_INPUT has a cycle through {command_key}""")
+            seen.add(input_key)
+            input_key = Config.COMMAND_INPUT[input_key]
 
-def append_output_widget(widget, label, input_text):
-    lines = [line.strip() for line in widget.text.splitlines() if line.strip()]
-    input_lines = input_text.decode('utf-8').splitlines()
-    input_lines = [f"""[{label}] {line.strip()}""" for line in input_lines if line.strip()]
-    new_text = '\n'.join((lines + input_lines)[-10:])
-    widget.set_text(new_text)
+# Display widths of labels, measured per grapheme cluster instead of per code point, so flags, ZWJ sequences, keycaps, emoji with a skin tone and Indic conjuncts are padded and bordered with the number of columns a terminal draws them in.
+# Every code point is classified once into a table of ranges holding its cluster kind and its width on its own. The table is pickled into the user's cache directory per Unicode version, so later launches load it instead of building it again.
+WIDTH_TABLE_VERSION = 1
+WIDTH_TABLE_CODE_POINTS = (range(0, 0x40000), range(0xE0000, 0xE1000))
+(CLUSTER_OTHER, CLUSTER_EXTEND, CLUSTER_ZWJ, CLUSTER_VS16, CLUSTER_SPACING_MARK, CLUSTER_VIRAMA, CLUSTER_LETTER, CLUSTER_REGIONAL, CLUSTER_PICTOGRAPHIC, CLUSTER_CONTROL, CLUSTER_MODIFIER) = range(11)
+# Kinds that are always drawn as part of the cluster before them
+CLUSTER_JOINERS = frozenset([CLUSTER_EXTEND, CLUSTER_ZWJ, CLUSTER_VS16, CLUSTER_SPACING_MARK, CLUSTER_VIRAMA, CLUSTER_MODIFIER])
+INDIC_SCRIPTS = range(0x0900, 0x0E00)
 
-def refresh_widget(widget, input_text):
-    input_lines = input_text.decode('utf-8').splitlines()
-    new_text = '\n'.join((input_lines)[-10:])
-    widget.set_text(new_text)
+def classify_code_point(code_point):
+    character = chr(code_point)
+    category = unicodedata.category(character)
+    width = 2 if unicodedata.east_asian_width(character) in ('W', 'F') else 1
+    if category == 'Cc':
+        return CLUSTER_CONTROL, 0
+    if code_point == 0x200D:
+        return CLUSTER_ZWJ, 0
+    if code_point == 0xFE0F:
+        return CLUSTER_VS16, 0
+    if 0x1F3FB <= code_point <= 0x1F3FF:
+        return CLUSTER_MODIFIER, 2
+    if 0x1F1E6 <= code_point <= 0x1F1FF:
+        return CLUSTER_REGIONAL, 2
+    if code_point in INDIC_SCRIPTS and unicodedata.combining(character) == 9:
+        return CLUSTER_VIRAMA, 0
+    # Hangul vowel and trailing consonant jamo combine with the leading consonant before them
+    if category in ('Mn', 'Me') or (category == 'Cf' and code_point != 0xAD) or 0x1160 <= code_point <= 0x11FF or 0xD7B0 <= code_point <= 0xD7FF:
+        return CLUSTER_EXTEND, 0
+    if category == 'Mc':
+        return CLUSTER_SPACING_MARK, 1
+    if category == 'Lo' and code_point in INDIC_SCRIPTS:
+        return CLUSTER_LETTER, width
+    if category == 'So':
+        return CLUSTER_PICTOGRAPHIC, width
+    return CLUSTER_OTHER, width
 
-def handle_click(status_widget, command_output_widget, clicked_widget):
-    cmd = Config.commands[clicked_widget.label]
-    status_widget.set_text(f"""Last clicked: {clicked_widget.label}""")
-    if 'activated_button' in Config.palette_keys:
-        if Config.active_widget:
-            Config.active_widget.wgt.set_focus_map({None: 'focused_button'})
-        clicked_widget.wgt.set_focus_map({None: 'activated_button'})
-    else:
-        warn("'activated_button' is missing from the PALETTE in your config.")
-    Config.active_widget = clicked_widget
+def build_width_table():
+    starts = []
+    classes = []
+    for code_points in WIDTH_TABLE_CODE_POINTS:
+        for code_point in code_points:
+            kind, width = classify_code_point(code_point)
+            value = kind * 3 + width
+            if not classes or classes[-1] != value:
+                starts.append(code_point)
+                classes.append(value)
+        # Everything past the classified planes is a narrow character on its own
+        starts.append(code_points.stop)
+        classes.append(CLUSTER_OTHER * 3 + 1)
+    return starts, classes
+
+def width_table_path():
+    return cache_directory() / f"""widths-{unicodedata.unidata_version}-v{WIDTH_TABLE_VERSION}.pickle"""
 
+@functools.lru_cache(maxsize=None)
+def load_width_table():
+    table_path = width_table_path()
     try:
-        dummy_stdin, _ = pipe()
-        callback = functools.partial(append_output_widget, command_output_widget, clicked_widget.label)
-        stdout = Config.loop.watch_pipe(callback)
-        stderr = Config.loop.watch_pipe(callback)
-        use_shell = (True if isinstance(cmd, str) else False)
-        process = subprocess.Popen(cmd, stdin=dummy_stdin, stdout=stdout, stderr=stderr, shell=use_shell)
+        with table_path.open('rb') as fp:
+            return pickle.load(fp)
+    except FileNotFoundError:
+        pass
     except Exception as inst:
-        logger.error(format_exception(f"""Error handling click:""", inst))
+        logger.warning(format_exception(f"""Ignoring width table cache {table_path}""", inst))
+    table = build_width_table()
+    temp_path = table_path.with_name(f"""{table_path.name}.{getpid()}.tmp""")
+    try:
+        table_path.parent.mkdir(parents=True, exist_ok=True)
+        with temp_path.open('wb') as fp:
+            pickle.dump(table, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        replace_file(temp_path, table_path)
+    except OSError as inst:
+        logger.warning(format_exception(f"""Could not write width table cache {table_path}""", inst))
+    return table
 
-def create_column_item(text, onclick, widget_width):
-    #print(text)
-    palette_formatter, text = re.search(r'(?:\{([^}]+)\})?(.+)', text).groups()
-    #print(palette_formatter, text, "\n")
-    if not palette_formatter:
-      palette_formatter = 'dynamic_label'
-    if text.endswith('_dynamic_label'):
-        label_widget = apply_markup(urwid.Text(text), palette_formatter)
-        cmd_key = find_command(text)
-        cmd = Config.dynamic_labels[text] = {'cmd': Config.commands[cmd_key] if cmd_key else None, 'widget': label_widget, 'label_text': text}
-        return label_widget
+@functools.lru_cache(maxsize=4096)
+def character_class(character):
+    starts, classes = load_width_table()
+    return divmod(classes[bisect_right(starts, ord(character)) - 1], 3)
+
+# Yields the end and the width of each grapheme cluster in text
+def grapheme_clusters(text):
+    previous_kind = None
+    regional_pending = False
+    cluster_width = 0
+    for index, character in enumerate(text):
+        kind, width = character_class(character)
+        if previous_kind is not None and previous_kind != CLUSTER_CONTROL and kind != CLUSTER_CONTROL:
+            if kind in CLUSTER_JOINERS:
+                if kind == CLUSTER_SPACING_MARK and cluster_width < 2:
+                    cluster_width += 1
+                elif kind in (CLUSTER_VS16, CLUSTER_MODIFIER):
+                    # Emoji presentation, e.g. a keycap, or ☝ with a skin tone
+                    cluster_width = max(cluster_width, 2)
+                previous_kind = kind
+                continue
+            if previous_kind == CLUSTER_ZWJ and kind == CLUSTER_PICTOGRAPHIC:
+                previous_kind = kind
+                continue
+            if previous_kind == CLUSTER_VIRAMA and kind == CLUSTER_LETTER:
+                cluster_width += width
+                previous_kind = kind
+                continue
+            if regional_pending and kind == CLUSTER_REGIONAL:
+                regional_pending = False
+                cluster_width = 2
+                previous_kind = kind
+                continue
+            yield index, cluster_width
+        elif previous_kind is not None:
+            yield index, cluster_width
+        regional_pending = kind == CLUSTER_REGIONAL
+        cluster_width = width
+        previous_kind = kind
+    if previous_kind is not None:
+        yield len(text), cluster_width
 
-    return build_box_button(find_command(text), onclick, widget_width)
+@functools.lru_cache(maxsize=16384)
+def display_width(text):
+    if text.isascii() and text.isprintable():
+        return len(text)
+    return sum(width for _, width in grapheme_clusters(text))
 
-def apply_markup(widget, markup_name, focus_markup_name=None):
-    if not markup_name in Config.palette_keys:
-        warn(f"""'{markup_name}' is missing from the PALETTE in your config.""")
-    if focus_markup_name and (focus_markup_name not in Config.palette_keys):
-        warn(f"""'{focus_markup_name}' is missing from the PALETTE in your config.""")
-    return urwid.AttrMap(widget, markup_name, focus_markup_name)
+# Cuts text down to at most max_width columns without splitting a grapheme cluster; returns the text and its width
+def truncate_to_width(text, max_width):
+    end = 0
+    total_width = 0
+    for cluster_end, width in grapheme_clusters(text):
+        if total_width + width > max_width:
+            break
+        end = cluster_end
+        total_width += width
+    return text[:end], total_width
 
-if __name__ == '__main__':
-    # CHANGEME: Change these button labels and their commands to do what you want them to say and do.
-    # I use echo commands just for testing, as I don't control my media player via cli, so I don't know what you want to call. ;)
-    # just replace the "echo "playing" >> commands.log" part between the single quotes with the play command you use.
-    if args.header_text and args.header_text[0]:
-      header_text = args.header_text[0]
+# Repeats character until it fills width columns, e.g. for a wide border or padding character
+def fill_to_width(character, width):
+    character_width = display_width(character)
+    if character_width <= 1:
+        return character * width
+    return character * (width // character_width) + ' ' * (width % character_width)
+
+def calculate_column_width(label):
+    if Config.HORIZONTAL_PADDING == 'auto':
+        return None
+    col_width = display_width(label) + display_width(Config.borders.middle_left) + display_width(Config.borders.middle_right)
+    col_width += Config.HORIZONTAL_PADDING[0] * display_width(Config.borders.middle_padding_left_character)
+    col_width += Config.HORIZONTAL_PADDING[1] * display_width(Config.borders.middle_padding_right_character)
+    return col_width
+
+def compile_config():
+    # backwards compatibility hack as I want to rename the 'highlight' palette key to 'focused_button'
+    Config.palette_keys = [key for (key, fg, bg) in Config.PALETTE]
+    if 'focused_button' not in Config.palette_keys:
+        if 'highlight' not in Config.palette_keys:
+            warn("PALETTE in your config is missing a 'focused_button' markup item")
+        else:
+            warn("PALETTE in your config is missing a 'focused_button' markup item, but has the deprecated 'highlight' item; we'll use that, but please update your config to rename 'highlight' to 'focused_button'")
+            highlight_item = [item for item in Config.PALETTE if item[0] == 'highlight'][0]
+            Config.PALETTE.append(('focused_button', highlight_item[1], highlight_item[2]))
+            Config.palette_keys.append('focused_button')
+
+    if 'button' not in Config.palette_keys:
+        warn("'button' is missing from the PALETTE in your config.")
+    validate_padding()
+    validate_macros()
+    validate_command_input()
+    Config.borders = Borders()
+    Config.resolved_layout_items = {}
+
+    if Config.layout_file and Config.layout_file.exists():
+        with Config.layout_file.open() as fp:
+            for line_index, line in enumerate(fp):
+                line = line.strip()
+                # Skip commented out lines
+                button_row = []
+                if line:
+                  if line[0] == '#':
+                    continue
+                  for item in line.split(','):
+                      palette_formatter, command_key = resolve_layout_item(item.strip())
+                      if command_key:
+                          button_row.append(item.strip())
+                      else:
+                          exit(f"""could not find command key: {item.strip()}""")
+                BUTTON_ROWS.append(button_row)
+
+    if not BUTTON_ROWS:
+        BUTTON_ROWS.append(list(Config.commands.keys()))
+
+    for button_row in BUTTON_ROWS:
+        for item in button_row:
+            palette_formatter, command_key = resolve_layout_item(item)
+            if palette_formatter and palette_formatter not in Config.palette_keys:
+                warn(f"""'{palette_formatter}' is missing from the PALETTE in your config.""")
+    Config.column_widths = {item: calculate_column_width(resolve_layout_item(item)[1]) for button_row in BUTTON_ROWS for item in button_row}
+
+def set_layout_file():
+    if layout_override:
+        Config.layout_file=layout_override
+    elif hasattr(Config, 'layout_file'):
+        pass
     else:
-      header_text = Config.HEADER_TEXT
+      Config.layout_file=Path('layout.txt')
 
-    if args.footer_text and args.footer_text[0]:
-      footer_text = args.footer_text[0]
+    if Config.layout_file and not Config.layout_file.exists():
+        exit(f"""Config file {str(Config.layout_file)} does not exist""")
+    if Config.layout_file:
+        # The compiled snapshot can be loaded from another directory
+        Config.layout_file = Path(Config.layout_file).resolve()
+
+config_path = Path('default.py')
+if args.config_file and args.config_file[0]:
+    config_path=Path(args.config_file[0])
+    try:
+        relative_config_path = config_path.resolve().relative_to(Path('.').resolve())
+        if relative_config_path.exists():
+            module_name = relative_config_path.with_suffix('').as_posix().replace('/', '.')
+            config_source = relative_config_path.resolve()
+        else:
+            exit(f"""Could not find config at: {relative_config_path}""")
+    except Exception as inst:
+        error(format_exception(f"""Error loading config: {args.config_file[0]}""", inst))
+
+        exit("error while loading config. Perhaps the config is not relative to the current path?")
+else:
+    module_name = 'configs.default'
+    config_source = Path(__file__).resolve().parent / 'configs' / 'default.py'
+
+layout_override = Path(args.layout_file[0]) if args.layout_file and args.layout_file[0] else None
+BUTTON_ROWS = []
+cache_path = compiled_cache_path(config_source, layout_override and layout_override.resolve())
+Config = None if args.no_cache else load_compiled_config(cache_path, module_name)
+if Config is None:
+    sources = [source_fingerprint(config_source)]
+    modules_before = set(sys.modules)
+    try:
+        #print(f"""Loading module from {module_name}""")
+        Config = import_module(module_name)
+    except Exception as inst:
+        error(format_exception(f"""Error loading config: {config_path}""", inst))
+
+        exit("error while loading config. Perhaps the config is not relative to the current path?")
+
+    sources.extend(imported_sources(modules_before))
+    set_layout_file()
+    if Config.layout_file:
+        sources.append(source_fingerprint(Config.layout_file))
+
+    compile_warnings_start = len(warnings)
+    compile_config()
+    if not args.no_cache and getattr(Config, 'COMPILE_CACHE', True):
+        write_compiled_config(cache_path, sources, warnings[compile_warnings_start:])
+
+def init_runtime_state():
+    Config.active_widget = None
+    Config.active_position = None
+    Config.grid = None
+    Config.supervisor = None
+    Config.output_pane = None
+    Config.render_scheduler = None
+    Config.result_cache = None
+    Config.metrics = None
+    Config.stats_widget = None
+    Config.spool = None
+    Config.daemon = None
+    Config.attached = None
+    Config.watcher = None
+    Config.reloaded_sources = None
+    Config.recent_commands = OrderedDict()
+    Config.command_palette_index = None
+    Config.macro_runs = {}
+    Config.output_pipeline = None
+    Config.ansi_attributes = set()
+    Config.state_file = None
+    Config.reported_redraws_saved = 0
+    Config.status_text = ''
+    if not hasattr(Config, 'dynamic_labels'):
+      Config.dynamic_labels={}
+
+init_runtime_state()
+
+
+def show_or_exit(key):
+    if key in ('q', 'Q', 'esc'):
+        raise urwid.ExitMainLoop()
+    if key == getattr(Config, 'CANCEL_KEY', 'c'):
+        cancel_focused_command()
+    if key == getattr(Config, 'STATS_KEY', 's'):
+        toggle_stats()
+    if key == getattr(Config, 'OPEN_SPOOL_KEY', 'o'):
+        open_spool_pager()
+    if key == getattr(Config, 'COMMAND_PALETTE_KEY', '/'):
+        open_command_palette()
+    # The button grid handles page up/down and home/end itself, so the output pane scrolls with the bracket keys
+    if Config.output_pane:
+        if key == '[':
+            Config.output_pane.scroll(Config.output_pane.visible_lines)
+        elif key == ']':
+            Config.output_pane.scroll(-Config.output_pane.visible_lines)
+        elif key == '{':
+            Config.output_pane.scroll(Config.output_pane.max_scroll_offset())
+        elif key == '}':
+            Config.output_pane.scroll(-Config.output_pane.max_scroll_offset())
+        elif key == getattr(Config, 'OUTPUT_FILTER_KEY', 'f'):
+            toggle_output_filter()
+
+def build_button_lines(label, width, vertical_padding, horizontal_padding, borders):
+    label_width = display_width(label)
+    if horizontal_padding == 'auto':
+        half_width = max((width - label_width - display_width(borders.middle_left) - display_width(borders.middle_right)) / 2, 0)
+        padding_left_width, padding_right_width = ceil(half_width), floor(half_width)
     else:
-      footer_text = Config.FOOTER_TEXT
-    if not 'HORIZONTAL_PADDING' in Config.__dict__:
-        warn(f"""'HORIZONTAL_PADDING' not specified in your config. Defaulting to 'auto'. To remove this warning, add the following to your {config_path}:\nHORIZONTAL_PADDING = 'auto' # How much padding do you want to the left and right of your button label? Set to: 'auto' to equally distribute across the full width, 0 or False (without quotes) for a compact view without padding, or a pair of integers to define the left and right amount of padding (e.g. [5, 2] for 5 padding on the left and 2 on the right)""")
-        Config.HORIZONTAL_PADDING = 'auto'
+        padding_left_width = horizontal_padding[0] * display_width(borders.middle_padding_left_character)
+        padding_right_width = horizontal_padding[1] * display_width(borders.middle_padding_right_character)
+    padded_label = f"""{fill_to_width(borders.middle_padding_left_character, padding_left_width)}{label}{fill_to_width(borders.middle_padding_right_character, padding_right_width)}"""
 
-    header = apply_markup(urwid.Text(header_text), 'header')
-    footer = apply_markup(urwid.Text(footer_text), 'footer')
-    status_widget = apply_markup(urwid.Text(''), 'status_line')
-    command_output = apply_markup(urwid.Text(''), 'command_output')
-    onclick = lambda widget: (
-      handle_click(
-        status_widget=status_widget.original_widget,
-        command_output_widget=command_output.original_widget,
-        clicked_widget=widget
-      )
-    )
-    displayed_widgets = []
+    button_lines = []
+    center_width = padding_left_width + label_width + padding_right_width
+    debug('label width:', label_width, 'max widget width:', width, 'padding widths', padding_left_width, padding_right_width, 'center_width', center_width)
+    button_lines.append(borders.top(center_width))
+    for _ in range(vertical_padding[0]):
+        button_lines.append(borders.top_vertical_padding(center_width))
+    button_lines.append(borders.middle_left + padded_label + borders.middle_right)
+    for _ in range(vertical_padding[1]):
+        button_lines.append(borders.bottom_vertical_padding(center_width))
+    button_lines.append(borders.bottom(center_width))
+    return button_lines
 
-    if args.header_text or not Config.HIDE_HEADER:
-        displayed_widgets.append(header)
+def build_button_canvas(button_lines, attr, maxcol):
+    text = []
+    attrs = []
+    for line in button_lines:
+        line_width = display_width(line)
+        if line_width > maxcol:
+            line, line_width = truncate_to_width(line, maxcol)
+        encoded_line = (line + ' ' * (maxcol - line_width)).encode('utf-8')
+        text.append(encoded_line)
+        attrs.append([(attr, len(encoded_line))])
+    return urwid.TextCanvas(text, attrs, maxcol=maxcol)
 
-    for button_row in BUTTON_ROWS:
-        columns = urwid.Columns([])
-        for index, text in enumerate(button_row):
-            label = find_command(text)
-            number_of_wide_chars = len([char for char in list(label) if unicodedata.east_asian_width(char) == 'W'])
-            col_width = (len(label) + 2 + number_of_wide_chars)
-            if Config.HORIZONTAL_PADDING == 'auto':
-                col_opts = columns.options('weight', 1)
+# Code based on https://stackoverflow.com/a/52262369 by Elias Dorneles, licensed as https://creativecommons.org/licenses/by-sa/4.0/, modified by Filip H.F. "FiXato" Slagter
+# A single widget that renders its bordered box straight to a canvas, instead of a Pile of Text widgets with a hidden Button on top for the event handling.
+# Canvases are memoized on (label, width, padding, border set, attribute, columns), so identical buttons and repeated renders of a button share a single canvas.
+# Without a fixed width, 'auto' padding centres the label in the columns the button is rendered at, so the grid reflows when the terminal is resized; rows whose column widths stay the same are served from the memoized canvases.
+# The on_press callback is called directly, rather than connected to the 'click' signal, which would give every button a dict of handlers of its own.
+class BoxButton(urwid.Widget):
+    _selectable = True
+    _sizing = frozenset([urwid.FLOW])
+    signals = ['click']
+    CANVAS_CACHE_SIZE = 4096
+    canvases = {}
+
+    def __init__(self, label, on_press=None, user_data=None, width=None, vertical_padding=None, horizontal_padding=None, alignment=None):
+        super().__init__()
+        if horizontal_padding == None:
+            horizontal_padding = 'auto'
+
+        if isinstance(vertical_padding, int):
+            vertical_padding = [vertical_padding, vertical_padding]
+        elif isinstance(vertical_padding, list) and len(vertical_padding) == 2 and isinstance(vertical_padding[0], int) and isinstance(vertical_padding[1], int):
+            pass
+        else:
+            vertical_padding = [1, 1]
+
+        self.label = label
+        self.width = width
+        self.vertical_padding = tuple(vertical_padding)
+        self.horizontal_padding = horizontal_padding if horizontal_padding == 'auto' else tuple(horizontal_padding)
+        self.attr = 'button'
+        self.focus_attr = 'focused_button'
+        self.position = None
+        self.on_press = on_press
+        self.user_data = user_data
+
+    def set_focus_attr(self, focus_attr):
+        self.focus_attr = focus_attr
+        self._invalidate()
+
+    def rows(self, size, focus=False):
+        return 3 + self.vertical_padding[0] + self.vertical_padding[1]
+
+    def render(self, size, focus=False):
+        (maxcol,) = size
+        attr = self.focus_attr if focus else self.attr
+        key = (self.label, self.width, self.vertical_padding, self.horizontal_padding, Config.borders, attr, maxcol)
+        canvas = BoxButton.canvases.get(key)
+        if canvas is None:
+            if len(BoxButton.canvases) >= self.CANVAS_CACHE_SIZE:
+                BoxButton.canvases.clear()
+            button_lines = build_button_lines(self.label, self.width or maxcol, self.vertical_padding, self.horizontal_padding, Config.borders)
+            canvas = BoxButton.canvases[key] = build_button_canvas(button_lines, attr, maxcol)
+        return canvas
+
+    def keypress(self, size, key):
+        if self._command_map[key] != urwid.ACTIVATE:
+            return key
+        self.click()
+        return None
+
+    def mouse_event(self, size, event, button, col, row, focus):
+        if button != 1 or not urwid.util.is_mouse_press(event):
+            return False
+        self.click()
+        return True
+
+    def click(self):
+        if self.on_press:
+            if self.user_data is None:
+                self.on_press(self)
             else:
-                if not Config.HORIZONTAL_PADDING:
-                    Config.HORIZONTAL_PADDING = [0, 0]
-                if isinstance(Config.HORIZONTAL_PADDING, int):
-                    Config.HORIZONTAL_PADDING = [Config.HORIZONTAL_PADDING, Config.HORIZONTAL_PADDING]
-                if Config.HORIZONTAL_PADDING:
-                    borders = Borders()
-                    col_width += Config.HORIZONTAL_PADDING[0] * len(borders.middle_padding_left_character)
-                    col_width += Config.HORIZONTAL_PADDING[1] * len(borders.middle_padding_right_character)
-                col_opts = columns.options('given', col_width)
-            debug('col opts', col_opts, 'col width', col_width, 'text', text, len(text), 'label', label)
-            columns.contents.append(
-                (create_column_item(label, onclick, calculate_widget_width(index, len(button_row))), col_opts)
-            )
-        displayed_widgets.append(columns)
+                self.on_press(self, self.user_data)
+        self._emit('click')
 
+def build_box_button(text, onclick):
+    return BoxButton(text, on_press=onclick, vertical_padding=Config.VERTICAL_PADDING, horizontal_padding=Config.HORIZONTAL_PADDING)
 
-    if not Config.HIDE_STATUS_LINE:
-        displayed_widgets.append(status_widget)
+# The stdin of a command: /dev/null, or an already unlinked temporary file with the output of its COMMAND_INPUT command, which is gone once the command has exited
+def input_file(input_data):
+    if input_data is None:
+        return subprocess.DEVNULL
+    stdin = tempfile.TemporaryFile()
+    stdin.write(input_data)
+    stdin.seek(0)
+    return stdin
 
-    if not Config.HIDE_COMMAND_OUTPUT:
-        displayed_widgets.append(command_output)
+# Owns every process the launcher spawns: stdin comes from /dev/null (or from input_file()), stdout and stderr are read through pipes that are unwatched and closed at EOF, and children are reaped as soon as a SIGCHLD arrives.
+# Spawning is refused when the global (MAX_PROCESSES) or per-command (MAX_PROCESSES_PER_COMMAND, PROCESS_LIMITS) concurrency limit has been reached.
+# A process that runs longer than its COMMAND_TIMEOUT (or COMMAND_TIMEOUTS entry), or that is cancelled, gets a SIGTERM, and a SIGKILL if it is still around KILL_GRACE seconds later.
+class SupervisedProcess():
+    def __init__(self, command_key, process, on_output, on_exit, requested_at=None):
+        self.command_key = command_key
+        self.process = process
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.watch_handles = {}
+        self.timeout_handle = None
+        self.kill_handle = None
+        self.task = None
+        self.stopped_by = None
+        self.requested_at = requested_at or time.monotonic()
+        self.started_at = time.monotonic() if process else None
+        self.first_output_at = None
+        self.output_bytes = {'stdout': 0, 'stderr': 0}
 
-    if args.footer_text or not Config.HIDE_FOOTER:
-        displayed_widgets.append(footer)
+    @property
+    def pid(self):
+        return self.process.pid if self.process else None
+
+    def output(self, data, stream):
+        if data:
+            if self.first_output_at is None:
+                self.first_output_at = time.monotonic()
+            self.output_bytes[stream] = self.output_bytes.get(stream, 0) + len(data)
+        self.on_output(data, stream)
+
+class ProcessSupervisor():
+    READ_SIZE = 8192
+    KILL_GRACE = 2
+
+    def __init__(self, event_loop, max_processes=None, max_processes_per_command=None, process_limits=None, command_timeout=None, command_timeouts=None, on_change=None, on_stop=None, metrics=None, shell_pool=None):
+        self.event_loop = event_loop
+        self.max_processes = max_processes
+        self.max_processes_per_command = max_processes_per_command
+        self.process_limits = process_limits or {}
+        self.command_timeout = command_timeout
+        self.command_timeouts = command_timeouts or {}
+        self.on_change = on_change
+        self.on_stop = on_stop
+        self.metrics = metrics
+        self.shell_pool = shell_pool
+        if shell_pool:
+            shell_pool.on_job_exit = self.reap
+        self.processes = {}
+        self.watch_children()
 
-    widget = urwid.Pile(displayed_widgets)
-    widget = urwid.Filler(widget, 'top')
-    Config.loop = urwid.MainLoop(widget, Config.PALETTE, unhandled_input=show_or_exit)
-    for label_key, dynamic_label in Config.dynamic_labels.items():
-        cmd = dynamic_label.get('cmd')
+    def watch_children(self):
+        self.wake_read, self.wake_write = pipe()
+        set_blocking(self.wake_read, False)
+        set_blocking(self.wake_write, False)
+        self.event_loop.watch_file(self.wake_read, self.reap)
+        signal.signal(signal.SIGCHLD, self.handle_sigchld)
+
+    def handle_sigchld(self, signum, frame):
+        # Only wake up the event loop here; the actual reaping happens in reap()
+        try:
+            os_write(self.wake_write, b'\0')
+        except BlockingIOError:
+            pass
+
+    def command_limit(self, command_key):
+        return self.process_limits.get(command_key, self.max_processes_per_command)
+
+    def timeout(self, command_key):
+        return self.command_timeouts.get(command_key, self.command_timeout)
+
+    def running(self, command_key=None):
+        return [entry for entry in self.processes.values() if command_key is None or entry.command_key == command_key]
+
+    def limit_reached(self, command_key):
+        if self.max_processes is not None and len(self.processes) >= self.max_processes:
+            return f"""{len(self.processes)} processes are already running (MAX_PROCESSES = {self.max_processes})"""
+        command_limit = self.command_limit(command_key)
+        if command_limit is not None and len(self.running(command_key)) >= command_limit:
+            return f"""{command_key} is already running {command_limit} time(s)"""
+        return None
+
+    def spawn(self, command_key, cmd, on_output, on_exit=None, input_data=None):
+        requested_at = time.monotonic()
+        # List-form commands, and commands with input, are always executed directly; other string commands go to a warm shell of the pool, if one is idle
+        pooled_job = self.shell_pool.run(cmd) if self.shell_pool and isinstance(cmd, str) and input_data is None else None
+        if pooled_job:
+            process, stdout_read, stderr_read = pooled_job
+        else:
+            process, stdout_read, stderr_read = self.popen(cmd, input_data)
+        entry = SupervisedProcess(command_key, process, on_output, on_exit, requested_at)
+        for fd, stream in ((stdout_read, 'stdout'), (stderr_read, 'stderr')):
+            entry.watch_handles[fd] = self.event_loop.watch_file(fd, functools.partial(self.read, entry, fd, stream))
+        timeout = self.timeout(command_key)
+        if timeout:
+            entry.timeout_handle = self.event_loop.alarm(timeout, functools.partial(self.stop, entry, 'timeout'))
+        self.processes[id(entry)] = entry
+        self.changed()
+        return entry
+
+    def popen(self, cmd, input_data=None):
+        stdout_read, stdout_write = pipe()
+        stderr_read, stderr_write = pipe()
+        stdin = input_file(input_data)
         try:
-            dummy_stdin, _ = pipe()
-            callback = functools.partial(refresh_widget, dynamic_label['widget'].original_widget)
-            stdout = Config.loop.watch_pipe(callback)
-            stderr = Config.loop.watch_pipe(callback)
             use_shell = (True if isinstance(cmd, str) else False)
-            process = subprocess.Popen(cmd, stdin=dummy_stdin, stdout=stdout, stderr=stderr, shell=use_shell)
+            # A session (and process group) of its own, so terminate() also reaches the children of a shell command
+            process = subprocess.Popen(cmd, stdin=stdin, stdout=stdout_write, stderr=stderr_write, shell=use_shell, start_new_session=True)
+        except Exception:
+            close(stdout_read)
+            close(stderr_read)
+            raise
+        finally:
+            # The child has its own copies now; keeping ours open would prevent EOF from ever arriving
+            close(stdout_write)
+            close(stderr_write)
+            if input_data is not None:
+                stdin.close()
+        return process, stdout_read, stderr_read
+
+    def read(self, entry, fd, stream):
+        try:
+            data = os_read(fd, self.READ_SIZE)
+        except OSError:
+            data = b''
+        # An empty chunk tells on_output that the stream has ended
+        entry.output(data, stream)
+        if data:
+            return
+        self.event_loop.remove_watch_file(entry.watch_handles.pop(fd))
+        close(fd)
+        if not entry.watch_handles:
+            self.finish(entry)
+
+    def reap(self):
+        try:
+            while os_read(self.wake_read, self.READ_SIZE):
+                pass
+        except BlockingIOError:
+            pass
+        if self.shell_pool:
+            self.shell_pool.reap()
+        for entry in list(self.processes.values()):
+            self.finish(entry)
+
+    def finish(self, entry):
+        # poll() reaps the child if it exited; it only counts as finished once its output has been fully read as well
+        if entry.process.poll() is None or entry.watch_handles or id(entry) not in self.processes:
+            return
+        del self.processes[id(entry)]
+        self.remove_alarms(entry)
+        if self.metrics:
+            self.metrics.record(entry, entry.process.returncode)
+        if entry.on_exit:
+            entry.on_exit(entry.process.returncode)
+        self.changed()
+
+    def remove_alarms(self, entry):
+        for handle in (entry.timeout_handle, entry.kill_handle):
+            if handle:
+                self.event_loop.remove_alarm(handle)
+        entry.timeout_handle = entry.kill_handle = None
+
+    def changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def table(self):
+        return ', '.join(f"""{entry.command_key} [{entry.pid or 'starting'}]""" for entry in self.processes.values())
+
+    def terminate(self, entry, signum=signal.SIGTERM):
+        if getattr(entry, 'process', None) is None or entry.process.poll() is not None:
+            return
+        try:
+            killpg(entry.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def stop(self, entry, reason):
+        entry.timeout_handle = None
+        if entry.stopped_by:
+            return
+        entry.stopped_by = reason
+        self.terminate(entry)
+        entry.kill_handle = self.event_loop.alarm(self.KILL_GRACE, functools.partial(self.terminate, entry, signal.SIGKILL))
+        if self.on_stop:
+            self.on_stop(entry)
+
+    def cancel(self, command_key):
+        entries = self.running(command_key)
+        for entry in entries:
+            self.stop(entry, 'cancelled')
+        return entries
+
+    def shutdown(self):
+        for entry in list(self.processes.values()):
+            self.terminate(entry)
+        if self.shell_pool:
+            self.shell_pool.shutdown()
+
+# A pool of SHELL_POOL_SIZE warm /bin/sh workers for string commands. A worker reads jobs from its control pipe and runs each one in a subshell, which only costs a fork of the already running shell instead of the fork and exec of a new one.
+# A job writes its stdout and stderr to FIFOs of its own, in a private directory, so its output reaches the supervisor just like that of a directly spawned process; the worker reports its exit status over its own stdout.
+# Workers are retired after SHELL_POOL_MAX_JOBS jobs, after a failed job and when they were stopped; replacements are started once the event loop is idle. When no worker is idle, commands are spawned directly.
+class ShellWorker():
+    def __init__(self, process):
+        self.process = process
+        self.jobs = 0
+        self.job = None
+        self.status = b''
+        self.watch_handle = None
+
+# Stands in for the Popen object of a pooled job: its pid is the worker's, whose process group is the one the job runs in.
+class PooledJob():
+    def __init__(self, worker, fifo_paths, writer_fds):
+        self.worker = worker
+        self.fifo_paths = fifo_paths
+        self.writer_fds = writer_fds
+        self.returncode = None
+
+    @property
+    def pid(self):
+        return self.worker.process.pid
+
+    def poll(self):
+        return self.returncode
+
+class ShellPool():
+    END_OF_JOB = '__tui_launcher_end_of_job__'
+    WORKER_SCRIPT = f"""job=
+while IFS= read -r line; do
+  if [ "$line" = {END_OF_JOB} ]; then
+    eval "$job"
+    job=
+  else
+    job="$job$line
+"
+  fi
+done"""
+
+    def __init__(self, event_loop, size, max_jobs=100, on_job_exit=None):
+        self.event_loop = event_loop
+        self.size = size
+        self.max_jobs = max_jobs
+        self.on_job_exit = on_job_exit
+        self.directory = Path(tempfile.mkdtemp(prefix='tui_launcher-'))
+        self.idle = []
+        self.retired = []
+        self.job_count = 0
+        self.refill_handle = None
+        self.refill()
+
+    def start_worker(self):
+        process = subprocess.Popen(['/bin/sh', '-c', self.WORKER_SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, start_new_session=True)
+        worker = ShellWorker(process)
+        set_blocking(process.stdout.fileno(), False)
+        worker.watch_handle = self.event_loop.watch_file(process.stdout.fileno(), functools.partial(self.read_status, worker))
+        self.idle.append(worker)
+
+    def refill(self):
+        self.refill_handle = None
+        while len(self.idle) < self.size:
+            self.start_worker()
+
+    def schedule_refill(self):
+        if self.refill_handle is None:
+            self.refill_handle = self.event_loop.alarm(0, self.refill)
+
+    def run(self, cmd):
+        if not self.idle:
+            return None
+        worker = self.idle.pop()
+        self.job_count += 1
+        fifo_paths = []
+        fds = []
+        try:
+            for stream in ('stdout', 'stderr'):
+                fifo_path = self.directory / f"""job-{self.job_count}.{stream}"""
+                mkfifo(fifo_path, 0o600)
+                fifo_paths.append(fifo_path)
+                fds.append(os_open(fifo_path, O_RDONLY | O_NONBLOCK))
+                # Held open until the job has exited, so reading can't hit EOF before the job has opened its end
+                fds.append(os_open(fifo_path, O_WRONLY | O_NONBLOCK))
+                set_blocking(fds[-2], True)
+            worker.process.stdin.write(f"""( eval {shlex_quote(cmd)} ) </dev/null >{shlex_quote(str(fifo_paths[0]))} 2>{shlex_quote(str(fifo_paths[1]))}\necho "exit $?"\n{self.END_OF_JOB}\n""".encode('utf-8'))
+            worker.process.stdin.flush()
+        except OSError as inst:
+            logger.warning(format_exception('Could not hand a job to a pooled shell', inst))
+            for fd in fds:
+                close(fd)
+            for fifo_path in fifo_paths:
+                fifo_path.unlink(missing_ok=True)
+            self.retire(worker)
+            return None
+        worker.jobs += 1
+        worker.job = PooledJob(worker, fifo_paths, fds[1::2])
+        return worker.job, fds[0], fds[2]
+
+    def read_status(self, worker):
+        try:
+            data = os_read(worker.process.stdout.fileno(), 4096)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if data:
+            worker.status += data
+            while b'\n' in worker.status:
+                line, _, worker.status = worker.status.partition(b'\n')
+                if line.startswith(b'exit ') and worker.job:
+                    self.job_finished(worker, int(line[5:]))
+            return
+        # The worker has gone, e.g. because its job was stopped
+        self.unwatch(worker)
+        if worker.job:
+            try:
+                returncode = worker.process.wait(timeout=1)
+            except subprocess.TimeoutExpired:
+                returncode = -1
+            self.job_finished(worker, returncode)
+        else:
+            self.retire(worker)
+
+    def job_finished(self, worker, returncode):
+        job = worker.job
+        worker.job = None
+        if returncode > 128:
+            # The shell reports a job that was killed by a signal as 128 + the signal number
+            returncode = 128 - returncode
+        job.returncode = returncode
+        for fd in job.writer_fds:
+            close(fd)
+        for fifo_path in job.fifo_paths:
+            fifo_path.unlink(missing_ok=True)
+        if returncode != 0 or worker.jobs >= self.max_jobs or worker.process.poll() is not None:
+            self.retire(worker)
+        else:
+            self.idle.append(worker)
+        if self.on_job_exit:
+            self.on_job_exit()
+
+    def unwatch(self, worker):
+        if worker.watch_handle is not None:
+            self.event_loop.remove_watch_file(worker.watch_handle)
+            worker.watch_handle = None
+            worker.process.stdout.close()
+
+    def retire(self, worker):
+        if worker in self.idle:
+            self.idle.remove(worker)
+        self.unwatch(worker)
+        try:
+            # The worker exits at the end of its control pipe
+            worker.process.stdin.close()
+        except OSError:
+            pass
+        self.retired.append(worker)
+        self.schedule_refill()
+
+    def reap(self):
+        self.retired = [worker for worker in self.retired if worker.process.poll() is None]
+
+    def shutdown(self):
+        self.size = 0
+        for worker in list(self.idle):
+            self.retire(worker)
+        for worker in self.retired:
+            try:
+                killpg(worker.process.pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+# Runs the commands as asyncio subprocesses on the event loop that urwid's MainLoop runs on (EVENT_LOOP = 'asyncio'), instead of watching a pipe per stream on urwid's select loop.
+# Every run is a task that reads both streams until EOF and awaits the exit of the process, within its timeout; cancelling the task stops the process.
+class AsyncioProcessSupervisor(ProcessSupervisor):
+    def __init__(self, asyncio_loop, event_loop, **kwargs):
+        self.asyncio_loop = asyncio_loop
+        self.redraw_pending = False
+        super(AsyncioProcessSupervisor, self).__init__(event_loop, **kwargs)
+
+    def watch_children(self):
+        # asyncio reaps its own children
+        pass
+
+    def redraw(self):
+        # Callbacks from tasks bypass the wrappers of urwid's event loop, so an alarm is set to have the screen redrawn after them
+        if not self.redraw_pending:
+            self.redraw_pending = True
+            self.event_loop.alarm(0, self.redrawn)
+
+    def redrawn(self):
+        self.redraw_pending = False
+
+    def changed(self):
+        super(AsyncioProcessSupervisor, self).changed()
+        self.redraw()
+
+    def spawn(self, command_key, cmd, on_output, on_exit=None, input_data=None):
+        entry = SupervisedProcess(command_key, None, on_output, on_exit)
+        self.processes[id(entry)] = entry
+        entry.task = self.asyncio_loop.create_task(self.run(entry, cmd, input_data))
+        entry.task.add_done_callback(functools.partial(self.forget, entry))
+        self.changed()
+        return entry
+
+    def forget(self, entry, task):
+        # A task that is cancelled before it started has not run its own clean up
+        if self.processes.pop(id(entry), None) is None:
+            return
+        if entry.on_exit:
+            entry.on_exit(-1)
+        self.changed()
+
+    async def run(self, entry, cmd, input_data=None):
+        try:
+            stdin = input_file(input_data)
+            options = dict(stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE, start_new_session=True, limit=self.READ_SIZE)
+            try:
+                if isinstance(cmd, str):
+                    entry.process = await asyncio.create_subprocess_shell(cmd, **options)
+                else:
+                    entry.process = await asyncio.create_subprocess_exec(*cmd, **options)
+            finally:
+                if input_data is not None:
+                    stdin.close()
+            entry.started_at = time.monotonic()
+            self.changed()
+            await asyncio.wait_for(self.communicate(entry), self.timeout(entry.command_key))
+        except asyncio.TimeoutError:
+            self.stopped(entry, 'timeout')
+        except asyncio.CancelledError:
+            self.stopped(entry, entry.stopped_by or 'cancelled')
         except Exception as inst:
-            logger.error(format_exception(f"""Error handling dynamic label creation:""", inst))
-    Config.loop.run()
+            entry.output(format_exception(f"""Error running {entry.command_key}:""", inst).encode('utf-8'), 'stderr')
+        if entry.process:
+            try:
+                await asyncio.wait_for(entry.process.wait(), self.KILL_GRACE)
+            except asyncio.TimeoutError:
+                self.terminate(entry, signal.SIGKILL)
+                await entry.process.wait()
+        self.processes.pop(id(entry), None)
+        if self.metrics and entry.process:
+            self.metrics.record(entry, entry.process.returncode)
+        if entry.on_exit:
+            entry.on_exit(entry.process.returncode if entry.process else -1)
+        self.changed()
+
+    async def communicate(self, entry):
+        await asyncio.gather(self.read(entry, entry.process.stdout, 'stdout'), self.read(entry, entry.process.stderr, 'stderr'))
+        await entry.process.wait()
+
+    async def read(self, entry, reader, stream):
+        try:
+            while True:
+                data = await reader.read(self.READ_SIZE)
+                if not data:
+                    break
+                entry.output(data, stream)
+                self.redraw()
+        finally:
+            # An empty chunk tells on_output that the stream has ended, also when reading was cut short
+            entry.output(b'', stream)
+
+    def stopped(self, entry, reason):
+        entry.stopped_by = reason
+        self.terminate(entry)
+        if self.on_stop and reason != 'shutdown':
+            self.on_stop(entry)
+            self.redraw()
+
+    def terminate(self, entry, signum=signal.SIGTERM):
+        if getattr(entry, 'process', None) is None or entry.process.returncode is not None:
+            return
+        try:
+            killpg(entry.pid, signum)
+        except ProcessLookupError:
+            pass
+
+    def stop(self, entry, reason):
+        if not entry.stopped_by:
+            entry.stopped_by = reason
+            entry.task.cancel()
+
+    def shutdown(self):
+        tasks = [entry.task for entry in self.processes.values()]
+        for entry in list(self.processes.values()):
+            self.stop(entry, 'shutdown')
+        if tasks:
+            self.asyncio_loop.run_until_complete(asyncio.wait(tasks, timeout=self.KILL_GRACE + 1))
+
+# Histograms with fixed bucket bounds: observing a value is a bisect and a few additions, and quantiles are estimated from the buckets.
+class Histogram():
+    __slots__ = ('bounds', 'counts', 'count', 'sum', 'min', 'max')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.sum = 0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def as_dict(self):
+        return {
+            'buckets': [[bound, count] for bound, count in zip(list(self.bounds) + ['+Inf'], self.counts)],
+            'count': self.count,
+            'sum': self.sum,
+            'min': self.min,
+            'max': self.max,
+        }
+
+class CommandMetrics():
+    def __init__(self):
+        self.runs = 0
+        self.failures = 0
+        self.clicks = 0
+        self.exit_statuses = {}
+        self.last_exit_status = None
+        self.histograms = {name: Histogram(bounds) for name, bounds in MetricsStore.HISTOGRAMS.items()}
+
+# Spawn latency, time to first byte, duration, exit status and output size of every run of every command, kept in memory as per-command histograms.
+# Shown in the stats panel (SHOW_STATS, toggled with STATS_KEY) and written to METRICS_FILE every METRICS_EXPORT_INTERVAL seconds, as JSON or in the Prometheus text format (METRICS_FORMAT).
+class MetricsStore():
+    SECONDS_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+    BYTES_BUCKETS = (0, 64, 256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+    HISTOGRAMS = {
+        'spawn_latency_seconds': SECONDS_BUCKETS,
+        'time_to_first_byte_seconds': SECONDS_BUCKETS,
+        'duration_seconds': SECONDS_BUCKETS,
+        'stdout_bytes': BYTES_BUCKETS,
+        'stderr_bytes': BYTES_BUCKETS,
+    }
+
+    def __init__(self, on_change=None):
+        self.commands = {}
+        self.on_change = on_change
+
+    def command(self, command_key):
+        metrics = self.commands.get(command_key)
+        if metrics is None:
+            metrics = self.commands[command_key] = CommandMetrics()
+        return metrics
+
+    def click(self, command_key):
+        self.command(command_key).clicks += 1
+        self.changed()
+
+    def record(self, entry, returncode):
+        ended_at = time.monotonic()
+        metrics = self.command(entry.command_key)
+        metrics.runs += 1
+        if returncode != 0:
+            metrics.failures += 1
+        metrics.exit_statuses[returncode] = metrics.exit_statuses.get(returncode, 0) + 1
+        metrics.last_exit_status = returncode
+        histograms = metrics.histograms
+        histograms['spawn_latency_seconds'].observe(entry.started_at - entry.requested_at)
+        if entry.first_output_at is not None:
+            histograms['time_to_first_byte_seconds'].observe(entry.first_output_at - entry.started_at)
+        histograms['duration_seconds'].observe(ended_at - entry.started_at)
+        histograms['stdout_bytes'].observe(entry.output_bytes.get('stdout', 0))
+        histograms['stderr_bytes'].observe(entry.output_bytes.get('stderr', 0))
+        self.changed()
+
+    def changed(self):
+        if self.on_change:
+            self.on_change()
+
+    def as_dict(self):
+        return {
+            'generated_at': time.time(),
+            'commands': {
+                command_key: {
+                    'runs': metrics.runs,
+                    'failures': metrics.failures,
+                    'clicks': metrics.clicks,
+                    'exit_statuses': {str(status): count for status, count in metrics.exit_statuses.items()},
+                    'last_exit_status': metrics.last_exit_status,
+                    'histograms': {name: histogram.as_dict() for name, histogram in metrics.histograms.items()},
+                }
+                for command_key, metrics in self.commands.items()
+            },
+        }
+
+    def prometheus(self):
+        def label(value):
+            return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+        lines = []
+        for name, kind, value in (('runs_total', 'counter', 'runs'), ('failures_total', 'counter', 'failures'), ('clicks_total', 'counter', 'clicks')):
+            lines.append(f"""# TYPE tui_launcher_command_{name} {kind}""")
+            for command_key, metrics in self.commands.items():
+                lines.append(f"""tui_launcher_command_{name}{{command="{label(command_key)}"}} {getattr(metrics, value)}""")
+        lines.append('# TYPE tui_launcher_command_exit_status_total counter')
+        for command_key, metrics in self.commands.items():
+            for status, count in metrics.exit_statuses.items():
+                lines.append(f"""tui_launcher_command_exit_status_total{{command="{label(command_key)}",status="{status}"}} {count}""")
+        for name in self.HISTOGRAMS:
+            lines.append(f"""# TYPE tui_launcher_command_{name} histogram""")
+            for command_key, metrics in self.commands.items():
+                histogram = metrics.histograms[name]
+                cumulative = 0
+                for bound, count in zip(list(histogram.bounds) + ['+Inf'], histogram.counts):
+                    cumulative += count
+                    lines.append(f"""tui_launcher_command_{name}_bucket{{command="{label(command_key)}",le="{bound}"}} {cumulative}""")
+                lines.append(f"""tui_launcher_command_{name}_sum{{command="{label(command_key)}"}} {histogram.sum}""")
+                lines.append(f"""tui_launcher_command_{name}_count{{command="{label(command_key)}"}} {histogram.count}""")
+        return '\n'.join(lines) + '\n'
+
+    def export(self, path, format='json'):
+        path = Path(path)
+        contents = self.prometheus() if format == 'prometheus' else json.dumps(self.as_dict(), indent=2)
+        temp_path = path.with_name(f"""{path.name}.{getpid()}.tmp""")
+        try:
+            with temp_path.open('w', encoding='utf-8') as fp:
+                fp.write(contents)
+            replace_file(temp_path, path)
+        except OSError as inst:
+            logger.warning(format_exception(f"""Could not write metrics to {path}""", inst))
+
+    def table(self, limit=10):
+        def seconds(value):
+            if value is None:
+                return '-'
+            return f"""{value * 1000:.0f}ms""" if value < 1 else f"""{value:.1f}s"""
+
+        lines = [f"""{'Command':<30} {'runs':>5} {'fail':>5} {'p50':>7} {'p95':>7} {'ttfb':>7} {'output':>9} {'exit':>5}"""]
+        by_use = sorted(self.commands.items(), key=lambda item: (item[1].runs + item[1].clicks), reverse=True)
+        for command_key, metrics in by_use[:limit]:
+            duration = metrics.histograms['duration_seconds']
+            output = metrics.histograms['stdout_bytes'].sum + metrics.histograms['stderr_bytes'].sum
+            lines.append(f"""{command_key[:30]:<30} {metrics.runs:>5} {metrics.failures:>5} {seconds(duration.quantile(0.5)):>7} {seconds(duration.quantile(0.95)):>7} {seconds(metrics.histograms['time_to_first_byte_seconds'].quantile(0.5)):>7} {output / 1024:>7.1f}Ki {'-' if metrics.last_exit_status is None else metrics.last_exit_status:>5}""")
+        return '\n'.join(lines)
+
+def new_asyncio_loop():
+    asyncio_loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(asyncio_loop)
+    if version_info < (3, 12) and pidfd_open:
+        # Python 3.12+ already waits for its children through pidfds; older versions default to a thread per child
+        watcher = asyncio.PidfdChildWatcher()
+        watcher.attach_loop(asyncio_loop)
+        asyncio.set_child_watcher(watcher)
+    return asyncio_loop
+
+# Widget updates from command output are not applied right away, but collected and flushed from an alarm on the event loop, at most MAX_REFRESH_RATE times per second (or at a dynamic label's own max_refresh_rate).
+# Only the latest pending update of a widget is applied, so a label fed by a tight loop causes at most one redraw per frame instead of one per line.
+class RenderScheduler():
+    def __init__(self, event_loop, max_refresh_rate=None, on_flush=None):
+        self.event_loop = event_loop
+        self.max_refresh_rate = max_refresh_rate
+        self.on_flush = on_flush
+        self.pending = {}
+        self.last_flushed = {}
+        self.alarm_handle = None
+        self.alarm_due = None
+        self.requested = 0
+        self.flushed = 0
+
+    @property
+    def saved(self):
+        return self.requested - self.flushed - sum(1 for update, interval, counted in self.pending.values() if counted)
+
+    def interval(self, max_refresh_rate=None):
+        if max_refresh_rate is None:
+            max_refresh_rate = self.max_refresh_rate
+        return 1.0 / max_refresh_rate if max_refresh_rate else 0
+
+    def schedule(self, target, update, max_refresh_rate=None, counted=True):
+        if counted:
+            self.requested += 1
+        interval = self.interval(max_refresh_rate)
+        self.pending[target] = (update, interval, counted)
+        self.wake(self.last_flushed.get(target, 0) + interval)
+
+    def set_text(self, widget, text, max_refresh_rate=None):
+        self.schedule(widget, functools.partial(widget.set_text, text), max_refresh_rate)
+
+    def wake(self, due):
+        due = max(due, time.monotonic())
+        if self.alarm_handle is not None:
+            if self.alarm_due <= due:
+                return
+            self.event_loop.remove_alarm(self.alarm_handle)
+        self.alarm_due = due
+        self.alarm_handle = self.event_loop.alarm(due - time.monotonic(), self.flush)
+
+    def flush(self):
+        self.alarm_handle = None
+        now = time.monotonic()
+        next_due = None
+        for target, (update, interval, counted) in list(self.pending.items()):
+            due = self.last_flushed.get(target, 0) + interval
+            if due > now:
+                next_due = due if next_due is None else min(due, next_due)
+                continue
+            del self.pending[target]
+            self.last_flushed[target] = now
+            if counted:
+                self.flushed += 1
+            update()
+        if next_due is not None:
+            self.wake(next_due)
+        if self.on_flush:
+            self.on_flush()
+
+def report_redraws_saved():
+    if Config.render_scheduler.saved != Config.reported_redraws_saved:
+        Config.render_scheduler.schedule('status_line', update_status_line, max_refresh_rate=1, counted=False)
+
+def update_status_line():
+    lines = [Config.status_text] if Config.status_text else []
+    if Config.attached and Config.attached.status:
+        lines.append(Config.attached.status)
+    if Config.supervisor and Config.supervisor.processes:
+        lines.append(f"""Running ({len(Config.supervisor.processes)}): {Config.supervisor.table()}""")
+    if Config.macro_runs:
+        lines.append(f"""Macros ({len(Config.macro_runs)}): {', '.join(macro_run.summary() for macro_run in Config.macro_runs.values())}""")
+    if Config.result_cache:
+        lines.append(Config.result_cache.summary())
+    if Config.render_scheduler and Config.render_scheduler.saved:
+        Config.reported_redraws_saved = Config.render_scheduler.saved
+        lines.append(f"""Redraws saved: {Config.reported_redraws_saved}""")
+    Config.status_widget.set_text('\n'.join(lines))
+    if Config.daemon:
+        Config.daemon.broadcast(type='status', text='\n'.join(lines))
+
+def start_process(command_key, on_output, on_exit=None, input_data=None):
+    refusal = Config.supervisor.limit_reached(command_key)
+    if refusal:
+        Config.status_text = f"""Not starting {command_key}: {refusal}"""
+        update_status_line()
+        return None
+    return Config.supervisor.spawn(command_key, Config.commands[command_key], on_output, on_exit, input_data)
+
+def report_stopped(entry):
+    if entry.stopped_by == 'timeout':
+        Config.status_text = f"""{entry.command_key} timed out after {Config.supervisor.timeout(entry.command_key)}s"""
+    else:
+        Config.status_text = f"""Cancelled {entry.command_key}"""
+    update_status_line()
+
+def focused_command_key():
+    if Config.grid is None or Config.grid.focus is None:
+        return None
+    widget = Config.grid.focus.focus
+    return widget.label if isinstance(widget, BoxButton) else None
+
+def cancel_focused_command():
+    command_key = focused_command_key()
+    if command_key is None:
+        return
+    if Config.attached:
+        Config.attached.send(type='cancel', key=command_key)
+    elif not cancel_command(command_key):
+        Config.status_text = f"""{command_key} is not running"""
+        update_status_line()
+
+def toggle_output_filter():
+    command_key = focused_command_key()
+    if Config.output_pane.filter is not None and (command_key is None or command_key == Config.output_pane.filter):
+        Config.output_pane.set_filter(None)
+        Config.status_text = 'Showing the output of all commands'
+    elif command_key is not None:
+        Config.output_pane.set_filter(command_key)
+        Config.status_text = f"""Showing the output of {command_key} only; press {getattr(Config, 'OUTPUT_FILTER_KEY', 'f')} again to show the output of all commands"""
+    update_status_line()
+
+def stats_shown():
+    return Config.stats_widget is not None and any(widget is Config.stats_widget for widget, _ in Config.pile.contents)
+
+def refresh_stats():
+    if stats_shown() and Config.metrics:
+        Config.stats_widget.original_widget.set_text(Config.metrics.table(getattr(Config, 'STATS_LINES', 10)))
+    elif stats_shown() and Config.attached:
+        Config.stats_widget.original_widget.set_text(Config.attached.stats)
+
+def schedule_stats_refresh():
+    if Config.render_scheduler and stats_shown():
+        Config.render_scheduler.schedule('stats', refresh_stats, max_refresh_rate=1, counted=False)
+
+def toggle_stats():
+    if Config.stats_widget is None:
+        return
+    if stats_shown():
+        position = [widget for widget, _ in Config.pile.contents].index(Config.stats_widget)
+        del Config.pile.contents[position]
+    else:
+        # Right below the button grid
+        position = [widget for widget, _ in Config.pile.contents].index(Config.grid) + 1
+        Config.pile.contents.insert(position, (Config.stats_widget, Config.pile.options('pack')))
+        refresh_stats()
+
+def export_metrics():
+    if Config.metrics and getattr(Config, 'METRICS_FILE', None):
+        Config.metrics.export(Config.METRICS_FILE, getattr(Config, 'METRICS_FORMAT', 'json'))
+
+def export_metrics_periodically():
+    export_metrics()
+    Config.loop.event_loop.alarm(getattr(Config, 'METRICS_EXPORT_INTERVAL', 10), export_metrics_periodically)
+
+# What the screen showed last (the text of the dynamic labels, the output pane and the clicked button) is kept in STATE_FILE, so the next launch shows it right away instead of the keys of the dynamic labels and an empty output pane, until fresh output replaces it.
+# Changes only mark the snapshot as stale: it is written at most once every STATE_SAVE_INTERVAL seconds, and on exit, to a temporary file that then replaces the previous snapshot.
+STATE_VERSION = 1
+
+# Launchers with the same config in several tmux panes or terminals each keep their own state: the default state file is named after the tmux pane, or otherwise the terminal, the launcher runs in.
+def launcher_instance():
+    instance = getenv('TMUX_PANE') and f"""tmux{getenv('TMUX_PANE')}"""
+    if not instance:
+        try:
+            instance = ttyname(0)
+        except OSError:
+            return None
+    return re.sub(r'[^A-Za-z0-9]+', '-', instance).strip('-') or None
+
+def state_file_path():
+    if getattr(Config, 'STATE_FILE', None):
+        return Path(Config.STATE_FILE)
+    instance = launcher_instance()
+    suffix = f"""-{instance}""" if instance else ''
+    return Path(getenv('XDG_STATE_HOME') or Path.home() / '.local' / 'state') / 'tui_launcher' / f"""state-{module_name}{suffix}.json"""
+
+class StateFile():
+    def __init__(self, path, event_loop, interval=5):
+        self.path = path
+        self.event_loop = event_loop
+        self.interval = interval
+        self.write_handle = None
+        self.written_at = None
+
+    def changed(self):
+        if self.write_handle is None:
+            delay = 0 if self.written_at is None else max(self.written_at + self.interval - time.monotonic(), 0)
+            self.write_handle = self.event_loop.alarm(delay, self.scheduled_write)
+
+    def scheduled_write(self):
+        self.write_handle = None
+        self.write()
+
+    def flush(self):
+        # Writes the changes since the last write right away, e.g. on exit
+        if self.write_handle is not None:
+            self.event_loop.remove_alarm(self.write_handle)
+            self.write_handle = None
+            self.write()
+
+    def snapshot(self):
+        active = None
+        if Config.active_widget and Config.active_position is not None:
+            active = {'key': Config.active_widget.label, 'position': list(Config.active_position), 'status': Config.status_text}
+        return {
+            'version': STATE_VERSION,
+            # Labels that haven't had any output yet would only show their key
+            'labels': {label_key: dynamic_label['text'] for label_key, dynamic_label in Config.dynamic_labels.items() if dynamic_label['text'] != label_key},
+            'output': Config.output_pane.snapshot() if Config.output_pane else None,
+            'active': active,
+        }
+
+    def write(self):
+        self.written_at = time.monotonic()
+        temp_path = self.path.with_name(f"""{self.path.name}.{getpid()}.tmp""")
+        try:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            with temp_path.open('w', encoding='utf-8') as fp:
+                json.dump(self.snapshot(), fp, separators=(',', ':'))
+            replace_file(temp_path, self.path)
+        except OSError as inst:
+            logger.warning(format_exception(f"""Could not write the state file {self.path}""", inst))
+
+def is_markup(value):
+    # A plain string, or the segments that markup_from_json() turns back into urwid markup
+    if isinstance(value, str):
+        return True
+    return isinstance(value, list) and all(isinstance(segment, str) or (isinstance(segment, list) and len(segment) == 2 and (segment[0] is None or isinstance(segment[0], str)) and isinstance(segment[1], str)) for segment in value)
+
+def is_valid_state(state):
+    # Checks the whole shape before anything is restored, so a damaged state file can't leave the launcher half restored
+    if not isinstance(state, dict) or not isinstance(state.get('labels'), dict) or 'output' not in state or 'active' not in state:
+        return False
+    if not all(isinstance(label_key, str) and is_markup(text) for label_key, text in state['labels'].items()):
+        return False
+    output = state['output']
+    if output is not None:
+        if not isinstance(output, dict) or not isinstance(output.get('lines'), list) or not isinstance(output.get('partial_lines'), dict):
+            return False
+        if not all(isinstance(line, list) and len(line) == 2 and isinstance(line[0], str) and is_markup(line[1]) for line in output['lines']):
+            return False
+        if not all(isinstance(partial_lines, dict) and all(isinstance(stream, str) and is_markup(partial_line) for stream, partial_line in partial_lines.items()) for partial_lines in output['partial_lines'].values()):
+            return False
+    active = state['active']
+    if active is not None:
+        if not isinstance(active, dict) or not isinstance(active.get('key'), str) or not isinstance(active.get('status'), str):
+            return False
+        position = active.get('position')
+        if not isinstance(position, list) or len(position) != 2 or not all(type(number) is int and number >= 0 for number in position):
+            return False
+    return True
+
+def restore_state(path):
+    try:
+        with path.open(encoding='utf-8') as fp:
+            state = json.load(fp)
+        if not isinstance(state, dict) or state.get('version') != STATE_VERSION:
+            return False
+    except FileNotFoundError:
+        return False
+    except Exception as inst:
+        # A corrupt state file should never prevent the launcher from starting
+        logger.warning(format_exception(f"""Ignoring state file {path}""", inst))
+        return False
+    if not is_valid_state(state):
+        logger.warning(f"""Ignoring state file {path}: unexpected contents""")
+        return False
+    for label_key, text in state['labels'].items():
+        if label_key in Config.dynamic_labels:
+            set_label_text(Config.dynamic_labels[label_key], markup_from_json(text))
+    if state['output'] and Config.output_pane:
+        Config.output_pane.restore(state['output'])
+    active = state['active']
+    if active:
+        row, index = active['position']
+        # Only when the layout still has the same button there
+        if row < len(BUTTON_ROWS) and index < len(BUTTON_ROWS[row]) and resolve_layout_item(BUTTON_ROWS[row][index])[1] == active['key']:
+            Config.active_position = (row, index)
+            # Dropping the row if it was built already, so it's built again with the 'activated_button' attribute
+            if Config.grid:
+                Config.grid.body.rows.pop(row, None)
+            Config.status_text = active['status']
+            update_status_line()
+    return True
+
+def spawn_command(command_key, on_output, on_exit=None):
+    input_key = getattr(Config, 'COMMAND_INPUT', {}).get(command_key)
+    if input_key is not None:
+        return CommandWithInput(command_key, input_key, on_output, on_exit).start()
+    if Config.result_cache and Config.result_cache.enabled_for(command_key):
+        return Config.result_cache.run(command_key, on_output, on_exit)
+    return start_process(command_key, on_output, on_exit)
+
+# Stops the run of one caller of spawn_command(). A process of the caller's own is sent signum, and its on_exit still follows; a run that it shares with others, i.e. one that the result cache coalesced it onto, or the input of a COMMAND_INPUT command that is still being collected, keeps going for them, and the caller is unsubscribed from it instead.
+# Returns whether the caller was unsubscribed, in which case no on_exit follows.
+def abandon_command(entry, on_output, on_exit, signum=signal.SIGTERM):
+    if isinstance(entry, CommandWithInput):
+        return entry.abandon(signum)
+    if isinstance(entry, CachedResult):
+        # Replayed from the event loop right away
+        return False
+    if Config.result_cache and Config.result_cache.unsubscribe(entry, on_output, on_exit):
+        return True
+    if Config.supervisor:
+        Config.supervisor.terminate(entry, signum)
+    return False
+
+# Runs a command with the output of its COMMAND_INPUT command on its stdin.
+# The input command is started with spawn_command(), so when it has a TTL in RESULT_CACHE_TTL, all the commands that format its output share a single run of it within that time; the command itself only starts once its input is complete, and not at all when the input command fails.
+class CommandWithInput():
+    def __init__(self, command_key, input_key, on_output, on_exit=None):
+        self.command_key = command_key
+        self.input_key = input_key
+        self.on_output = on_output
+        self.on_exit = on_exit
+        self.chunks = []
+        self.input_entry = None
+        self.entry = None
+        self.abandoned = False
+
+    # The process of the command itself, once its input is complete; until then, there's nothing of its own to stop
+    @property
+    def process(self):
+        return self.entry.process if self.entry else None
+
+    @property
+    def pid(self):
+        return self.entry.pid if self.entry else None
+
+    def start(self):
+        self.input_entry = spawn_command(self.input_key, self.collect, self.input_exited)
+        return self if self.input_entry is not None else None
+
+    def abandon(self, signum=signal.SIGTERM):
+        if self.entry is not None:
+            Config.supervisor.terminate(self.entry, signum)
+            return False
+        # Until its input is complete, the command has no process of its own: it just won't be started
+        self.abandoned = True
+        abandon_command(self.input_entry, self.collect, self.input_exited, signum)
+        return True
+
+    def collect(self, data, stream):
+        if self.abandoned:
+            return
+        if stream == 'stdout':
+            self.chunks.append(data)
+        elif data:
+            # Errors of the input command are shown as those of the command itself
+            self.on_output(data, stream)
+
+    def input_exited(self, returncode):
+        if self.abandoned:
+            return
+        if returncode == 0:
+            self.entry = start_process(self.command_key, self.on_output, self.on_exit, b''.join(self.chunks))
+            if self.entry is not None:
+                return
+        for stream in ('stdout', 'stderr'):
+            self.on_output(b'', stream)
+        if self.on_exit:
+            self.on_exit(returncode or -1)
+
+# Opt-in cache of command results, for the commands with a TTL in RESULT_CACHE_TTL.
+# Results are keyed on the normalised command rather than on the command key, so every button and label running the same command shares them; the RESULT_CACHE_SIZE most recently used results are kept.
+# A request for a command that is already running doesn't start a second process, but subscribes to the running one: it gets the output so far replayed, and the rest as it arrives.
+class CachedResult():
+    def __init__(self, chunks, returncode):
+        self.chunks = chunks
+        self.returncode = returncode
+        self.stored_at = time.monotonic()
+
+class InFlightCommand():
+    def __init__(self, cache, cache_key, command_key, max_bytes):
+        self.cache = cache
+        self.cache_key = cache_key
+        self.command_key = command_key
+        self.max_bytes = max_bytes
+        self.subscribers = []
+        self.chunks = []
+        self.size = 0
+        self.entry = None
+
+    def subscribe(self, on_output, on_exit):
+        for stream, data in self.chunks or ():
+            on_output(data, stream)
+        self.subscribers.append((on_output, on_exit))
+
+    def output(self, data, stream='stdout'):
+        if self.chunks is not None:
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                # Too large to cache; later subscribers will only get the output from the moment they subscribed
+                self.chunks = None
+            else:
+                self.chunks.append((stream, data))
+        for on_output, _ in self.subscribers:
+            on_output(data, stream)
+
+    def exit(self, returncode):
+        self.cache.finished(self, returncode)
+        for _, on_exit in self.subscribers:
+            if on_exit:
+                on_exit(returncode)
+
+class ResultCache():
+    def __init__(self, event_loop, ttls, size=32, max_bytes=1024 * 1024):
+        self.event_loop = event_loop
+        self.ttls = ttls
+        self.size = size
+        self.max_bytes = max_bytes
+        self.results = OrderedDict()
+        self.in_flight = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+
+    def enabled_for(self, command_key):
+        return bool(self.ttls.get(command_key))
+
+    def normalize(self, cmd):
+        if isinstance(cmd, str):
+            return ('sh', ' '.join(cmd.split()))
+        return tuple(cmd)
+
+    def lookup(self, cache_key, ttl):
+        result = self.results.get(cache_key)
+        if result is None:
+            return None
+        if time.monotonic() - result.stored_at > ttl:
+            del self.results[cache_key]
+            return None
+        self.results.move_to_end(cache_key)
+        return result
+
+    def run(self, command_key, on_output, on_exit=None):
+        cache_key = self.normalize(Config.commands[command_key])
+        result = self.lookup(cache_key, self.ttls[command_key])
+        if result is not None:
+            self.hits += 1
+            self.changed()
+            # Replayed from the event loop, so callers see the same order of events as for a process
+            self.event_loop.alarm(0, functools.partial(self.replay, result, on_output, on_exit))
+            return result
+        flight = self.in_flight.get(cache_key)
+        if flight is not None:
+            self.coalesced += 1
+            flight.subscribe(on_output, on_exit)
+            self.changed()
+            return flight.entry
+        self.misses += 1
+        flight = InFlightCommand(self, cache_key, command_key, self.max_bytes)
+        flight.subscribe(on_output, on_exit)
+        flight.entry = start_process(command_key, flight.output, flight.exit)
+        if flight.entry is not None:
+            self.in_flight[cache_key] = flight
+        self.changed()
+        return flight.entry
+
+    def unsubscribe(self, entry, on_output, on_exit):
+        # Only from a run that others are waiting for too; a run that nobody else is waiting for is left to the caller to stop
+        for flight in self.in_flight.values():
+            if flight.entry is entry and (on_output, on_exit) in flight.subscribers and len(flight.subscribers) > 1:
+                flight.subscribers.remove((on_output, on_exit))
+                return True
+        return False
+
+    def replay(self, result, on_output, on_exit):
+        for stream, data in result.chunks:
+            on_output(data, stream)
+        if on_exit:
+            on_exit(result.returncode)
+
+    def finished(self, flight, returncode):
+        self.in_flight.pop(flight.cache_key, None)
+        # Only successful, complete runs are cached; a failure is retried on the next request
+        if returncode == 0 and flight.chunks is not None:
+            self.results[flight.cache_key] = CachedResult(flight.chunks, returncode)
+            self.results.move_to_end(flight.cache_key)
+            while len(self.results) > self.size:
+                self.results.popitem(last=False)
+
+    def changed(self):
+        update_status_line()
+
+    def summary(self):
+        return f"""Cache: {self.hits} hits, {self.misses} misses, {self.coalesced} coalesced"""
+
+def make_decoder():
+    # Decoding per pipe, rather than per chunk, keeps multibyte sequences that are split across reads intact
+    return codecs.getincrementaldecoder('utf-8')(errors='replace')
+
+# ANSI escape sequences: CSI sequences (of which SGR, ending in 'm', sets the colours), OSC strings (such as window titles), two-character escapes, and failing all of those a lone escape character. Only SGR is turned into markup; the rest is dropped.
+ANSI_ESCAPE = re.compile(r'\x1b(?:\[([0-?]*)[ -/]*([@-~])|\][^\x07\x1b]*(?:\x07|\x1b\\)|[ -/]*[0-Z\\^-~]|)')
+# What may still become one of those sequences once the next chunk arrives
+ANSI_ESCAPE_PREFIX = re.compile(r'\x1b(?:\[[0-?]*[ -/]*|\][^\x07\x1b]*\x1b?|[ -/]*)\Z')
+ANSI_MAX_PENDING = 4096
+ANSI_BASIC_COLORS = ('black', 'dark red', 'dark green', 'brown', 'dark blue', 'dark magenta', 'dark cyan', 'light gray')
+ANSI_BRIGHT_COLORS = ('dark gray', 'light red', 'light green', 'yellow', 'light blue', 'light magenta', 'light cyan', 'white')
+ANSI_SETTINGS = {1: 'bold', 3: 'italics', 4: 'underline', 5: 'blink', 6: 'blink', 7: 'standout', 9: 'strikethrough', 21: 'underline'}
+ANSI_RESET_SETTINGS = {22: ('bold',), 23: ('italics',), 24: ('underline',), 25: ('blink',), 27: ('standout',), 29: ('strikethrough',)}
+
+@functools.lru_cache(maxsize=None)
+def ansi_attribute(foreground, background, settings):
+    # The name describes the attribute completely, so the palette entry can be created from it wherever the markup ends up (e.g. in an attached interface)
+    if not (foreground or background or settings):
+        return None
+    return f"""ansi:{','.join(sorted(settings) + ([foreground] if foreground else []))}:{background or ''}"""
+
+def register_ansi_attribute(name):
+    _, foreground, background = name.split(':')
+    # 256 colour ('h' + number) and true colour ('#rgb') values fall back to the default colour on 16 colour terminals
+    basic_foreground = ','.join(part for part in foreground.split(',') if part and part[0] not in 'h#')
+    basic_background = background if background and background[0] not in 'h#' else ''
+    Config.loop.screen.register_palette_entry(name, basic_foreground or 'default', basic_background or 'default', None, foreground or 'default', background or 'default')
+
+def register_markup_attributes(markup):
+    if isinstance(markup, str) or getattr(Config, 'loop', None) is None:
+        return
+    for segment in markup:
+        if isinstance(segment, tuple) and segment[0] not in Config.ansi_attributes:
+            register_ansi_attribute(segment[0])
+            Config.ansi_attributes.add(segment[0])
+
+def markup_from_json(markup):
+    # JSON turns the (attribute, text) tuples of urwid markup into lists
+    if isinstance(markup, str):
+        return markup
+    return [tuple(segment) if isinstance(segment, list) else segment for segment in markup]
+
+def join_markup(lines, separator='\n'):
+    markup = []
+    for line in lines:
+        if markup:
+            markup.append(separator)
+        if isinstance(line, str):
+            markup.append(line)
+        else:
+            markup.extend(line)
+    if all(isinstance(segment, str) for segment in markup):
+        return ''.join(markup)
+    return markup
+
+# Turns text with ANSI escape sequences into (attribute, text) segments. The SGR state, and an escape sequence that was cut off at the end of a chunk, carry over to the next chunk.
+# Output tends to repeat the same few sequences, so the state an SGR sequence leads to is cached per (state, sequence) rather than worked out again every time.
+class AnsiParser():
+    TRANSITIONS_CACHE_SIZE = 4096
+    transitions = {}
+
+    def __init__(self, colors=True):
+        self.colors = colors
+        self.pending = ''
+        # Foreground, background and the set of settings (bold, underline, ...)
+        self.state = (None, None, frozenset())
+        self.attribute = None
+
+    def feed(self, text):
+        text = self.pending + text
+        self.pending = ''
+        if '\x1b' not in text:
+            return [(self.attribute, text)] if text else []
+        segments = []
+        append = segments.append
+        position = 0
+        for match in ANSI_ESCAPE.finditer(text):
+            start, end = match.span()
+            if start > position:
+                append((self.attribute, text[position:start]))
+            position = end
+            if position - start == 1:
+                # A lone escape character: the start of a sequence that continues in the next chunk, or else garbage that is dropped
+                if len(text) - start < ANSI_MAX_PENDING and ANSI_ESCAPE_PREFIX.match(text, start):
+                    self.pending = text[start:]
+                    return segments
+            elif match.group(2) == 'm' and self.colors:
+                self.select_graphic_rendition(match.group(1))
+        if position < len(text):
+            segments.append((self.attribute, text[position:]))
+        return segments
+
+    def select_graphic_rendition(self, codes):
+        transition = self.transitions.get((self.state, codes))
+        if transition is None:
+            if len(self.transitions) >= self.TRANSITIONS_CACHE_SIZE:
+                self.transitions.clear()
+            state = self.next_state(self.state, codes)
+            transition = self.transitions[(self.state, codes)] = (state, ansi_attribute(*state))
+        self.state, self.attribute = transition
+
+    def next_state(self, state, codes):
+        foreground, background, settings = state
+        settings = set(settings)
+        params = [int(code) if code.isdigit() else 0 for code in codes.replace('::', ':').replace(':', ';').split(';')]
+        index = 0
+        while index < len(params):
+            code = params[index]
+            if code == 0:
+                foreground = background = None
+                settings.clear()
+            elif code in ANSI_SETTINGS:
+                settings.add(ANSI_SETTINGS[code])
+            elif code in ANSI_RESET_SETTINGS:
+                settings.difference_update(ANSI_RESET_SETTINGS[code])
+            elif 30 <= code <= 37:
+                foreground = ANSI_BASIC_COLORS[code - 30]
+            elif 40 <= code <= 47:
+                background = ANSI_BASIC_COLORS[code - 40]
+            elif 90 <= code <= 97:
+                foreground = ANSI_BRIGHT_COLORS[code - 90]
+            elif 100 <= code <= 107:
+                background = ANSI_BRIGHT_COLORS[code - 100]
+            elif code == 39:
+                foreground = None
+            elif code == 49:
+                background = None
+            elif code in (38, 48):
+                color, index = self.extended_color(params, index)
+                if code == 38:
+                    foreground = color
+                else:
+                    background = color
+            index += 1
+        return foreground, background, frozenset(settings)
+
+    def extended_color(self, params, index):
+        # 38;5;n / 48;5;n for the 256 colour palette, 38;2;r;g;b / 48;2;r;g;b for true colour
+        if index + 2 < len(params) and params[index + 1] == 5:
+            return f"""h{min(params[index + 2], 255)}""", index + 2
+        if index + 4 < len(params) and params[index + 1] == 2:
+            return '#' + ''.join(f"""{round(min(value, 255) / 17):x}""" for value in params[index + 2:index + 5]), index + 4
+        return None, len(params)
+
+def finish_line(segments):
+    # Like the plain text lines before, stripped of surrounding whitespace; an empty string for a blank line
+    merged = []
+    for attribute, text in segments:
+        if merged and merged[-1][0] == attribute:
+            merged[-1] = (attribute, merged[-1][1] + text)
+        elif text:
+            merged.append((attribute, text))
+    segments = merged
+    if not segments:
+        return ''
+    segments[0] = (segments[0][0], segments[0][1].lstrip())
+    segments[-1] = (segments[-1][0], segments[-1][1].rstrip())
+    if all(attribute is None for attribute, _ in segments):
+        return ''.join(text for _, text in segments)
+    return [(attribute, text) if attribute else text for attribute, text in segments if text]
+
+def segments_of(line):
+    return [(None, line)] if isinstance(line, str) else [segment if isinstance(segment, tuple) else (None, segment) for segment in line]
+
+# The characters str.splitlines() breaks lines on
+LINE_BREAKS = frozenset('\n\r\v\f\x1c\x1d\x1e\x85\u2028\u2029')
+
+# The output of a single command on its way to the screen: an incremental decoder, an ANSI parser and the not yet terminated line of each of its streams.
+# feed() returns the lines that a chunk completed, as plain strings or urwid markup, and the line that is still being written.
+class OutputBuffer():
+    def __init__(self):
+        self.decoders = {}
+        self.parsers = {}
+        self.partial_lines = {}
+
+    def feed(self, data, stream='stdout'):
+        decoder = self.decoders.get(stream)
+        if decoder is None:
+            decoder = self.decoders[stream] = make_decoder()
+            self.parsers[stream] = AnsiParser(getattr(Config, 'ANSI_COLORS', True))
+        segments = self.parsers[stream].feed(decoder.decode(data, final=not data))
+        line = self.partial_lines.pop(stream, [])
+        new_lines = []
+        for attribute, text in segments:
+            if not text:
+                continue
+            parts = text.splitlines()
+            if text[-1] in LINE_BREAKS:
+                parts.append('')
+            if parts[0]:
+                line.append((attribute, parts[0]))
+            for part in parts[1:]:
+                new_lines.append(line)
+                line = [(attribute, part)] if part else []
+        if not data:
+            del self.decoders[stream], self.parsers[stream]
+            new_lines.append(line)
+        elif line:
+            self.partial_lines[stream] = line
+        new_lines = [finished for finished in map(finish_line, new_lines) if finished]
+        return new_lines, stream, data and line and finish_line(line) or None
+
+# Decoding, ANSI parsing and line splitting of command output, in a worker thread, so heavy (coloured) output doesn't hold up input handling.
+# Chunks are parsed in the order they were submitted. Their lines are handed back to the event loop in batches: the worker only wakes the event loop when it isn't awake already, and everything that was parsed by then is applied in one go.
+class OutputPipeline():
+    STOP_TIMEOUT = 1
+
+    def __init__(self, event_loop):
+        self.event_loop = event_loop
+        self.jobs = queue.SimpleQueue()
+        self.results = deque()
+        self.pending = 0
+        self.batches = 0
+        self.woken = False
+        self.stopped = False
+        self.wake_read, self.wake_write = pipe()
+        set_blocking(self.wake_read, False)
+        self.wake_handle = event_loop.watch_file(self.wake_read, self.deliver)
+        self.thread = threading.Thread(target=self.work, name='output-pipeline', daemon=True)
+        self.thread.start()
+
+    def submit(self, buffer, data, stream, on_lines):
+        self.pending += 1
+        self.jobs.put((buffer, data, stream, on_lines))
+
+    def work(self):
+        while True:
+            job = self.jobs.get()
+            # Nothing is delivered after stop(), so what's still queued then isn't parsed either
+            if job is None or self.stopped:
+                return
+            buffer, data, stream, on_lines = job
+            try:
+                lines = buffer.feed(data, stream)
+            except Exception as inst:
+                logger.error(format_exception(f"""Error parsing output:""", inst))
+                lines = ([], stream, None)
+            self.results.append((on_lines, lines))
+            if not self.woken:
+                self.woken = True
+                os_write(self.wake_write, b'.')
+            # Gives the event loop the interpreter between chunks, rather than only when the switch interval forces it to
+            time.sleep(0)
+
+    def deliver(self):
+        try:
+            while os_read(self.wake_read, 4096):
+                pass
+        except BlockingIOError:
+            pass
+        # Cleared before the results are taken, so a result that comes in meanwhile wakes the event loop again
+        self.woken = False
+        self.batches += 1
+        while self.results:
+            on_lines, lines = self.results.popleft()
+            self.pending -= 1
+            on_lines(*lines)
+
+    def stop(self):
+        self.stopped = True
+        self.jobs.put(None)
+        self.event_loop.remove_watch_file(self.wake_handle)
+        # The worker writes to the wake pipe until it returns, so the pipe is only closed after that
+        self.thread.join(self.STOP_TIMEOUT)
+        if self.thread.is_alive():
+            # Stuck on a single chunk; it goes when the process does, and so does the pipe
+            logger.warning(f"""The output pipeline did not stop within {self.STOP_TIMEOUT} seconds""")
+            return
+        close(self.wake_read)
+        close(self.wake_write)
+
+# The command output pane: the interleaved (label, line) history of all commands in a ring of OUTPUT_SCROLLBACK_LINES, of which OUTPUT_VISIBLE_LINES are shown.
+# Every command also has a ring of OUTPUT_SCROLLBACK_LINES of its own lines, so a chatty command that pushes the others out of the interleaved ring doesn't take their history with it; set_filter() shows (and scrolls through) only the lines of one command.
+# Only the visible window is formatted on updates, so the cost of a chunk no longer depends on how much output has been kept.
+# With a pipeline, chunks are parsed in its worker thread and their lines added once they come back; without one (e.g. in the daemon, whose snapshots should include all output it has sent), right away.
+class OutputPane():
+    def __init__(self, widget, visible_lines=10, scrollback_lines=1000, scheduler=None, pipeline=None):
+        self.widget = widget
+        self.scheduler = scheduler
+        self.pipeline = pipeline
+        self.visible_lines = visible_lines
+        self.scrollback_lines = scrollback_lines
+        self.lines = deque(maxlen=scrollback_lines)
+        self.command_lines = {}
+        self.buffers = {}
+        self.partial_lines = {}
+        self.scroll_offset = 0
+        self.filter = None
+
+    def buffer(self, label):
+        buffer = self.buffers.get(label)
+        if buffer is None:
+            buffer = self.buffers[label] = OutputBuffer()
+        return buffer
+
+    def feed(self, label, data, stream='stdout'):
+        if self.pipeline:
+            self.pipeline.submit(self.buffer(label), data, stream, functools.partial(self.add_lines, label))
+        else:
+            self.add_lines(label, *self.buffer(label).feed(data, stream))
+
+    def add_lines(self, label, new_lines, stream, partial_line):
+        self.lines.extend((label, line) for line in new_lines)
+        if new_lines:
+            self.lines_of(label).extend(new_lines)
+        if partial_line:
+            self.partial_lines.setdefault(label, {})[stream] = partial_line
+        elif stream in self.partial_lines.get(label, ()):
+            del self.partial_lines[label][stream]
+        if self.scroll_offset and self.shows(label):
+            # Keep the scrolled back view on the same lines while new ones arrive
+            self.scroll_offset = min(self.scroll_offset + len(new_lines), self.max_scroll_offset())
+        if Config.state_file and self is Config.output_pane:
+            Config.state_file.changed()
+        if self.scheduler:
+            self.scheduler.schedule(self, self.refresh)
+        else:
+            self.refresh()
+
+    def lines_of(self, label):
+        lines = self.command_lines.get(label)
+        if lines is None:
+            lines = self.command_lines[label] = deque(maxlen=self.scrollback_lines)
+        return lines
+
+    def shows(self, label):
+        return self.filter is None or label == self.filter
+
+    def shown_lines(self):
+        return self.lines if self.filter is None else self.command_lines.get(self.filter, ())
+
+    def set_filter(self, label):
+        self.filter = label
+        self.scroll_offset = 0
+        self.refresh()
+
+    def max_scroll_offset(self):
+        return max(len(self.shown_lines()) - self.visible_lines, 0)
+
+    def scroll(self, line_count):
+        self.scroll_offset = min(max(self.scroll_offset + line_count, 0), self.max_scroll_offset())
+        self.refresh()
+
+    def window(self):
+        lines = list(islice(reversed(self.shown_lines()), self.scroll_offset, self.scroll_offset + self.visible_lines))
+        if self.filter is not None:
+            lines = [(self.filter, line) for line in lines]
+        lines.reverse()
+        if not self.scroll_offset:
+            lines.extend((label, partial_line) for label, partial_lines in self.partial_lines.items() if self.shows(label) for partial_line in partial_lines.values())
+        return lines[-self.visible_lines:]
+
+    def refresh(self):
+        markup = join_markup([f"""[{label}] """, line] if isinstance(line, str) else [f"""[{label}] """] + line for label, line in self.window())
+        register_markup_attributes(markup)
+        self.widget.set_text(markup)
+
+    def snapshot(self):
+        return {
+            'lines': list(self.lines),
+            'partial_lines': {label: dict(partial_lines) for label, partial_lines in self.partial_lines.items() if partial_lines},
+        }
+
+    def restore(self, snapshot):
+        self.lines.clear()
+        self.lines.extend((label, markup_from_json(line)) for label, line in snapshot['lines'])
+        # Snapshots only hold the interleaved ring, which the rings of the commands are rebuilt from
+        self.command_lines.clear()
+        for label, line in self.lines:
+            self.lines_of(label).append(line)
+        self.buffers.clear()
+        self.partial_lines.clear()
+        for label, partial_lines in snapshot['partial_lines'].items():
+            for stream, partial_line in partial_lines.items():
+                self.partial_lines.setdefault(label, {})[stream] = markup_from_json(partial_line)
+                # Output that continues the line is added to it
+                self.buffer(label).partial_lines[stream] = segments_of(markup_from_json(partial_line))
+        self.scroll_offset = 0
+        self.refresh()
+
+def refresh_widget(dynamic_label, input_text, stream='stdout'):
+    if Config.output_pipeline:
+        Config.output_pipeline.submit(dynamic_label['buffer'], input_text, stream, functools.partial(show_label_lines, dynamic_label))
+    else:
+        show_label_lines(dynamic_label, *dynamic_label['buffer'].feed(input_text, stream))
+
+def show_label_lines(dynamic_label, new_lines, stream, partial_line):
+    # The last lines of every chunk, including the one that is still being written
+    lines = new_lines + [partial_line] if partial_line else new_lines
+    if lines:
+        set_label_text(dynamic_label, join_markup(lines[-10:]))
+
+def set_label_text(dynamic_label, new_text):
+    if dynamic_label['retired']:
+        return
+    dynamic_label['text'] = new_text
+    register_markup_attributes(new_text)
+    if Config.state_file:
+        Config.state_file.changed()
+    widget = dynamic_label['widget'].original_widget
+    if Config.render_scheduler:
+        Config.render_scheduler.set_text(widget, new_text, dynamic_label['max_refresh_rate'])
+    else:
+        widget.set_text(new_text)
+    if Config.daemon:
+        Config.daemon.broadcast(type='label', key=dynamic_label['label_text'], text=new_text)
+
+def tee_output(*callbacks):
+    def output(data, stream='stdout'):
+        for callback in callbacks:
+            callback(data, stream)
+    return output
+
+# Every run started from a button has its complete output (stdout and stderr, interleaved as they arrived) written to a spool file of its own in SPOOL_DIRECTORY.
+# Spool files older than SPOOL_MAX_AGE seconds are removed, as are the oldest ones while all of them together are larger than SPOOL_MAX_BYTES.
+class SpoolFile():
+    def __init__(self, spool, path):
+        self.spool = spool
+        self.path = path
+        self.fp = path.open('wb')
+
+    def write(self, data, stream='stdout'):
+        if data and self.fp:
+            self.fp.write(data)
+            # Flushed right away, so the pager sees the output of a command that is still running
+            self.fp.flush()
+
+    def close(self, returncode=None):
+        if self.fp:
+            self.fp.close()
+            self.fp = None
+            self.spool.closed(self)
+
+    def discard(self):
+        # For a run that was refused, and so never had any output
+        self.close()
+        self.path.unlink(missing_ok=True)
+
+class Spool():
+    def __init__(self, directory, max_bytes=None, max_age=None):
+        self.directory = Path(directory)
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.open_files = {}
+        self.latest_paths = {}
+        self.run_count = 0
+
+    def prefix(self, command_key):
+        # Command keys can contain anything, so files are named after a hash of the key
+        return hashlib.sha1(command_key.encode('utf-8')).hexdigest()[:12]
+
+    def open(self, command_key):
+        self.run_count += 1
+        try:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            path = self.directory / f"""{self.prefix(command_key)}-{time.strftime('%Y%m%d-%H%M%S')}-{getpid()}-{self.run_count}.log"""
+            spool_file = self.open_files[path] = SpoolFile(self, path)
+            self.latest_paths[command_key] = path
+        except OSError as inst:
+            logger.warning(format_exception(f"""Could not spool the output of {command_key}""", inst))
+            return None
+        return spool_file
+
+    def closed(self, spool_file):
+        self.open_files.pop(spool_file.path, None)
+        self.enforce_retention(keep=spool_file.path)
+
+    def latest(self, command_key):
+        path = self.latest_paths.get(command_key)
+        if path is not None and path.exists():
+            return path
+        # Left behind by an earlier session
+        paths = list(self.directory.glob(f"""{self.prefix(command_key)}-*.log"""))
+        return max(paths, key=lambda path: path.stat().st_mtime_ns) if paths else None
+
+    def enforce_retention(self, keep=None):
+        try:
+            entries = sorted((entry.stat().st_mtime, entry.stat().st_size, Path(entry.path)) for entry in scandir(self.directory) if entry.name.endswith('.log'))
+        except OSError:
+            return
+        now = time.time()
+        total = sum(size for _, size, _ in entries)
+        for mtime, size, path in entries:
+            if path in self.open_files or path == keep:
+                continue
+            if (self.max_age is not None and now - mtime > self.max_age) or (self.max_bytes is not None and total > self.max_bytes):
+                path.unlink(missing_ok=True)
+                total -= size
+
+# A line index of a (possibly still growing) spool file that is memory-mapped instead of read: for every block of BLOCK_SIZE bytes it keeps the number of newlines up to the end of that block.
+# The counting is done by bytes.count in C, a block at a time, so indexing a multi-gigabyte file takes a fraction of a second and very little memory; finding the start of a line only scans the one block it is in.
+class SpoolIndex():
+    BLOCK_SIZE = 65536
+
+    def __init__(self, path):
+        self.path = path
+        self.fp = path.open('rb')
+        self.map = None
+        self.size = 0
+        self.block_lines = []
+        self.remap()
+
+    def remap(self):
+        size = fstat(self.fp.fileno()).st_size
+        if size == self.size:
+            return False
+        if self.map:
+            self.map.close()
+        self.map = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self.size = size
+        return True
+
+    def close(self):
+        if self.map:
+            self.map.close()
+        self.fp.close()
+
+    @property
+    def complete(self):
+        return (len(self.block_lines) + 1) * self.BLOCK_SIZE > self.size
+
+    def extend(self, until_offset=None, max_blocks=None):
+        limit = self.size if until_offset is None else min(until_offset, self.size)
+        while (len(self.block_lines) + 1) * self.BLOCK_SIZE <= limit and max_blocks != 0:
+            start = len(self.block_lines) * self.BLOCK_SIZE
+            lines_before = self.block_lines[-1] if self.block_lines else 0
+            self.block_lines.append(lines_before + self.count_newlines(start, start + self.BLOCK_SIZE))
+            if max_blocks:
+                max_blocks -= 1
+
+    def count_newlines(self, start, end):
+        # mmap has no count(); a slice of at most one block is a cheap copy
+        return self.map[start:end].count(b'\n')
+
+    def newlines_before_block(self, block):
+        return self.block_lines[block - 1] if block else 0
+
+    def line_count(self):
+        if not self.size:
+            return 0
+        self.extend()
+        block = len(self.block_lines)
+        newlines = self.newlines_before_block(block) + self.count_newlines(block * self.BLOCK_SIZE, self.size)
+        # A last line that has not been terminated (yet) is a line as well
+        return newlines + (0 if self.map[self.size - 1:self.size] == b'\n' else 1)
+
+    def line_offset(self, line):
+        if line <= 0 or not self.size:
+            return 0
+        # Line n starts right after the n-th newline, which is in the first block that ends with at least n newlines
+        while (not self.block_lines or self.block_lines[-1] < line) and not self.complete:
+            self.extend(max_blocks=64)
+        block = bisect_left(self.block_lines, line)
+        offset = block * self.BLOCK_SIZE
+        for _ in range(line - self.newlines_before_block(block)):
+            offset = self.map.find(b'\n', offset, self.size)
+            if offset == -1:
+                return self.size
+            offset += 1
+        return offset
+
+    def line_of_offset(self, offset):
+        if not self.size:
+            return 0
+        self.extend(until_offset=offset)
+        block = min(offset // self.BLOCK_SIZE, len(self.block_lines))
+        return self.newlines_before_block(block) + self.count_newlines(block * self.BLOCK_SIZE, offset)
+
+    def lines(self, offset, count):
+        lines = []
+        while len(lines) < count and offset < self.size:
+            end = self.map.find(b'\n', offset, self.size)
+            if end == -1:
+                end = self.size
+            lines.append(self.map[offset:end])
+            offset = end + 1
+        return lines
+
+# A full-screen pager for a spool file, opened with OPEN_SPOOL_KEY on the last run of the focused button.
+# Only the lines on screen are ever read from the file; the index is completed in the background, and the file is checked for new output every second, following it while the view is at the end.
+class SpoolPager(urwid.WidgetWrap):
+    HELP = 'up/down, page up/down: scroll  g/G: top/end  /: search  n/N: next/previous match  q/esc: close'
+    INDEX_BLOCKS_PER_STEP = 256
+    FOLLOW_INTERVAL = 1
+
+    def __init__(self, path, on_close):
+        self.index = SpoolIndex(path)
+        self.on_close = on_close
+        self.top = 0
+        self.page_rows = 1
+        self.query = None
+        self.message = self.HELP
+        self.alarm_handle = None
+        self.body = urwid.Text('', wrap='clip')
+        self.header = urwid.Text('', wrap='clip')
+        self.footer = urwid.Text('', wrap='clip')
+        self.frame = urwid.Frame(urwid.Filler(self.body, 'top'), header=apply_markup(self.header, 'header'), footer=apply_markup(self.footer, 'status_line'))
+        super(SpoolPager, self).__init__(self.frame)
+        self.tick()
+
+    def tick(self):
+        # Index a few more blocks, and pick up new output of a command that is still running
+        at_end = self.at_end()
+        if self.index.remap() and at_end:
+            self.top = self.last_top()
+        self.index.extend(max_blocks=self.INDEX_BLOCKS_PER_STEP)
+        self.refresh()
+        self.alarm_handle = Config.loop.event_loop.alarm(0 if not self.index.complete else self.FOLLOW_INTERVAL, self.tick)
+
+    def close(self):
+        if self.alarm_handle:
+            Config.loop.event_loop.remove_alarm(self.alarm_handle)
+            self.alarm_handle = None
+        self.index.close()
+        self.on_close()
+
+    def last_top(self):
+        return max(self.index.line_count() - self.page_rows, 0)
+
+    def at_end(self):
+        return self.index.complete and self.top >= self.last_top()
+
+    def refresh(self):
+        lines = self.index.lines(self.index.line_offset(self.top), self.page_rows)
+        self.body.set_text('\n'.join(line.decode('utf-8', errors='replace').expandtabs() for line in lines))
+        if self.index.complete:
+            position = f"""lines {self.top + 1}-{self.top + len(lines)} of {self.index.line_count()}"""
+        else:
+            position = f"""line {self.top + 1}, indexing {len(self.index.block_lines) * self.index.BLOCK_SIZE * 100 // max(self.index.size, 1)}%"""
+        self.header.set_text(f"""{self.index.path} ({self.index.size} bytes), {position}""")
+        self.footer.set_text(self.message)
+
+    def render(self, size, focus=False):
+        page_rows = max(size[1] - 2, 1)
+        if page_rows != self.page_rows:
+            self.page_rows = page_rows
+            self.refresh()
+        return super(SpoolPager, self).render(size, focus)
+
+    def scroll_to(self, top):
+        self.top = max(min(top, self.last_top()), 0)
+        self.refresh()
+
+    def search(self, backwards=False):
+        if not self.query:
+            return
+        query = self.query.encode('utf-8')
+        if not self.index.size:
+            found = -1
+        elif backwards:
+            found = self.index.map.rfind(query, 0, self.index.line_offset(self.top))
+        else:
+            found = self.index.map.find(query, self.index.line_offset(self.top + 1))
+        if found == -1:
+            self.message = f"""Not found: {self.query}"""
+            self.refresh()
+        else:
+            self.message = self.HELP
+            self.top = self.index.line_of_offset(found)
+            self.refresh()
+
+    def keypress(self, size, key):
+        if self.frame.focus_position == 'footer':
+            if key == 'enter':
+                self.query = self.frame.footer.edit_text
+                self.end_prompt()
+                self.search()
+            elif key == 'esc':
+                self.end_prompt()
+            else:
+                self.frame.keypress(size, key)
+            return None
+        if key in ('q', 'Q', 'esc'):
+            self.close()
+        elif key in ('down', 'j'):
+            self.scroll_to(self.top + 1)
+        elif key in ('up', 'k'):
+            self.scroll_to(self.top - 1)
+        elif key in ('page down', ' '):
+            self.scroll_to(self.top + self.page_rows)
+        elif key in ('page up', 'b'):
+            self.scroll_to(self.top - self.page_rows)
+        elif key in ('home', 'g'):
+            self.scroll_to(0)
+        elif key in ('end', 'G'):
+            self.scroll_to(self.last_top())
+        elif key == '/':
+            self.frame.footer = urwid.Edit('/')
+            self.frame.focus_position = 'footer'
+        elif key == 'n':
+            self.search()
+        elif key == 'N':
+            self.search(backwards=True)
+        # The pager is modal: no key reaches the launcher behind it
+        return None
+
+    def end_prompt(self):
+        self.frame.footer = apply_markup(self.footer, 'status_line')
+        self.frame.focus_position = 'body'
+
+def open_spool_pager():
+    command_key = focused_command_key()
+    if command_key is None or not Config.spool:
+        return
+    path = Config.spool.latest(command_key)
+    if path is None:
+        Config.status_text = f"""No output of {command_key} has been spooled yet"""
+        update_status_line()
+        return
+    Config.loop.widget = SpoolPager(path, on_close=close_spool_pager)
+
+def close_spool_pager():
+    Config.loop.widget = Config.pile
+
+# The command palette, opened with COMMAND_PALETTE_KEY: all commands, filtered as you type, best matches first.
+# Enter runs the selected command the same way as clicking its button; Esc closes the palette.
+class CommandPalette(urwid.WidgetWrap):
+    def __init__(self, index, on_select, on_close, limit=50):
+        self.index = index
+        self.on_select = on_select
+        self.on_close = on_close
+        self.limit = limit
+        self.query = urwid.Edit('> ')
+        self.results = urwid.SimpleFocusListWalker([])
+        self.summary = urwid.Text('', wrap='clip')
+        self.frame = urwid.Frame(
+            urwid.ListBox(self.results),
+            header=urwid.Pile([apply_markup(self.query, 'header'), apply_markup(self.summary, 'status_line')]),
+        )
+        urwid.connect_signal(self.query, 'postchange', lambda *_: self.refresh())
+        super(CommandPalette, self).__init__(urwid.LineBox(self.frame, title='Commands'))
+        self.refresh()
+
+    def refresh(self):
+        match_count, command_keys = self.index.top(self.query.edit_text, self.limit)
+        self.results[:] = [urwid.AttrMap(urwid.SelectableIcon(command_key, 0), 'button', 'focused_button') for command_key in command_keys]
+        if self.results:
+            self.results.set_focus(0)
+        self.summary.set_text(f"""{match_count} of {len(self.index.keys)} commands""")
+
+    def selected(self):
+        if not self.results:
+            return None
+        return self.results.get_focus()[0].original_widget.text
+
+    def keypress(self, size, key):
+        if key == 'esc':
+            self.on_close()
+        elif key == 'enter':
+            command_key = self.selected()
+            self.on_close()
+            if command_key is not None:
+                self.on_select(command_key)
+        elif key in ('up', 'down', 'page up', 'page down'):
+            return super(CommandPalette, self).keypress(size, key)
+        else:
+            # The result list has the focus, to show the selection; everything else is typed into the query
+            self.query.keypress((size[0] - 2,), key)
+        return None
+
+def command_palette_index():
+    if getattr(Config, 'command_palette_index', None) is None:
+        Config.command_palette_index = FuzzyCommandIndex(Config.commands, Config.recent_commands)
+    return Config.command_palette_index
+
+def remember_command(command_key):
+    Config.recent_commands.pop(command_key, None)
+    Config.recent_commands[command_key] = True
+    while len(Config.recent_commands) > getattr(Config, 'RECENT_COMMANDS', 10):
+        Config.recent_commands.popitem(last=False)
+    if getattr(Config, 'command_palette_index', None) is not None:
+        Config.command_palette_index.set_recent(Config.recent_commands)
+
+def open_command_palette():
+    palette = CommandPalette(command_palette_index(), on_select=run_from_palette, on_close=close_command_palette)
+    Config.loop.widget = urwid.Overlay(palette, Config.pile, 'center', ('relative', 80), 'middle', ('relative', 80))
+
+def close_command_palette():
+    Config.loop.widget = Config.pile
+
+def button_position(command_key):
+    if command_key.endswith('_dynamic_label'):
+        return None
+    for row, button_row in enumerate(BUTTON_ROWS):
+        for index, item in enumerate(button_row):
+            if resolve_layout_item(item)[1] == command_key:
+                return (row, index)
+    return None
+
+def focus_button(position):
+    row, index = position
+    Config.grid.set_focus(row)
+    columns = Config.grid.body[row]
+    columns.focus_position = index
+    return columns.contents[index][0]
+
+def run_from_palette(command_key):
+    # As if the command's button was clicked, when it has one in the layout; it's focused and highlighted, and remembered as the active button
+    position = button_position(command_key) if Config.grid else None
+    if position is None:
+        run_command_key(command_key, Config.output_pane)
+    else:
+        on_button_click(focus_button(position))
+
+def activate_button(widget):
+    if 'activated_button' in Config.palette_keys:
+        if Config.active_widget:
+            Config.active_widget.set_focus_attr('focused_button')
+        widget.set_focus_attr('activated_button')
+    else:
+        warn("'activated_button' is missing from the PALETTE in your config.")
+    Config.active_widget = widget
+    Config.active_position = widget.position
+
+def handle_click(status_widget, command_output_widget, clicked_widget):
+    activate_button(clicked_widget)
+    run_command_key(clicked_widget.label, command_output_widget)
+
+# Everything a click does apart from highlighting the button, for the buttons as well as the command palette
+def run_command_key(command_key, command_output_widget):
+    Config.status_text = f"""Last clicked: {command_key}"""
+    update_status_line()
+    if Config.metrics:
+        Config.metrics.click(command_key)
+    remember_command(command_key)
+    if Config.state_file:
+        Config.state_file.changed()
+
+    try:
+        if Config.attached:
+            Config.attached.send(type='click', key=command_key)
+        else:
+            run_button_command(command_key, lambda label: functools.partial(command_output_widget.feed, label))
+    except Exception as inst:
+        logger.error(format_exception(f"""Error handling click:""", inst))
+
+# Runs the command of a button, or the steps of a macro; output_for(label) returns the output callback for the command with that label.
+def run_button_command(command_key, output_for, on_exit=None):
+    if is_macro(command_key):
+        return run_macro(command_key, output_for)
+    on_output = output_for(command_key)
+    spool_file = Config.spool.open(command_key) if Config.spool else None
+    if spool_file is None:
+        return spawn_command(command_key, on_output, on_exit)
+
+    def exited(returncode):
+        spool_file.close(returncode)
+        if on_exit:
+            on_exit(returncode)
+    try:
+        entry = spawn_command(command_key, tee_output(spool_file.write, on_output), exited)
+    except BaseException:
+        # E.g. a list command whose executable doesn't exist; the spool file would otherwise stay open, and be kept by the retention forever
+        spool_file.discard()
+        raise
+    if entry is None:
+        spool_file.discard()
+    return entry
+
+# Macros are commands whose value is a dict of 'steps': each step is a command key, mapped to the steps it depends on.
+# A step starts once all of its dependencies succeeded, with at most 'parallelism' (MACRO_PARALLELISM) steps running at the same time. When a step fails, 'on_failure': 'stop' (the default) starts no further steps, while 'continue' only skips the steps that depend on the failed one.
+# Steps run like clicked buttons (with the same limits, timeouts, cache and spool); their progress and the total time are reported in the output pane under the macro's label.
+class MacroRun():
+    def __init__(self, macro_key, macro, output_for):
+        self.macro_key = macro_key
+        self.output_for = output_for
+        self.report = output_for(macro_key)
+        self.steps = list(macro['steps'])
+        self.parallelism = macro.get('parallelism', getattr(Config, 'MACRO_PARALLELISM', 4))
+        self.stop_on_failure = macro.get('on_failure', 'stop') == 'stop'
+        self.dependents = {step: [] for step in self.steps}
+        self.waiting_for = {}
+        for step, dependencies in macro['steps'].items():
+            self.waiting_for[step] = len(dependencies)
+            for dependency in dependencies:
+                self.dependents[dependency].append(step)
+        self.ready = deque(step for step in self.steps if not self.waiting_for[step])
+        self.running = {}
+        self.started_at = {}
+        self.results = {}
+        self.stopped_by = None
+        self.run_started_at = time.monotonic()
+        self.finished_at = None
+
+    def progress(self, text):
+        self.report(f"""{text}\n""".encode('utf-8'))
+
+    def start(self):
+        self.progress(f"""started: {len(self.steps)} steps, {self.parallelism} at a time""")
+        self.fill()
+
+    def fill(self):
+        while self.ready and len(self.running) < self.parallelism and not self.stopped_by:
+            self.start_step(self.ready.popleft())
+        if not self.running and self.finished_at is None:
+            self.finish()
+        update_status_line()
+
+    def start_step(self, step):
+        if not isinstance(Config.commands.get(step), (str, list)):
+            # Removed from (or turned into a macro in) a reloaded config
+            self.step_done(step, 'failed', 'no longer a command')
+            return
+        self.started_at[step] = time.monotonic()
+        self.running[step] = None
+        self.progress(f"""{step}: started""")
+        try:
+            entry = run_button_command(step, self.output_for, functools.partial(self.step_exited, step))
+        except Exception as inst:
+            # E.g. a list command whose executable doesn't exist; without this the macro would never finish
+            logger.error(format_exception(f"""Error starting step {step} of {self.macro_key}:""", inst))
+            del self.running[step]
+            self.step_done(step, 'failed', f"""could not be started: {inst}""")
+            return
+        if entry is None:
+            del self.running[step]
+            self.step_done(step, 'failed', 'not started')
+        elif step in self.running:
+            self.running[step] = entry
+
+    def step_exited(self, step, returncode):
+        entry = self.running.pop(step, False)
+        if entry is False:
+            return
+        elapsed = time.monotonic() - self.started_at[step]
+        stopped_by = getattr(entry, 'stopped_by', None)
+        if returncode == 0:
+            self.step_done(step, 'succeeded', f"""succeeded in {elapsed:.2f}s""")
+        elif stopped_by:
+            self.step_done(step, 'failed', f"""{'timed out' if stopped_by == 'timeout' else stopped_by} after {elapsed:.2f}s""")
+        else:
+            self.step_done(step, 'failed', f"""failed with exit status {returncode} after {elapsed:.2f}s""")
+        self.fill()
+
+    def step_done(self, step, result, text):
+        self.results[step] = result
+        self.progress(f"""{step}: {text}""")
+        if result == 'succeeded':
+            for dependent in self.dependents[step]:
+                self.waiting_for[dependent] -= 1
+                if not self.waiting_for[dependent] and dependent not in self.results:
+                    self.ready.append(dependent)
+        elif self.stop_on_failure:
+            self.stopped_by = self.stopped_by or f"""{step} failed"""
+        else:
+            self.skip_dependents(step)
+
+    def skip_dependents(self, step):
+        for dependent in self.dependents[step]:
+            if dependent not in self.results:
+                self.results[dependent] = 'skipped'
+                self.progress(f"""{dependent}: skipped, as it depends on {step}""")
+                self.skip_dependents(dependent)
+
+    def cancel(self):
+        if self.stopped_by is None:
+            self.stopped_by = 'cancelled'
+        for entry in list(self.running.values()):
+            if isinstance(entry, SupervisedProcess):
+                Config.supervisor.stop(entry, 'cancelled')
+        return True
+
+    def finish(self):
+        self.finished_at = time.monotonic()
+        for step in self.steps:
+            self.results.setdefault(step, 'skipped')
+        counts = Counter(self.results.values())
+        summary = ', '.join(f"""{counts[result]} {result}""" for result in ('succeeded', 'failed', 'skipped') if counts[result])
+        stopped = f""" ({self.stopped_by})""" if self.stopped_by else ''
+        text = f"""finished in {self.finished_at - self.run_started_at:.2f}s{stopped}: {summary}"""
+        self.progress(text)
+        Config.macro_runs.pop(self.macro_key, None)
+        Config.status_text = f"""{self.macro_key} {text}"""
+
+    def summary(self):
+        return f"""{self.macro_key} [{len(self.results)}/{len(self.steps)}, {len(self.running)} running]"""
+
+def run_macro(macro_key, output_for):
+    if macro_key in Config.macro_runs:
+        Config.status_text = f"""Not starting {macro_key}: it is still running"""
+        update_status_line()
+        return None
+    macro_run = Config.macro_runs[macro_key] = MacroRun(macro_key, Config.commands[macro_key], output_for)
+    macro_run.start()
+    return macro_run
+
+def cancel_command(command_key):
+    if command_key in Config.macro_runs:
+        return Config.macro_runs[command_key].cancel()
+    return Config.supervisor.cancel(command_key)
+
+# Dynamic labels with an 'interval' in DYNAMIC_LABEL_OPTIONS run a one-shot command on that interval from the event loop, instead of being a shell that loops and sleeps forever.
+# A run is killed after 'timeout' seconds; after a failed run the interval is multiplied by 'backoff' for every consecutive failure (up to 'max_interval'), and up to 'jitter' random seconds are added to every interval.
+# With 'pause_when_hidden' (the default), runs are skipped while the label is not on screen.
+class LabelSchedule():
+    HIDDEN_RECHECK_INTERVAL = 1
+
+    def __init__(self, key, dynamic_label, interval, timeout=None, jitter=0, backoff=1, max_interval=None, pause_when_hidden=True):
+        self.key = key
+        self.dynamic_label = dynamic_label
+        self.interval = interval
+        self.timeout = timeout
+        self.jitter = jitter
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.pause_when_hidden = pause_when_hidden
+        self.failures = 0
+        self.entry = None
+        self.stopped = False
+        self.timed_out = False
+        self.output = []
+        self.alarm_handle = None
+        self.timeout_handle = None
+
+    def start(self, delay=0):
+        self.alarm_handle = Config.loop.event_loop.alarm(delay, self.run)
+
+    def next_delay(self):
+        delay = self.interval * (self.backoff ** self.failures)
+        if self.max_interval is not None:
+            delay = min(delay, self.max_interval)
+        return delay + random.uniform(0, self.jitter)
+
+    def run(self):
+        self.alarm_handle = None
+        if self.pause_when_hidden and not dynamic_label_visible(self.dynamic_label):
+            self.start(self.HIDDEN_RECHECK_INTERVAL)
+            return
+        self.output = []
+        self.timed_out = False
+        try:
+            self.entry = spawn_command(self.key, self.collect, self.finished)
+        except Exception as inst:
+            logger.error(format_exception(f"""Error running dynamic label {self.key}:""", inst))
+            self.entry = None
+        if self.entry is None:
+            self.failures += 1
+            self.start(self.next_delay())
+        elif self.timeout:
+            self.timeout_handle = Config.loop.event_loop.alarm(self.timeout, self.kill)
+
+    def collect(self, data, stream='stdout'):
+        if data:
+            self.output.append(data)
+
+    def stop(self):
+        self.stopped = True
+        for handle in (self.alarm_handle, self.timeout_handle):
+            if handle:
+                Config.loop.event_loop.remove_alarm(handle)
+        self.alarm_handle = self.timeout_handle = None
+        if self.entry:
+            abandon_command(self.entry, self.collect, self.finished)
+
+    def kill(self):
+        self.timeout_handle = None
+        if self.entry:
+            self.timed_out = True
+            if abandon_command(self.entry, self.collect, self.finished, signal.SIGKILL):
+                # The run goes on for the others that share it, but for this label it timed out
+                self.finished(None)
+
+    def finished(self, returncode):
+        self.entry = None
+        if self.stopped:
+            return
+        if self.timeout_handle:
+            Config.loop.event_loop.remove_alarm(self.timeout_handle)
+            self.timeout_handle = None
+        if returncode == 0 and not self.timed_out:
+            self.failures = 0
+        else:
+            self.failures += 1
+        data = b''.join(self.output)
+        if data:
+            # Parsed like the output of other labels (colours included, in the output pipeline), but with a buffer of its own for every run, so a last line without a newline doesn't carry over to the next run
+            self.dynamic_label['buffer'] = OutputBuffer()
+            refresh_widget(self.dynamic_label, data)
+        self.start(self.next_delay())
+
+def visible_widgets():
+    return Config.grid.visible_widgets() if Config.grid is not None else None
+
+def dynamic_label_visible(dynamic_label):
+    visible = visible_widgets()
+    # Until the grid has been rendered, a label counts as visible
+    return visible is None or dynamic_label['widget'] in visible
+
+def start_dynamic_label(label_key, dynamic_label):
+    if dynamic_label['schedule']:
+        dynamic_label['schedule'].run()
+        return
+    def exited(returncode):
+        dynamic_label['entry'] = None
+    try:
+        callback = functools.partial(refresh_widget, dynamic_label)
+        dynamic_label['callbacks'] = (callback, exited)
+        dynamic_label['entry'] = spawn_command(label_key, callback, exited)
+    except Exception as inst:
+        logger.error(format_exception(f"""Error handling dynamic label creation:""", inst))
+
+def stop_dynamic_label(dynamic_label):
+    # Output that is still on its way from the stopped process no longer reaches the widget
+    dynamic_label['retired'] = True
+    if dynamic_label['schedule']:
+        dynamic_label['schedule'].stop()
+    if dynamic_label['entry']:
+        abandon_command(dynamic_label['entry'], *dynamic_label['callbacks'])
+
+def register_dynamic_label(cmd_key, palette_formatter, label_widget=None):
+    if label_widget is None:
+        label_widget = apply_markup(urwid.Text(cmd_key), palette_formatter)
+    label_options = getattr(Config, 'DYNAMIC_LABEL_OPTIONS', {}).get(cmd_key, {})
+    cmd = Config.dynamic_labels[cmd_key] = {
+        'cmd': Config.commands[cmd_key],
+        'widget': label_widget,
+        'label_text': cmd_key,
+        'palette_formatter': palette_formatter,
+        'options': label_options,
+        'buffer': OutputBuffer(),
+        'text': cmd_key,
+        'max_refresh_rate': label_options.get('max_refresh_rate'),
+        'schedule': None,
+        'entry': None,
+        'callbacks': None,
+        'retired': False,
+    }
+    if label_options.get('interval'):
+        cmd['schedule'] = LabelSchedule(
+            cmd_key,
+            cmd,
+            label_options['interval'],
+            timeout=label_options.get('timeout'),
+            jitter=label_options.get('jitter', 0),
+            backoff=label_options.get('backoff', 1),
+            max_interval=label_options.get('max_interval'),
+            pause_when_hidden=label_options.get('pause_when_hidden', True),
+        )
+    return cmd
+
+# Dynamic labels are registered for the whole layout up front, so their commands run even while their row has not been built; rows that are (re)built reuse the registered widget.
+def register_dynamic_labels():
+    for button_row in BUTTON_ROWS:
+        for text in button_row:
+            palette_formatter, cmd_key = resolve_layout_item(text)
+            if cmd_key.endswith('_dynamic_label') and cmd_key not in Config.dynamic_labels:
+                register_dynamic_label(cmd_key, palette_formatter or 'dynamic_label')
+
+def create_column_item(text, onclick):
+    palette_formatter, cmd_key = resolve_layout_item(text)
+    if not palette_formatter:
+      palette_formatter = 'dynamic_label'
+    if cmd_key.endswith('_dynamic_label'):
+        dynamic_label = Config.dynamic_labels.get(cmd_key) or register_dynamic_label(cmd_key, palette_formatter)
+        return dynamic_label['widget']
+
+    return build_box_button(cmd_key, onclick)
+
+def on_button_click(widget):
+    handle_click(
+      status_widget=Config.status_widget,
+      command_output_widget=Config.output_pane,
+      clicked_widget=widget
+    )
+
+def build_button_row(position, button_row):
+    columns = urwid.Columns([])
+    for index, text in enumerate(button_row):
+        col_width = Config.column_widths.get(text)
+        if col_width is None:
+            col_opts = columns.options('weight', 1)
+        else:
+            col_opts = columns.options('given', col_width)
+        debug('col opts', col_opts, 'col width', col_width, 'text', text, len(text))
+        item = create_column_item(text, on_button_click)
+        if isinstance(item, BoxButton):
+            item.position = (position, index)
+            if item.position == Config.active_position:
+                # The clicked button's row was dropped and is now built again
+                item.set_focus_attr('activated_button')
+                Config.active_widget = item
+        columns.contents.append((item, col_opts))
+    return columns
+
+# Supplies the rows of the button grid by their index in BUTTON_ROWS. Rows are only built when the ListBox asks for them, i.e. in or near the viewport, and the ones farthest from the focus are dropped again once more than ROW_CACHE_SIZE have been built.
+class ButtonRowWalker(urwid.ListWalker):
+    ROW_CACHE_SIZE = 256
+
+    def __init__(self, button_rows, build_row=build_button_row):
+        self.button_rows = button_rows
+        self.build_row = build_row
+        self.rows = {}
+        self.focus = 0
+
+    def __len__(self):
+        return len(self.button_rows)
+
+    def __getitem__(self, position):
+        if not 0 <= position < len(self.button_rows):
+            raise IndexError(position)
+        row = self.rows.get(position)
+        if row is None:
+            row = self.rows[position] = self.build_row(position, self.button_rows[position])
+            if len(self.rows) > self.ROW_CACHE_SIZE:
+                self.drop_distant_rows()
+        return row
+
+    def drop_distant_rows(self):
+        distant = sorted(self.rows, key=lambda position: abs(position - self.focus), reverse=True)
+        for position in distant[:len(self.rows) - self.ROW_CACHE_SIZE // 2]:
+            del self.rows[position]
+
+    def next_position(self, position):
+        return position + 1
+
+    def prev_position(self, position):
+        if position <= 0:
+            raise IndexError(position)
+        return position - 1
+
+    def positions(self, reverse=False):
+        if reverse:
+            return range(len(self.button_rows) - 1, -1, -1)
+        return range(len(self.button_rows))
+
+    def set_focus(self, position):
+        self.focus = position
+        self._modified()
+
+    def update(self, button_rows, unchanged):
+        # unchanged maps the positions of the rows that are the same in the new layout to their position in the old one; only those keep their built widgets
+        rows = {}
+        for position, old_position in unchanged.items():
+            row = self.rows.get(old_position)
+            if row is None:
+                continue
+            rows[position] = row
+            if position != old_position:
+                for item, _ in row.contents:
+                    if isinstance(item, BoxButton):
+                        item.position = (position, item.position[1])
+        old_positions = {old_position: position for position, old_position in unchanged.items()}
+        self.button_rows = button_rows
+        self.rows = rows
+        self.focus = min(old_positions.get(self.focus, self.focus), max(len(button_rows) - 1, 0))
+        self._modified()
+
+# The scrollable button grid; it remembers the size it was last rendered at, to tell which rows and widgets are on screen.
+class ButtonGrid(urwid.ListBox):
+    def __init__(self, button_rows):
+        super(ButtonGrid, self).__init__(ButtonRowWalker(button_rows))
+        self.last_size = None
+
+    def render(self, size, focus=False):
+        self.last_size = size
+        return super(ButtonGrid, self).render(size, focus)
+
+    def visible_widgets(self):
+        if self.last_size is None:
+            return None
+        visible = set()
+        middle, top, bottom = self.calculate_visible(self.last_size)
+        if middle is None:
+            return visible
+        rows = [middle[1]] + [row for row, _, _ in top[1]] + [row for row, _, _ in bottom[1]]
+        for row in rows:
+            visible.add(row)
+            visible.update(column_widget for column_widget, _ in row.contents)
+        return visible
+
+def apply_markup(widget, markup_name, focus_markup_name=None):
+    if not markup_name in Config.palette_keys:
+        warn(f"""'{markup_name}' is missing from the PALETTE in your config.""")
+    if focus_markup_name and (focus_markup_name not in Config.palette_keys):
+        warn(f"""'{focus_markup_name}' is missing from the PALETTE in your config.""")
+    return urwid.AttrMap(widget, markup_name, focus_markup_name)
+
+def build_interface():
+    if args.header_text and args.header_text[0]:
+      header_text = args.header_text[0]
+    else:
+      header_text = Config.HEADER_TEXT
+
+    if args.footer_text and args.footer_text[0]:
+      footer_text = args.footer_text[0]
+    else:
+      footer_text = Config.FOOTER_TEXT
+
+    header = apply_markup(urwid.Text(header_text), 'header')
+    footer = apply_markup(urwid.Text(footer_text), 'footer')
+    status_widget = apply_markup(urwid.Text(''), 'status_line')
+    Config.status_widget = status_widget.original_widget
+    command_output = apply_markup(urwid.Text(''), 'command_output')
+    Config.output_pane = OutputPane(
+        command_output.original_widget,
+        visible_lines=getattr(Config, 'OUTPUT_VISIBLE_LINES', 10),
+        scrollback_lines=getattr(Config, 'OUTPUT_SCROLLBACK_LINES', 1000),
+    )
+    displayed_widgets = []
+
+    if args.header_text or not Config.HIDE_HEADER:
+        displayed_widgets.append(('pack', header))
+
+    register_dynamic_labels()
+    Config.grid = ButtonGrid(BUTTON_ROWS)
+    displayed_widgets.append(Config.grid)
+
+    Config.stats_widget = apply_markup(urwid.Text(''), 'stats')
+    if getattr(Config, 'SHOW_STATS', False):
+        displayed_widgets.append(('pack', Config.stats_widget))
+
+    if not Config.HIDE_STATUS_LINE:
+        displayed_widgets.append(('pack', status_widget))
+
+    if not Config.HIDE_COMMAND_OUTPUT:
+        displayed_widgets.append(('pack', command_output))
+
+    if args.footer_text or not Config.HIDE_FOOTER:
+        displayed_widgets.append(('pack', footer))
+
+    Config.pile = urwid.Pile(displayed_widgets)
+    Config.pile.focus_position = displayed_widgets.index(Config.grid)
+    return Config.pile
+
+# Hot reload: with RELOAD_ON_CHANGE, the config module and the layout file are watched, and the launcher picks up changes without restarting.
+# The new layout is diffed against the current BUTTON_ROWS, and only the rows that differ are built again. Dynamic labels whose command and options are the same keep running; only new and changed ones are (re)started, and removed ones are stopped. Running commands are left alone.
+# Settings that are only read at startup (such as EVENT_LOOP and SHELL_POOL_SIZE, and the header and footer) still need a restart.
+class FileWatcher():
+    # From <sys/inotify.h>
+    IN_MODIFY = 0x2
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_NONBLOCK = 0o4000
+    IN_CLOEXEC = 0o2000000
+    EVENT_HEADER = struct.Struct('iIII')
+
+    def __init__(self, paths, event_loop, on_change, poll_interval=1, settle_time=0.2):
+        self.paths = {Path(path).resolve() for path in paths}
+        self.event_loop = event_loop
+        self.on_change = on_change
+        self.poll_interval = poll_interval
+        # Editors write files in several steps; a change is only reported once the events have stopped for this long
+        self.settle_time = settle_time
+        self.settle_handle = None
+        self.poll_handle = None
+        self.directories = {}
+        self.fd = self.watch_inotify()
+        if self.fd is None:
+            self.stats = self.stat_all()
+            self.poll_handle = event_loop.alarm(poll_interval, self.poll)
+        else:
+            event_loop.watch_file(self.fd, self.read_events)
+
+    def watch_inotify(self):
+        # Directories are watched rather than the files themselves, as most editors save by renaming a new file over the old one
+        if not hasattr(ctypes, 'CDLL'):
+            return None
+        try:
+            libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            fd = libc.inotify_init1(self.IN_NONBLOCK | self.IN_CLOEXEC)
+        except (OSError, AttributeError, TypeError):
+            return None
+        if fd < 0:
+            return None
+        for directory in {path.parent for path in self.paths}:
+            watch = libc.inotify_add_watch(fd, str(directory).encode(), self.IN_MODIFY | self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_CREATE)
+            if watch < 0:
+                close(fd)
+                return None
+            self.directories[watch] = directory
+        return fd
+
+    def read_events(self):
+        try:
+            data = os_read(self.fd, 65536)
+        except BlockingIOError:
+            return
+        offset = 0
+        changed = False
+        while offset + self.EVENT_HEADER.size <= len(data):
+            watch, mask, cookie, length = self.EVENT_HEADER.unpack_from(data, offset)
+            offset += self.EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            directory = self.directories.get(watch)
+            if directory is not None and directory / name.decode(errors='surrogateescape') in self.paths:
+                changed = True
+        if changed:
+            self.settle()
+
+    def stat_all(self):
+        stats = {}
+        for path in self.paths:
+            try:
+                stat = path.stat()
+                stats[path] = (stat.st_mtime_ns, stat.st_size)
+            except OSError:
+                stats[path] = None
+        return stats
+
+    def poll(self):
+        stats = self.stat_all()
+        if stats != self.stats:
+            self.stats = stats
+            self.settle()
+        self.poll_handle = self.event_loop.alarm(self.poll_interval, self.poll)
+
+    def settle(self):
+        if self.settle_handle:
+            self.event_loop.remove_alarm(self.settle_handle)
+        self.settle_handle = self.event_loop.alarm(self.settle_time, self.changed)
+
+    def changed(self):
+        self.settle_handle = None
+        self.on_change()
+
+    def stop(self):
+        for handle in (self.settle_handle, self.poll_handle):
+            if handle:
+                self.event_loop.remove_alarm(handle)
+        self.settle_handle = self.poll_handle = None
+        if self.fd is not None:
+            self.event_loop.remove_watch_file(self.fd)
+            close(self.fd)
+            self.fd = None
+
+def watched_config_files():
+    return [config_source] + ([Config.layout_file] if Config.layout_file else [])
+
+def config_file_hashes():
+    return [source_fingerprint(path)['sha256'] if Path(path).exists() else None for path in watched_config_files()]
+
+def watch_config_files():
+    Config.reloaded_sources = config_file_hashes()
+    Config.watcher = FileWatcher(watched_config_files(), Config.loop.event_loop, reload_config, poll_interval=getattr(Config, 'RELOAD_POLL_INTERVAL', 1))
+
+def layout_signature():
+    # A change to any of these changes every button
+    return (repr(Config.VERTICAL_PADDING), repr(Config.HORIZONTAL_PADDING), tuple(sorted(vars(Config.borders).items())))
+
+def row_signature(button_row):
+    return tuple((item, resolve_layout_item(item), Config.column_widths.get(item)) for item in button_row)
+
+def load_config_module():
+    spec = importlib.util.spec_from_file_location(module_name, config_source)
+    config = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(config)
+    return config
+
+def reload_config():
+    global Config, BUTTON_ROWS
+    old_config, old_rows = Config, BUTTON_ROWS
+    if config_file_hashes() == Config.reloaded_sources:
+        # Touched, or saved without changes
+        return
+    old_layout = layout_signature()
+    old_signatures = [row_signature(button_row) for button_row in old_rows]
+    warnings_start = len(warnings)
+    try:
+        Config, BUTTON_ROWS = load_config_module(), []
+        set_layout_file()
+        compile_config()
+    except (Exception, SystemExit) as inst:
+        Config, BUTTON_ROWS = old_config, old_rows
+        del warnings[warnings_start:]
+        Config.status_text = f"""Not reloading {config_path}: {inst}"""
+        update_status_line()
+        return
+    for name in RUNTIME_CONFIG_ATTRIBUTES:
+        # The new config has its own borders and command index
+        if name not in vars(Config) and name not in ('borders', 'command_index', 'command_palette_index'):
+            setattr(Config, name, getattr(old_config, name))
+    Config.reloaded_sources = config_file_hashes()
+
+    if Config.PALETTE != old_config.PALETTE:
+        Config.loop.screen.register_palette(Config.PALETTE)
+        Config.loop.screen.clear()
+    apply_supervisor_settings()
+    restarted = reload_dynamic_labels()
+
+    unchanged = {}
+    if layout_signature() == old_layout:
+        new_signatures = [row_signature(button_row) for button_row in BUTTON_ROWS]
+        for old_start, new_start, length in difflib.SequenceMatcher(None, old_signatures, new_signatures, autojunk=False).get_matching_blocks():
+            unchanged.update((new_start + offset, old_start + offset) for offset in range(length))
+    old_positions = {old_position: position for position, old_position in unchanged.items()}
+    if Config.active_position is not None:
+        row_position = old_positions.get(Config.active_position[0])
+        Config.active_position = None if row_position is None else (row_position, Config.active_position[1])
+        if Config.active_position is None:
+            Config.active_widget = None
+    if Config.grid is not None:
+        Config.grid.body.update(BUTTON_ROWS, unchanged)
+    if Config.watcher and {Path(path).resolve() for path in watched_config_files()} != Config.watcher.paths:
+        # The config now uses another layout file
+        Config.watcher.stop()
+        watch_config_files()
+    Config.status_text = f"""Reloaded {config_path}: {len(BUTTON_ROWS) - len(unchanged)} of {len(BUTTON_ROWS)} rows rebuilt, {restarted} dynamic labels (re)started"""
+    update_status_line()
+
+def apply_supervisor_settings():
+    if Config.supervisor is None:
+        return
+    Config.supervisor.max_processes = getattr(Config, 'MAX_PROCESSES', None)
+    Config.supervisor.max_processes_per_command = getattr(Config, 'MAX_PROCESSES_PER_COMMAND', None)
+    Config.supervisor.process_limits = getattr(Config, 'PROCESS_LIMITS', None) or {}
+    Config.supervisor.command_timeout = getattr(Config, 'COMMAND_TIMEOUT', None)
+    Config.supervisor.command_timeouts = getattr(Config, 'COMMAND_TIMEOUTS', None) or {}
+
+def reload_dynamic_labels():
+    wanted = {}
+    for button_row in BUTTON_ROWS:
+        for item in button_row:
+            palette_formatter, cmd_key = resolve_layout_item(item)
+            if cmd_key.endswith('_dynamic_label'):
+                wanted.setdefault(cmd_key, palette_formatter or 'dynamic_label')
+    started = []
+    for cmd_key, dynamic_label in list(Config.dynamic_labels.items()):
+        palette_formatter = wanted.get(cmd_key)
+        if palette_formatter is None:
+            stop_dynamic_label(dynamic_label)
+            del Config.dynamic_labels[cmd_key]
+            continue
+        if palette_formatter != dynamic_label['palette_formatter']:
+            dynamic_label['widget'].set_attr_map({None: palette_formatter})
+            dynamic_label['palette_formatter'] = palette_formatter
+        if Config.commands[cmd_key] != dynamic_label['cmd'] or getattr(Config, 'DYNAMIC_LABEL_OPTIONS', {}).get(cmd_key, {}) != dynamic_label['options']:
+            stop_dynamic_label(dynamic_label)
+            # The widget stays, so the rows showing it don't need to be built again
+            started.append(register_dynamic_label(cmd_key, palette_formatter, dynamic_label['widget']))
+    for cmd_key, palette_formatter in wanted.items():
+        if cmd_key not in Config.dynamic_labels:
+            started.append(register_dynamic_label(cmd_key, palette_formatter))
+    # An attached interface leaves running the labels to the daemon
+    if Config.supervisor:
+        stagger = getattr(Config, 'DYNAMIC_LABEL_STAGGER', 0.05)
+        for index, dynamic_label in enumerate(started):
+            Config.loop.event_loop.alarm(index * stagger, functools.partial(start_dynamic_label, dynamic_label['label_text'], dynamic_label))
+    return len(started)
+
+# Daemon mode (--daemon): a single launcher runs the commands and dynamic labels, and any number of TUIs started with --attach show them.
+# Client and daemon exchange lines of JSON over a Unix socket. An attaching client is sent a snapshot of the labels, the output pane and the status line, and from then on every change as it happens: each message is encoded once and queued for all clients, and the queues are written out once per event loop iteration.
+# A client that stops reading is disconnected once more than DAEMON_CLIENT_BUFFER bytes are queued for it, rather than holding up the daemon; it gets a fresh snapshot when it attaches again.
+def daemon_socket_path():
+    if args.socket:
+        return Path(args.socket)
+    if getattr(Config, 'DAEMON_SOCKET', None):
+        return Path(Config.DAEMON_SOCKET)
+    directory = Path(getenv('XDG_RUNTIME_DIR')) if getenv('XDG_RUNTIME_DIR') else private_temp_directory()
+    return directory / f"""tui_launcher-{module_name}.sock"""
+
+# Anyone can create the directory in /tmp before we do, e.g. as a symlink to a directory of theirs, so it's only used when it's a real directory of ours that nobody else can get into
+def private_temp_directory():
+    directory = Path(tempfile.gettempdir()) / f"""tui_launcher-{getuid()}"""
+    try:
+        directory.mkdir(mode=0o700, exist_ok=True)
+        status = lstat(directory)
+    except OSError as inst:
+        exit(format_exception(f"""Could not create the directory {directory} for the daemon socket""", inst))
+    if not S_ISDIR(status.st_mode) or status.st_uid != getuid() or status.st_mode & 0o077:
+        exit(f"""Refusing to use {directory} for the daemon socket: it has to be a directory owned by you that only you can access; remove it, or set XDG_RUNTIME_DIR or DAEMON_SOCKET""")
+    return directory
+
+def encode_message(message):
+    return json.dumps(message, separators=(',', ':')).encode('utf-8') + b'\n'
+
+def decode_messages(buffered, data):
+    lines = (buffered + data).split(b'\n')
+    messages = []
+    for line in lines[:-1]:
+        try:
+            message = json.loads(line)
+        except ValueError as inst:
+            logger.warning(format_exception(f"""Ignoring an invalid daemon message""", inst))
+            continue
+        # Valid JSON that isn't an object, e.g. [] or 1, is not a message either
+        if not isinstance(message, dict):
+            logger.warning(f"""Ignoring a daemon message that is not an object: {line[:100]!r}""")
+            continue
+        messages.append(message)
+    return messages, lines[-1]
+
+class DaemonClient():
+    def __init__(self, sock):
+        self.sock = sock
+        self.incoming = b''
+        self.outgoing = bytearray()
+
+class LauncherDaemon():
+    READ_SIZE = 65536
+
+    def __init__(self, path, event_loop, max_client_buffer=4 * 1024 * 1024):
+        self.path = path
+        self.event_loop = event_loop
+        self.max_client_buffer = max_client_buffer
+        self.clients = {}
+        self.flush_handle = None
+        self.stats = ''
+        self.stats_handle = None
+        self.server = self.listen()
+        event_loop.watch_file(self.server.fileno(), self.accept)
+
+    def listen(self):
+        if self.path.exists():
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(str(self.path))
+            except OSError:
+                # Left behind by a daemon that did not shut down
+                self.path.unlink()
+            else:
+                exit(f"""A launcher daemon is already listening on {self.path}""")
+            finally:
+                probe.close()
+        self.path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(str(self.path))
+        chmod(self.path, 0o600)
+        server.listen()
+        server.setblocking(False)
+        return server
+
+    def accept(self):
+        try:
+            sock, _ = self.server.accept()
+        except BlockingIOError:
+            return
+        sock.setblocking(False)
+        client = self.clients[sock.fileno()] = DaemonClient(sock)
+        self.event_loop.watch_file(sock.fileno(), functools.partial(self.receive, client))
+        self.queue(client, encode_message(self.snapshot()))
+
+    def snapshot(self):
+        return {
+            'type': 'snapshot',
+            'labels': {label_key: dynamic_label['text'] for label_key, dynamic_label in Config.dynamic_labels.items()},
+            'output': Config.output_pane.snapshot(),
+            'status': Config.status_widget.text,
+            'stats': self.stats,
+        }
+
+    def receive(self, client):
+        try:
+            data = client.sock.recv(self.READ_SIZE)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.disconnect(client)
+            return
+        messages, client.incoming = decode_messages(client.incoming, data)
+        for message in messages:
+            self.handle(client, message)
+
+    def handle(self, client, message):
+        command_key = message.get('key')
+        if not isinstance(command_key, str) or command_key not in Config.commands:
+            return
+        if message.get('type') == 'click':
+            if Config.metrics:
+                Config.metrics.click(command_key)
+            try:
+                run_button_command(command_key, self.output_for)
+            except Exception as inst:
+                logger.error(format_exception(f"""Error handling click:""", inst))
+        elif message.get('type') == 'cancel' and not cancel_command(command_key):
+            self.queue(client, encode_message({'type': 'notice', 'text': f"""{command_key} is not running"""}))
+
+    def output_for(self, command_key):
+        return tee_output(functools.partial(Config.output_pane.feed, command_key), functools.partial(self.output, command_key))
+
+    def output(self, command_key, data, stream='stdout'):
+        self.broadcast(type='output', key=command_key, stream=stream, data=base64.b64encode(data).decode('ascii'))
+
+    def stats_changed(self):
+        # Like the stats panel, refreshed at most once a second
+        if self.stats_handle is None:
+            self.stats_handle = self.event_loop.alarm(1, self.send_stats)
+
+    def send_stats(self):
+        self.stats_handle = None
+        self.stats = Config.metrics.table(getattr(Config, 'STATS_LINES', 10))
+        self.broadcast(type='stats', text=self.stats)
+
+    def broadcast(self, **message):
+        if not self.clients:
+            return
+        data = encode_message(message)
+        for client in list(self.clients.values()):
+            self.queue(client, data)
+
+    def queue(self, client, data):
+        client.outgoing += data
+        if len(client.outgoing) > self.max_client_buffer:
+            logger.warning(f"""Disconnecting a client that has {len(client.outgoing)} bytes of updates waiting""")
+            self.disconnect(client)
+        elif self.flush_handle is None:
+            self.flush_handle = self.event_loop.alarm(0, self.flush)
+
+    def flush(self):
+        self.flush_handle = None
+        for client in list(self.clients.values()):
+            if not client.outgoing:
+                continue
+            try:
+                sent = client.sock.send(client.outgoing)
+            except BlockingIOError:
+                sent = 0
+            except OSError:
+                self.disconnect(client)
+                continue
+            del client.outgoing[:sent]
+        if any(client.outgoing for client in self.clients.values()):
+            # A client's socket buffer is full; try again shortly
+            self.flush_handle = self.event_loop.alarm(0.05, self.flush)
+
+    def disconnect(self, client):
+        self.event_loop.remove_watch_file(client.sock.fileno())
+        self.clients.pop(client.sock.fileno(), None)
+        client.sock.close()
+
+    def shutdown(self):
+        for client in list(self.clients.values()):
+            self.disconnect(client)
+        self.event_loop.remove_watch_file(self.server.fileno())
+        self.server.close()
+        self.path.unlink(missing_ok=True)
+
+# The client side of daemon mode: button presses and cancels are sent to the daemon, and the labels, output and status it sends are shown.
+# When the connection is lost, the client keeps trying to attach again, and starts over from the snapshot it then gets.
+class DaemonConnection():
+    READ_SIZE = 65536
+    RECONNECT_INTERVAL = 1
+
+    def __init__(self, path, event_loop):
+        self.path = path
+        self.event_loop = event_loop
+        self.sock = None
+        self.incoming = b''
+        self.status = ''
+        self.stats = ''
+        self.connect()
+
+    def connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(str(self.path))
+        except OSError:
+            sock.close()
+            return False
+        self.sock = sock
+        self.incoming = b''
+        self.event_loop.watch_file(sock.fileno(), self.receive)
+        return True
+
+    def reconnect(self):
+        if not self.connect():
+            self.event_loop.alarm(self.RECONNECT_INTERVAL, self.reconnect)
+
+    def disconnected(self):
+        self.event_loop.remove_watch_file(self.sock.fileno())
+        self.sock.close()
+        self.sock = None
+        self.status = f"""Lost the connection to the launcher daemon at {self.path}; reattaching"""
+        update_status_line()
+        self.event_loop.alarm(self.RECONNECT_INTERVAL, self.reconnect)
+
+    def send(self, **message):
+        if self.sock is None:
+            Config.status_text = 'Not attached to the launcher daemon'
+            update_status_line()
+            return
+        try:
+            self.sock.sendall(encode_message(message))
+        except OSError:
+            self.disconnected()
+
+    def receive(self):
+        try:
+            data = self.sock.recv(self.READ_SIZE)
+        except OSError:
+            data = b''
+        if not data:
+            self.disconnected()
+            return
+        messages, self.incoming = decode_messages(self.incoming, data)
+        for message in messages:
+            self.handle(message)
+
+    def handle(self, message):
+        kind = message.get('type')
+        if kind == 'snapshot':
+            for label_key, text in message['labels'].items():
+                if label_key in Config.dynamic_labels:
+                    set_label_text(Config.dynamic_labels[label_key], markup_from_json(text))
+            Config.output_pane.restore(message['output'])
+            self.status = message['status']
+            self.stats = message['stats']
+            update_status_line()
+            refresh_stats()
+        elif kind == 'label' and message['key'] in Config.dynamic_labels:
+            set_label_text(Config.dynamic_labels[message['key']], markup_from_json(message['text']))
+        elif kind == 'output':
+            Config.output_pane.feed(message['key'], base64.b64decode(message['data']), message['stream'])
+        elif kind == 'status':
+            self.status = message['text']
+            update_status_line()
+        elif kind == 'stats':
+            self.stats = message['text']
+            schedule_stats_refresh()
+        elif kind == 'notice':
+            Config.status_text = message['text']
+            update_status_line()
+
+def stop_daemon(signum=None, frame=None):
+    raise urwid.ExitMainLoop()
+
+# Once the main loop has returned, another signal must not interrupt the shutdown halfway, e.g. with an ExitMainLoop that nothing catches anymore
+def ignore_stop_signals(asyncio_loop=None):
+    for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+        if asyncio_loop:
+            asyncio_loop.remove_signal_handler(signum)
+        signal.signal(signum, signal.SIG_IGN)
+
+# Everything that runs commands: in the launcher itself, or in the daemon; an attached client leaves all of this to the daemon.
+def start_services(asyncio_loop=None):
+    Config.metrics = MetricsStore(on_change=Config.daemon.stats_changed if Config.daemon else schedule_stats_refresh)
+    if Config.spool:
+        Config.spool.enforce_retention()
+    supervisor_options = dict(
+        max_processes=getattr(Config, 'MAX_PROCESSES', None),
+        max_processes_per_command=getattr(Config, 'MAX_PROCESSES_PER_COMMAND', None),
+        process_limits=getattr(Config, 'PROCESS_LIMITS', None),
+        command_timeout=getattr(Config, 'COMMAND_TIMEOUT', None),
+        command_timeouts=getattr(Config, 'COMMAND_TIMEOUTS', None),
+        on_change=update_status_line,
+        on_stop=report_stopped,
+        metrics=Config.metrics,
+    )
+    if getattr(Config, 'SHELL_POOL_SIZE', 0) and not asyncio_loop:
+        supervisor_options['shell_pool'] = ShellPool(Config.loop.event_loop, Config.SHELL_POOL_SIZE, max_jobs=getattr(Config, 'SHELL_POOL_MAX_JOBS', 100))
+    if asyncio_loop:
+        Config.supervisor = AsyncioProcessSupervisor(asyncio_loop, Config.loop.event_loop, **supervisor_options)
+    else:
+        Config.supervisor = ProcessSupervisor(Config.loop.event_loop, **supervisor_options)
+    if getattr(Config, 'RESULT_CACHE_TTL', None):
+        Config.result_cache = ResultCache(Config.loop.event_loop, Config.RESULT_CACHE_TTL, size=getattr(Config, 'RESULT_CACHE_SIZE', 32))
+    # Spread the start of the dynamic labels, rather than spawning all of them at once
+    stagger = getattr(Config, 'DYNAMIC_LABEL_STAGGER', 0.05)
+    for index, (label_key, dynamic_label) in enumerate(Config.dynamic_labels.items()):
+        Config.loop.event_loop.alarm(index * stagger, functools.partial(start_dynamic_label, label_key, dynamic_label))
+    if getattr(Config, 'METRICS_FILE', None):
+        Config.loop.event_loop.alarm(getattr(Config, 'METRICS_EXPORT_INTERVAL', 10), export_metrics_periodically)
+
+def benchmark_find_command(command_count=10000, lookup_count=1000):
+    def linear_find_command(commands, command_key):
+        test_key = command_key.lower()
+        for key in commands.keys():
+            if test_key in key.lower():
+                return key
+
+    words = ['Play', 'Pause', 'Stop', 'Skip', 'Rewind', 'Explore', 'Fetch', 'Deploy', 'Watch', 'Tail']
+    commands = {f"""{words[i % len(words)]} item {i:05d}""": f"""echo {i}""" for i in range(command_count)}
+    step = max(command_count // lookup_count, 1)
+    lookups = [f"""item {i:05d}""" for i in range(0, command_count, step)][:lookup_count]
+
+    started = time.perf_counter()
+    expected = [linear_find_command(commands, lookup) for lookup in lookups]
+    linear_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    index = CommandIndex(commands)
+    build_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    found = [index.find(lookup) for lookup in lookups]
+    indexed_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    memoized = [index.find(lookup) for lookup in lookups]
+    memoized_seconds = time.perf_counter() - started
+    if found != expected or memoized != expected:
+        raise AssertionError('CommandIndex results differ from the linear scan')
+
+    return {
+        'commands': command_count,
+        'lookups': len(lookups),
+        'linear_scan_ms': linear_seconds * 1000,
+        'index_build_ms': build_seconds * 1000,
+        'indexed_lookup_ms': indexed_seconds * 1000,
+        'memoized_lookup_ms': memoized_seconds * 1000,
+        'speedup': linear_seconds / max(indexed_seconds, 1e-9),
+    }
+
+BENCHMARK_LABELS = {
+    'plain': lambda index: f"""Command {index:06d}""",
+    'wide': lambda index: f"""コマンド {index:06d}""",
+    'emoji': lambda index: f"""🚀 Command {index:06d} 🇳🇱""",
+    'zwj': lambda index: f"""👩🏽‍💻 Command {index:06d} 🏳️‍🌈""",
+}
+
+# Swaps a generated config and layout in for the loaded one while a benchmark runs: the config is written to a file with the settings of the loaded config and command_count generated commands, laid out over row_count rows, plus dynamic_label_count dynamic labels.
+# It is loaded and compiled the way a real config is; the time that took is in the yielded dict.
+@contextmanager
+def benchmark_config(command_count, row_count, label_style='plain', dynamic_label_count=0):
+    global Config, BUTTON_ROWS
+    saved = (Config, BUTTON_ROWS, list(warnings))
+    with tempfile.TemporaryDirectory() as directory:
+        command_keys = [BENCHMARK_LABELS[label_style](index) for index in range(command_count)]
+        items_per_row = max(ceil(command_count / max(row_count, 1)), 1)
+        button_rows = [command_keys[row * items_per_row:(row + 1) * items_per_row] for row in range(row_count)]
+        commands = {key: f"""echo {index}""" for index, key in enumerate(command_keys)}
+        for index in range(dynamic_label_count):
+            label_key = f"""bench {index:06d}_dynamic_label"""
+            commands[label_key] = f"""echo {index}"""
+            button_rows[index % len(button_rows)].append(label_key)
+        layout_file = Path(directory) / 'layout.txt'
+        layout_file.write_text('\n'.join(', '.join(button_row) for button_row in button_rows) + '\n', encoding='utf-8')
+        config_file = Path(directory) / 'benchmark_config.py'
+        settings = {name: value for name, value in vars(saved[0]).items() if name.isupper() and not isinstance(value, PurePath) and is_plain_data(value)}
+        config_file.write_text(
+            'from pathlib import Path\n'
+            + ''.join(f"""{name} = {value!r}\n""" for name, value in settings.items())
+            + f"""commands = {commands!r}\nlayout_file = Path({str(layout_file)!r})\n""",
+            encoding='utf-8',
+        )
+        timings = {'config_file': config_file, 'layout_file': layout_file}
+        try:
+            started = time.perf_counter()
+            spec = importlib.util.spec_from_file_location('benchmark_config', config_file)
+            config = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(config)
+            timings['config_import_ms'] = (time.perf_counter() - started) * 1000
+            Config, BUTTON_ROWS = config, []
+            started = time.perf_counter()
+            compile_config()
+            timings['config_compile_ms'] = (time.perf_counter() - started) * 1000
+            init_runtime_state()
+            yield timings
+        finally:
+            Config, BUTTON_ROWS = saved[0], saved[1]
+            warnings[:] = saved[2]
+
+def measure(function):
+    started = time.perf_counter()
+    function()
+    seconds = time.perf_counter() - started
+    tracemalloc.start()
+    try:
+        function()
+        peak_bytes = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return seconds, peak_bytes
+
+def benchmark_startup(command_count=2000, row_count=500, label_style='plain', dynamic_label_count=0, size=(100, 40)):
+    global BUTTON_ROWS
+    with benchmark_config(command_count, row_count, label_style, dynamic_label_count) as timings:
+        results = {'commands': command_count, 'rows': row_count, 'labels': label_style, 'dynamic_labels': dynamic_label_count}
+        results['config_import_ms'] = timings['config_import_ms']
+        results['config_compile_ms'] = timings['config_compile_ms']
+
+        with tempfile.TemporaryDirectory() as directory:
+            cache_path = Path(directory) / 'compiled.pickle'
+            sources = [source_fingerprint(timings['config_file']), source_fingerprint(timings['layout_file'])]
+            started = time.perf_counter()
+            write_compiled_config(cache_path, sources, [])
+            results['compiled_cache_write_ms'] = (time.perf_counter() - started) * 1000
+            compiled_rows, BUTTON_ROWS = BUTTON_ROWS, []
+            try:
+                started = time.perf_counter()
+                load_compiled_config(cache_path, 'benchmark_config')
+                results['compiled_cache_load_ms'] = (time.perf_counter() - started) * 1000
+            finally:
+                BUTTON_ROWS = compiled_rows
+
+        # Resolve every layout item again, through a new command index
+        items = [item for button_row in BUTTON_ROWS for item in button_row]
+        Config.__dict__.pop('command_index', None)
+        Config.resolved_layout_items = {}
+        started = time.perf_counter()
+        for item in items:
+            resolve_layout_item(item)
+        results['layout_resolution_ms'] = (time.perf_counter() - started) * 1000
+
+        button_keys = [command_key for _, command_key in map(resolve_layout_item, items) if not command_key.endswith('_dynamic_label')]
+        started = time.perf_counter()
+        for command_key in button_keys:
+            build_box_button(command_key, None)
+        seconds = time.perf_counter() - started
+        results['widget_construction_ms'] = seconds * 1000
+        results['widget_construction_per_button_us'] = seconds * 1000000 / max(len(button_keys), 1)
+
+        BoxButton.canvases.clear()
+        started = time.perf_counter()
+        pile = build_interface()
+        results['build_interface_ms'] = (time.perf_counter() - started) * 1000
+        # What a screen does with the canvas of the topmost widget: turn it into rows of attributed text
+        started = time.perf_counter()
+        screen_rows = list(pile.render(size, focus=True).content())
+        results['first_render_ms'] = (time.perf_counter() - started) * 1000
+        results['screen_size'] = list(size)
+        results['screen_rows'] = len(screen_rows)
+    return results
+
+def benchmark_button_grid(row_count=5000, size=(100, 40)):
+    def eager():
+        # What __main__ used to do: build every row up front and stack them in a Pile
+        rows = [build_button_row(position, button_row) for position, button_row in enumerate(BUTTON_ROWS)]
+        urwid.Filler(urwid.Pile(rows), 'top').render(size, focus=True)
+
+    grids = []
+    def virtualized():
+        grid = ButtonGrid(BUTTON_ROWS)
+        grid.render(size, focus=True)
+        grids.append(grid)
+
+    with benchmark_config(row_count * 4, row_count):
+        BoxButton.canvases.clear()
+        eager_seconds, eager_bytes = measure(eager)
+        BoxButton.canvases.clear()
+        grid_seconds, grid_bytes = measure(virtualized)
+        grid = grids[-1]
+        built_rows = len(grid.body.rows)
+        started = time.perf_counter()
+        grid.keypress(size, 'end')
+        grid.render(size, focus=True)
+        scroll_seconds = time.perf_counter() - started
+
+        # What a single button takes, with the click handler every grid button shares
+        labels = [f"""Button {index}""" for index in range(1000)]
+        tracemalloc.start()
+        try:
+            buttons = [build_box_button(label, on_button_click) for label in labels]
+            button_bytes = tracemalloc.get_traced_memory()[0] / len(buttons)
+        finally:
+            tracemalloc.stop()
+
+    return {
+        'rows': row_count,
+        'screen_size': list(size),
+        'eager_first_render_ms': eager_seconds * 1000,
+        'eager_peak_bytes': eager_bytes,
+        'virtualized_first_render_ms': grid_seconds * 1000,
+        'virtualized_peak_bytes': grid_bytes,
+        'virtualized_rows_built': built_rows,
+        'jump_to_end_ms': scroll_seconds * 1000,
+        'bytes_per_button': button_bytes,
+    }
+
+def benchmark_display_width(label_count=10000):
+    def per_code_point_width(label):
+        # How labels were measured before: every code point that is East Asian Wide counts as two columns
+        return len(label) + len([character for character in label if unicodedata.east_asian_width(character) == 'W'])
+
+    generator = random.Random(0)
+    emoji = ['🚀', '👍🏽', '👨‍👩‍👧‍👦', '🏳️‍🌈', '🇳🇱', '🇯🇵', '✔️', '1️⃣', '🧑🏽‍💻', '❤️', '🎵', '☕']
+    words = ['Deploy', 'コマンド', 'नमस्ते', '한국어', 'Play', 'Café', 'Backup']
+    labels = [f"""{generator.choice(emoji)} {generator.choice(words)} {index:05d} {generator.choice(emoji)}""" for index in range(label_count)]
+
+    started = time.perf_counter()
+    table = build_width_table()
+    build_ms = (time.perf_counter() - started) * 1000
+    with tempfile.TemporaryDirectory() as directory:
+        table_path = Path(directory) / 'widths.pickle'
+        with table_path.open('wb') as fp:
+            pickle.dump(table, fp, protocol=pickle.HIGHEST_PROTOCOL)
+        started = time.perf_counter()
+        with table_path.open('rb') as fp:
+            pickle.load(fp)
+        load_ms = (time.perf_counter() - started) * 1000
+        table_bytes = table_path.stat().st_size
+
+    load_width_table()
+    started = time.perf_counter()
+    old_widths = [per_code_point_width(label) for label in labels]
+    per_code_point_seconds = time.perf_counter() - started
+    display_width.cache_clear()
+    character_class.cache_clear()
+    started = time.perf_counter()
+    widths = [display_width(label) for label in labels]
+    cold_seconds = time.perf_counter() - started
+    started = time.perf_counter()
+    [display_width(label) for label in labels]
+    memoized_seconds = time.perf_counter() - started
+
+    # urwid measures grapheme clusters as well, so it is the reference for what the terminal will draw
+    reference_widths = [urwid.calc_width(label, 0, len(label)) for label in labels]
+    return {
+        'labels': label_count,
+        'table_ranges': len(table[0]),
+        'table_bytes': table_bytes,
+        'table_build_ms': build_ms,
+        'table_load_ms': load_ms,
+        'per_code_point_per_label_us': per_code_point_seconds * 1000000 / label_count,
+        'cold_per_label_us': cold_seconds * 1000000 / label_count,
+        'memoized_per_label_us': memoized_seconds * 1000000 / label_count,
+        'per_code_point_mismatches': sum(1 for width, reference in zip(old_widths, reference_widths) if width != reference),
+        'mismatches': sum(1 for width, reference in zip(widths, reference_widths) if width != reference),
+    }
+
+def benchmark_output_throughput(bytes_per_second=1024 * 1024, duration=2, chunk_size=ProcessSupervisor.READ_SIZE):
+    line = b'0123456789 output line of a benchmark command with some text to fill it up\n'
+    chunk = (line * ceil(chunk_size / len(line)))[:chunk_size]
+
+    # Output arriving at bytes_per_second, fed to the output pane by alarms on an event loop, with the render scheduler coalescing the refreshes
+    event_loop = urwid.SelectEventLoop()
+    scheduler = RenderScheduler(event_loop, max_refresh_rate=getattr(Config, 'MAX_REFRESH_RATE', 30))
+    pane = OutputPane(urwid.Text(''), scheduler=scheduler)
+    interval = chunk_size / bytes_per_second
+    chunks_fed = [0]
+    started = time.monotonic()
+    def feed():
+        pane.feed('bench', chunk)
+        chunks_fed[0] += 1
+        if time.monotonic() - started >= duration:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(max(started + chunks_fed[0] * interval - time.monotonic(), 0), feed)
+    event_loop.alarm(0, feed)
+    cpu_started = time.process_time()
+    event_loop.run()
+    cpu_seconds = time.process_time() - cpu_started
+    elapsed = time.monotonic() - started
+
+    # The same output as fast as the pane takes it, refreshing on every chunk
+    pane = OutputPane(urwid.Text(''))
+    chunk_count = max(int(bytes_per_second * duration / chunk_size), 1)
+    unpaced_started = time.perf_counter()
+    for _ in range(chunk_count):
+        pane.feed('bench', chunk)
+    unpaced_seconds = time.perf_counter() - unpaced_started
+
+    return {
+        'target_bytes_per_second': bytes_per_second,
+        'chunk_size': chunk_size,
+        'bytes': chunks_fed[0] * chunk_size,
+        'achieved_bytes_per_second': chunks_fed[0] * chunk_size / elapsed,
+        'cpu_seconds': cpu_seconds,
+        'cpu_fraction': cpu_seconds / elapsed,
+        'refreshes': scheduler.flushed,
+        'redraws_saved': scheduler.saved,
+        'unpaced_bytes_per_second': chunk_count * chunk_size / max(unpaced_seconds, 1e-9),
+    }
+
+def benchmark_ansi_output(byte_count=4 * 1024 * 1024, chunk_size=ProcessSupervisor.READ_SIZE, probe_interval=0.005):
+    # Coloured output in the style of build logs, ls --color and jq -C, and the same text without its escape sequences
+    generator = random.Random(0)
+    styles = ['\x1b[31m', '\x1b[1;32m', '\x1b[33m', '\x1b[1;34m', '\x1b[38;5;208m', '\x1b[38;2;255;128;0m', '\x1b[4;36m', '\x1b[7m']
+    words = ['error', 'warning:', 'compiling', 'src/launcher.py', 'ok', '"key":', '12.5', 'true', 'null', 'drwxr-xr-x']
+    lines = []
+    size = 0
+    while size < byte_count:
+        line = ' '.join(f"""{generator.choice(styles)}{generator.choice(words)}\x1b[0m""" if generator.random() < 0.5 else generator.choice(words) for _ in range(8)) + '\n'
+        lines.append(line)
+        size += len(line)
+    coloured = ''.join(lines).encode('utf-8')
+    plain = ANSI_ESCAPE.sub('', coloured.decode('utf-8')).encode('utf-8')
+
+    def chunks(data):
+        # Chunk boundaries fall within escape sequences as well
+        return [data[offset:offset + chunk_size] for offset in range(0, len(data), chunk_size)] + [b'']
+
+    def parse(data):
+        buffer = OutputBuffer()
+        started = time.perf_counter()
+        for chunk in chunks(data):
+            buffer.feed(chunk)
+        return len(data) / (time.perf_counter() - started) / 1024 / 1024
+
+    def feed_pane(pipelined):
+        # All chunks are fed to the output pane as fast as it takes them, while a probe alarm that is due every probe_interval measures how late the event loop gets to it: how long input handling would have to wait
+        event_loop = urwid.SelectEventLoop()
+        pipeline = OutputPipeline(event_loop) if pipelined else None
+        pane = OutputPane(urwid.Text(''), scheduler=RenderScheduler(event_loop, max_refresh_rate=30), pipeline=pipeline)
+        remaining = deque(chunks(coloured))
+        lateness = []
+
+        def feed():
+            pane.feed('bench', remaining.popleft())
+            if remaining:
+                event_loop.alarm(0, feed)
+
+        def probe(due):
+            now = time.monotonic()
+            lateness.append((now - due) * 1000)
+            if not remaining and not (pipeline and pipeline.pending):
+                raise urwid.ExitMainLoop()
+            event_loop.alarm(probe_interval, functools.partial(probe, now + probe_interval))
+
+        event_loop.alarm(0, feed)
+        event_loop.alarm(probe_interval, functools.partial(probe, time.monotonic() + probe_interval))
+        started = time.perf_counter()
+        cpu_started = time.thread_time()
+        event_loop.run()
+        main_thread_cpu = time.thread_time() - cpu_started
+        elapsed = time.perf_counter() - started
+        if pipeline:
+            pipeline.stop()
+        lateness.sort()
+        return {
+            'elapsed_ms': elapsed * 1000,
+            'main_thread_cpu_ms': main_thread_cpu * 1000,
+            'batches': pipeline.batches if pipeline else None,
+            'input_delay_p50_ms': lateness[len(lateness) // 2],
+            'input_delay_p95_ms': lateness[int(len(lateness) * 0.95)],
+            'input_delay_max_ms': lateness[-1],
+            'lines': len(pane.lines),
+        }
+
+    return {
+        'bytes': len(coloured),
+        'chunk_size': chunk_size,
+        'parse_coloured_mb_per_second': parse(coloured),
+        'parse_plain_mb_per_second': parse(plain),
+        'inline': feed_pane(False),
+        'pipelined': feed_pane(True),
+    }
+
+def benchmark_command_palette(command_count=50000, queries=('rst ngx stg', 'deploy api prod 01', 'tail log'), limit=50, frame_ms=1000 / 60):
+    words = ['restart', 'deploy', 'tail', 'backup', 'nginx', 'api', 'worker', 'db', 'cache', 'log', 'staging', 'prod', 'dev', 'eu', 'us', 'metrics']
+    generator = random.Random(0)
+    commands = {f"""{' '.join(generator.sample(words, 4))} {index:05d}""": f"""echo {index}""" for index in range(command_count)}
+    recent_commands = list(commands)[:10]
+
+    def keystrokes(index, query):
+        # Typing the query one character at a time, then deleting it again
+        typed = [query[:length] for length in range(1, len(query) + 1)]
+        typed += typed[-2::-1] + ['']
+        latencies = []
+        for text in typed:
+            started = time.perf_counter()
+            index.top(text, limit)
+            latencies.append((time.perf_counter() - started) * 1000)
+        return latencies
+
+    started = time.perf_counter()
+    index = FuzzyCommandIndex(commands, recent_commands)
+    build_ms = (time.perf_counter() - started) * 1000
+    incremental = []
+    for query in queries:
+        incremental.extend(keystrokes(index, query))
+
+    # The same keystrokes, with every query matched from scratch
+    rescan = []
+    for query in queries:
+        for text in [query[:length] for length in range(1, len(query) + 1)]:
+            started = time.perf_counter()
+            index.steps = index.steps[:1]
+            index.ranked = {}
+            index.top(text, limit)
+            rescan.append((time.perf_counter() - started) * 1000)
+
+    return {
+        'commands': command_count,
+        'limit': limit,
+        'index_build_ms': build_ms,
+        'keystrokes': len(incremental),
+        'keystroke_p50_ms': statistics.median(incremental),
+        'keystroke_p95_ms': statistics.quantiles(incremental, n=20)[-1],
+        'keystroke_max_ms': max(incremental),
+        'keystrokes_within_frame': sum(1 for latency in incremental if latency < frame_ms) / len(incremental),
+        'rescan_p50_ms': statistics.median(rescan),
+        'rescan_max_ms': max(rescan),
+        'frame_ms': frame_ms,
+        'within_frame': max(incremental) < frame_ms,
+    }
+
+def benchmark_shell_pool(run_count=50, pool_size=2, command='echo ready'):
+    def click_latencies(shell_pool_size):
+        event_loop = urwid.SelectEventLoop()
+        shell_pool = ShellPool(event_loop, shell_pool_size) if shell_pool_size else None
+        supervisor = ProcessSupervisor(event_loop, shell_pool=shell_pool)
+        first_byte = []
+        exited = []
+
+        def stop():
+            raise urwid.ExitMainLoop()
+
+        def click():
+            clicked_at = time.perf_counter()
+            def on_output(data, stream):
+                if data and len(first_byte) < len(exited) + 1:
+                    first_byte.append(time.perf_counter() - clicked_at)
+            def on_exit(returncode):
+                exited.append(time.perf_counter() - clicked_at)
+                event_loop.alarm(0, click if len(exited) < run_count else stop)
+            supervisor.spawn('benchmark', command, on_output, on_exit)
+
+        # Give the workers of the pool time to start, as they would have long before the first click
+        event_loop.alarm(0.2, click)
+        try:
+            event_loop.run()
+        finally:
+            supervisor.shutdown()
+        return {
+            'first_byte_median_ms': statistics.median(first_byte) * 1000,
+            'first_byte_mean_ms': statistics.mean(first_byte) * 1000,
+            'exit_median_ms': statistics.median(exited) * 1000,
+        }
+
+    direct = click_latencies(0)
+    pooled = click_latencies(pool_size)
+    return {
+        'command': command,
+        'runs': run_count,
+        'pool_size': pool_size,
+        'direct': direct,
+        'pooled': pooled,
+        'first_byte_speedup': direct['first_byte_median_ms'] / max(pooled['first_byte_median_ms'], 1e-9),
+    }
+
+# Runs the (selected) benchmarks without starting the interface, and prints the results as JSON, so runs of different versions can be compared.
+def run_benchmarks():
+    selected = args.bench_only or BENCHMARKS
+    results = {}
+    if 'find_command' in selected:
+        results['find_command'] = benchmark_find_command()
+    if 'startup' in selected:
+        results['startup'] = benchmark_startup(args.bench_commands, args.bench_rows, args.bench_labels, args.bench_dynamic_labels)
+    if 'button_grid' in selected:
+        results['button_grid'] = benchmark_button_grid()
+    if 'display_width' in selected:
+        results['display_width'] = benchmark_display_width()
+    if 'output_throughput' in selected:
+        results['output_throughput'] = benchmark_output_throughput(args.bench_output_rate)
+    if 'ansi_output' in selected:
+        results['ansi_output'] = benchmark_ansi_output()
+    if 'shell_pool' in selected:
+        results['shell_pool'] = benchmark_shell_pool()
+    if 'command_palette' in selected:
+        results['command_palette'] = benchmark_command_palette(args.bench_palette_commands)
+    print(json.dumps({
+        'version': getattr(Config, 'VERSION', None),
+        'python': platform.python_version(),
+        'urwid': urwid.__version__,
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'results': results,
+    }, indent=2))
+
+if __name__ == '__main__':
+    if args.bench:
+        run_benchmarks()
+        exit()
+
+    # CHANGEME: Change these button labels and their commands to do what you want them to say and do.
+    # I use echo commands just for testing, as I don't control my media player via cli, so I don't know what you want to call. ;)
+    # just replace the "echo "playing" >> commands.log" part between the single quotes with the play command you use.
+    build_interface()
+    asyncio_loop = None
+    if (args.event_loop or getattr(Config, 'EVENT_LOOP', 'select')) == 'asyncio':
+        asyncio_loop = new_asyncio_loop()
+    Config.loop = urwid.MainLoop(Config.pile, Config.PALETTE, unhandled_input=show_or_exit, event_loop=asyncio_loop and urwid.AsyncioEventLoop(loop=asyncio_loop))
+    if getattr(Config, 'SPOOL_OUTPUT', True):
+        Config.spool = Spool(
+            getattr(Config, 'SPOOL_DIRECTORY', None) or Path(getenv('XDG_STATE_HOME') or Path.home() / '.local' / 'state') / 'tui_launcher' / 'spool',
+            max_bytes=getattr(Config, 'SPOOL_MAX_BYTES', 256 * 1024 * 1024),
+            max_age=getattr(Config, 'SPOOL_MAX_AGE', 7 * 24 * 60 * 60),
+        )
+    # An attached TUI gets its labels and output from the daemon instead
+    if getattr(Config, 'SAVE_STATE', True) and not args.attach:
+        # Restored before the render scheduler exists, so the restored text is on the first screen
+        restore_state(state_file_path())
+        Config.state_file = StateFile(state_file_path(), Config.loop.event_loop, interval=getattr(Config, 'STATE_SAVE_INTERVAL', 5))
+    if args.daemon:
+        # The interface is built but never drawn: its widgets hold the labels, output and status that are sent to attaching clients
+        Config.daemon = LauncherDaemon(daemon_socket_path(), Config.loop.event_loop, max_client_buffer=getattr(Config, 'DAEMON_CLIENT_BUFFER', 4 * 1024 * 1024))
+        if asyncio_loop:
+            for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+                asyncio_loop.add_signal_handler(signum, asyncio_loop.stop)
+        else:
+            for signum in (signal.SIGINT, signal.SIGTERM, signal.SIGHUP):
+                signal.signal(signum, stop_daemon)
+    else:
+        Config.render_scheduler = RenderScheduler(Config.loop.event_loop, max_refresh_rate=getattr(Config, 'MAX_REFRESH_RATE', 30), on_flush=report_redraws_saved)
+        Config.output_pane.scheduler = Config.render_scheduler
+        Config.output_pipeline = Config.output_pane.pipeline = OutputPipeline(Config.loop.event_loop)
+    if args.attach:
+        Config.attached = DaemonConnection(daemon_socket_path(), Config.loop.event_loop)
+        if Config.attached.sock is None:
+            exit(f"""No launcher daemon is listening on {daemon_socket_path()}; start one with --daemon""")
+    else:
+        start_services(asyncio_loop)
+    if getattr(Config, 'RELOAD_ON_CHANGE', True):
+        watch_config_files()
+    try:
+        if args.daemon:
+            Config.loop.event_loop.run()
+        else:
+            Config.loop.run()
+    finally:
+        if args.daemon:
+            ignore_stop_signals(asyncio_loop)
+        if Config.daemon:
+            Config.daemon.shutdown()
+        if Config.supervisor:
+            Config.supervisor.shutdown()
+        if Config.output_pipeline:
+            Config.output_pipeline.stop()
+        if Config.state_file:
+            Config.state_file.flush()
+        export_metrics()
     if warnings:
         print("Warnings during execution:")
         for warning in list(warnings):
@@ -0,0 +1,31 @@
+import os
+import sys
+import importlib
+from pathlib import Path
+
+import pytest
+import urwid
+
+REPOSITORY = Path(__file__).resolve().parent.parent
+
+@pytest.fixture(scope='session')
+def launcher(tmp_path_factory):
+    # launcher.py parses its arguments and loads the default config (with paths relative to the repository) when it is imported
+    os.environ['XDG_CACHE_HOME'] = str(tmp_path_factory.mktemp('cache'))
+    os.environ['XDG_STATE_HOME'] = str(tmp_path_factory.mktemp('state'))
+    os.chdir(REPOSITORY)
+    sys.path.insert(0, str(REPOSITORY))
+    argv = sys.argv
+    sys.argv = ['launcher.py', '--no-cache']
+    try:
+        return importlib.import_module('launcher')
+    finally:
+        sys.argv = argv
+
+@pytest.fixture
+def config(launcher):
+    # The runtime state on Config, as at startup, with a status line to write to
+    launcher.init_runtime_state()
+    launcher.Config.status_widget = urwid.Text('')
+    yield launcher.Config
+    launcher.init_runtime_state()
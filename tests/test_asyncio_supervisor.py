@@ -0,0 +1,84 @@
+import asyncio
+import signal
+import time
+
+import pytest
+import urwid
+
+@pytest.fixture
+def asyncio_loop(launcher):
+    asyncio_loop = launcher.new_asyncio_loop()
+    yield asyncio_loop
+    asyncio_loop.close()
+    asyncio.set_event_loop(None)
+
+@pytest.fixture
+def supervisor(launcher, asyncio_loop):
+    supervisor = launcher.AsyncioProcessSupervisor(asyncio_loop, urwid.AsyncioEventLoop(loop=asyncio_loop))
+    yield supervisor
+    supervisor.shutdown()
+
+def run_until(asyncio_loop, condition, timeout=10):
+    async def wait():
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            await asyncio.sleep(0.01)
+    asyncio_loop.run_until_complete(wait())
+
+def spawn(supervisor, cmd, command_key='test', input_data=None):
+    output = {'stdout': [], 'stderr': []}
+    exited = []
+    entry = supervisor.spawn(command_key, cmd, lambda data, stream='stdout': output[stream].append(data), exited.append, input_data)
+    return entry, output, exited
+
+def test_output_and_exit_status(supervisor, asyncio_loop):
+    entry, output, exited = spawn(supervisor, 'echo out; echo err >&2; exit 3')
+    run_until(asyncio_loop, lambda: exited)
+    assert exited == [3]
+    assert b''.join(output['stdout']) == b'out\n' and b''.join(output['stderr']) == b'err\n'
+    assert output['stdout'][-1] == b'' and output['stderr'][-1] == b''
+    assert not supervisor.processes
+
+def test_list_commands_and_input(supervisor, asyncio_loop):
+    entry, output, exited = spawn(supervisor, ['tr', 'a-z', 'A-Z'], input_data=b'quiet\n')
+    run_until(asyncio_loop, lambda: exited)
+    assert exited == [0]
+    assert b''.join(output['stdout']) == b'QUIET\n'
+
+def test_timeout(supervisor, asyncio_loop):
+    supervisor.command_timeouts = {'slow': 0.2}
+    stopped = []
+    supervisor.on_stop = stopped.append
+    entry, output, exited = spawn(supervisor, 'sleep 5 & sleep 5', command_key='slow')
+    run_until(asyncio_loop, lambda: exited)
+    assert exited == [-signal.SIGTERM]
+    assert entry.stopped_by == 'timeout' and stopped == [entry]
+
+def test_cancel(supervisor, asyncio_loop):
+    entry, output, exited = spawn(supervisor, ['sleep', '5'], command_key='slow')
+    run_until(asyncio_loop, lambda: entry.process is not None)
+    assert supervisor.cancel('slow') == [entry]
+    run_until(asyncio_loop, lambda: exited)
+    assert exited == [-signal.SIGTERM]
+    assert entry.stopped_by == 'cancelled'
+
+def test_cancelled_before_it_started(supervisor, asyncio_loop):
+    entry, output, exited = spawn(supervisor, ['sleep', '5'])
+    entry.task.cancel()
+    run_until(asyncio_loop, lambda: exited)
+    assert exited == [-1]
+    assert not supervisor.processes
+
+def test_shutdown_stops_running_processes(launcher, asyncio_loop):
+    supervisor = launcher.AsyncioProcessSupervisor(asyncio_loop, urwid.AsyncioEventLoop(loop=asyncio_loop))
+    entry, output, exited = spawn(supervisor, ['sleep', '5'])
+    run_until(asyncio_loop, lambda: entry.process is not None)
+    started = time.monotonic()
+    supervisor.shutdown()
+    assert exited == [-signal.SIGTERM]
+    assert time.monotonic() - started < 4
+
+def test_terminate_tolerates_entries_without_a_process(launcher, supervisor):
+    # Such as a cached result, or a command that is still waiting for its input
+    supervisor.terminate(launcher.CachedResult([], 0))
+    supervisor.terminate(launcher.SupervisedProcess('test', None, None, None))
@@ -0,0 +1,65 @@
+import pytest
+
+@pytest.fixture
+def button_rows(launcher, config, monkeypatch):
+    monkeypatch.setattr(config, 'commands', {f"""command {index}""": 'true' for index in range(5000)})
+    monkeypatch.setattr(config, 'command_index', None, raising=False)
+    monkeypatch.setattr(config, 'resolved_layout_items', {})
+    monkeypatch.setattr(config, 'column_widths', {})
+    return [[f"""command {index}"""] for index in range(5000)]
+
+def built_rows(grid):
+    return sorted(grid.body.rows)
+
+def test_only_rows_near_the_viewport_are_built(launcher, button_rows):
+    grid = launcher.ButtonGrid(button_rows)
+    assert built_rows(grid) == []
+    grid.render((80, 20), focus=True)
+    rows = built_rows(grid)
+    assert rows[0] == 0 and len(rows) < 20
+    visible_labels = {widget.label for widget in grid.visible_widgets() if isinstance(widget, launcher.BoxButton)}
+    assert 'command 0' in visible_labels and 'command 100' not in visible_labels
+
+def test_jumping_to_the_end(launcher, button_rows):
+    grid = launcher.ButtonGrid(button_rows)
+    grid.render((80, 20), focus=True)
+    grid.keypress((80, 20), 'end')
+    grid.render((80, 20), focus=True)
+    assert grid.focus_position == 4999
+    assert 4999 in grid.body.rows
+    assert len(grid.body.rows) < 40
+
+def test_buttons_know_their_position(launcher, button_rows):
+    walker = launcher.ButtonRowWalker(button_rows)
+    button = walker[42].contents[0][0]
+    assert (button.label, button.position) == ('command 42', (42, 0))
+    assert walker[42] is walker[42]
+
+def test_out_of_range_positions(launcher, button_rows):
+    walker = launcher.ButtonRowWalker(button_rows)
+    with pytest.raises(IndexError):
+        walker[5000]
+    with pytest.raises(IndexError):
+        walker[-1]
+    with pytest.raises(IndexError):
+        walker.prev_position(0)
+
+def test_rows_farthest_from_the_focus_are_dropped(launcher, button_rows, monkeypatch):
+    monkeypatch.setattr(launcher.ButtonRowWalker, 'ROW_CACHE_SIZE', 8)
+    walker = launcher.ButtonRowWalker(button_rows)
+    walker.set_focus(20)
+    for position in range(21):
+        walker[position]
+    assert len(walker.rows) <= 8
+    assert 20 in walker.rows and 0 not in walker.rows
+
+def test_update_keeps_the_unchanged_rows(launcher, button_rows):
+    walker = launcher.ButtonRowWalker(button_rows[:3])
+    first, second, third = walker[0], walker[1], walker[2]
+    walker.set_focus(2)
+    # A new row at the top: the old rows move down by one
+    walker.update([['command 9']] + button_rows[:3], {1: 0, 2: 1, 3: 2})
+    assert (walker[1], walker[2], walker[3]) == (first, second, third)
+    assert third.contents[0][0].position == (3, 0)
+    assert walker[0].contents[0][0].label == 'command 9'
+    assert walker.focus == 3
@@ -0,0 +1,108 @@
+import time
+import types
+
+import pytest
+import urwid
+
+def run_until_exited(event_loop, exit_count, exited):
+    def stop_when_exited():
+        if len(exited) >= exit_count:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(0.01, stop_when_exited)
+    event_loop.alarm(0.01, stop_when_exited)
+    event_loop.run()
+
+def test_commands_share_a_cached_input(launcher, config, monkeypatch, tmp_path):
+    runs = tmp_path / 'runs'
+    monkeypatch.setattr(config, 'commands', {
+        'page': f"""echo run >> {runs}; printf 'alpha\\nbeta\\n'""",
+        'upper': ['tr', 'a-z', 'A-Z'],
+        'count': ['wc', '-l'],
+    })
+    monkeypatch.setattr(config, 'COMMAND_INPUT', {'upper': 'page', 'count': 'page'}, raising=False)
+    event_loop = urwid.SelectEventLoop()
+    config.supervisor = launcher.ProcessSupervisor(event_loop)
+    config.result_cache = launcher.ResultCache(event_loop, {'page': 60})
+    output = {'upper': [], 'count': []}
+    exited = []
+    for command_key in output:
+        launcher.spawn_command(command_key, lambda data, stream='stdout', command_key=command_key: output[command_key].append(data), exited.append)
+    try:
+        run_until_exited(event_loop, 2, exited)
+    finally:
+        config.supervisor.shutdown()
+    assert exited == [0, 0]
+    assert b''.join(output['upper']) == b'ALPHA\nBETA\n'
+    assert b''.join(output['count']).strip() == b'2'
+    assert runs.read_text() == 'run\n'
+
+def test_failing_input_is_not_passed_on(launcher, config, monkeypatch):
+    monkeypatch.setattr(config, 'commands', {'page': 'echo oops >&2; exit 3', 'upper': ['tr', 'a-z', 'A-Z']})
+    monkeypatch.setattr(config, 'COMMAND_INPUT', {'upper': 'page'}, raising=False)
+    event_loop = urwid.SelectEventLoop()
+    config.supervisor = launcher.ProcessSupervisor(event_loop)
+    output = []
+    exited = []
+    launcher.spawn_command('upper', lambda data, stream='stdout': output.append((stream, data)), exited.append)
+    try:
+        run_until_exited(event_loop, 1, exited)
+    finally:
+        config.supervisor.shutdown()
+    assert exited == [3]
+    assert (b''.join(data for stream, data in output if stream == 'stderr'), b''.join(data for stream, data in output if stream == 'stdout')) == (b'oops\n', b'')
+
+def test_input_cycles_are_refused(launcher, config, monkeypatch):
+    monkeypatch.setattr(config, 'commands', {'a': 'cat', 'b': 'cat'})
+    monkeypatch.setattr(config, 'COMMAND_INPUT', {'a': 'b', 'b': 'a'}, raising=False)
+    with pytest.raises(SystemExit, match='cycle'):
+        launcher.validate_command_input()
+
+def run_until(event_loop, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    def check():
+        if condition() or time.monotonic() > deadline:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(0.01, check)
+    event_loop.alarm(0.01, check)
+    event_loop.run()
+
+@pytest.fixture
+def event_loop(launcher, config, monkeypatch):
+    event_loop = urwid.SelectEventLoop()
+    monkeypatch.setattr(config, 'loop', types.SimpleNamespace(event_loop=event_loop), raising=False)
+    config.supervisor = launcher.ProcessSupervisor(event_loop)
+    yield event_loop
+    config.supervisor.shutdown()
+
+def timed_label(launcher, config, monkeypatch, label_key):
+    monkeypatch.setattr(config, 'DYNAMIC_LABEL_OPTIONS', {label_key: {'interval': 60, 'timeout': 0.2}}, raising=False)
+    return launcher.register_dynamic_label(label_key, None, urwid.AttrMap(urwid.Text(label_key), None))['schedule']
+
+def test_label_timeout_leaves_a_shared_run_to_the_others(launcher, config, monkeypatch, event_loop):
+    # The label was coalesced onto the run of a button; the button still gets its result
+    monkeypatch.setattr(config, 'commands', {'fetch': 'sleep 1; echo done'})
+    config.result_cache = launcher.ResultCache(event_loop, {'fetch': 60})
+    output = []
+    exited = []
+    launcher.spawn_command('fetch', lambda data, stream='stdout': output.append(data), exited.append)
+    schedule = timed_label(launcher, config, monkeypatch, 'fetch')
+    schedule.run()
+    run_until(event_loop, lambda: schedule.failures and exited)
+    schedule.stop()
+    assert schedule.timed_out and schedule.failures == 1 and schedule.entry is None
+    assert exited == [0]
+    assert b''.join(output) == b'done\n'
+
+def test_label_timeout_while_its_input_is_running(launcher, config, monkeypatch, event_loop, tmp_path):
+    started = tmp_path / 'started'
+    monkeypatch.setattr(config, 'commands', {'page': 'sleep 1; echo page', 'upper': f"""touch {started}; tr a-z A-Z"""})
+    monkeypatch.setattr(config, 'COMMAND_INPUT', {'upper': 'page'}, raising=False)
+    schedule = timed_label(launcher, config, monkeypatch, 'upper')
+    schedule.run()
+    run_until(event_loop, lambda: schedule.failures and not config.supervisor.processes)
+    schedule.stop()
+    assert schedule.timed_out and schedule.failures == 1 and schedule.entry is None
+    # The input was killed rather than left running, and the command itself never started
+    assert not config.supervisor.processes
+    assert not started.exists()
+    assert config.dynamic_labels['upper']['text'] == 'upper'
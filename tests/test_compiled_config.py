@@ -0,0 +1,105 @@
+import os
+import pickle
+import sys
+from pathlib import Path
+
+import pytest
+
+@pytest.fixture
+def compiled(launcher, config, monkeypatch, tmp_path):
+    # The globals that compiling the config fills in, so loading the snapshot can be compared with what was written
+    monkeypatch.setattr(launcher, 'BUTTON_ROWS', [['one', 'two']])
+    monkeypatch.setattr(launcher, 'warnings', [])
+    source = tmp_path / 'config.py'
+    source.write_text('commands = {}\n', encoding='utf-8')
+    return tmp_path / 'cache' / 'compiled.pickle', source
+
+def write(launcher, cache_path, sources):
+    return launcher.write_compiled_config(cache_path, [launcher.source_fingerprint(path) for path in sources], [('compile warning',)])
+
+def load(launcher, monkeypatch, cache_path):
+    monkeypatch.setattr(launcher, 'BUTTON_ROWS', [])
+    return launcher.load_compiled_config(cache_path, 'compiled_config')
+
+def test_cache_hit(launcher, config, monkeypatch, compiled):
+    cache_path, source = compiled
+    assert write(launcher, cache_path, [source])
+    loaded = load(launcher, monkeypatch, cache_path)
+    assert loaded.commands == config.commands
+    assert loaded.PALETTE == config.PALETTE
+    assert loaded.__file__ == str(source.resolve())
+    assert vars(loaded.borders) == vars(config.borders)
+    assert launcher.BUTTON_ROWS == [['one', 'two']]
+    assert launcher.warnings == [('compile warning',)]
+
+def test_touched_source_still_hits(launcher, config, monkeypatch, compiled):
+    cache_path, source = compiled
+    write(launcher, cache_path, [source])
+    os.utime(source, ns=(0, 0))
+    assert load(launcher, monkeypatch, cache_path) is not None
+
+def test_changed_source_invalidates(launcher, config, monkeypatch, compiled):
+    cache_path, source = compiled
+    write(launcher, cache_path, [source])
+    source.write_text('commands = {"new": "true"}\n', encoding='utf-8')
+    assert load(launcher, monkeypatch, cache_path) is None
+
+def test_removed_source_invalidates(launcher, config, monkeypatch, compiled):
+    cache_path, source = compiled
+    write(launcher, cache_path, [source])
+    source.unlink()
+    assert load(launcher, monkeypatch, cache_path) is None
+
+def test_changed_imported_module_invalidates(launcher, config, monkeypatch, compiled, tmp_path):
+    cache_path, source = compiled
+    shared = tmp_path / 'shared_commands_for_test.py'
+    shared.write_text('commands = {}\n', encoding='utf-8')
+    monkeypatch.syspath_prepend(str(tmp_path))
+    modules_before = set(sys.modules)
+    import shared_commands_for_test
+    try:
+        sources = launcher.imported_sources(modules_before)
+    finally:
+        del sys.modules['shared_commands_for_test']
+    assert [fingerprint['path'] for fingerprint in sources] == [str(shared.resolve())]
+    launcher.write_compiled_config(cache_path, [launcher.source_fingerprint(source)] + sources, [])
+    shared.write_text('commands = {"new": "true"}\n', encoding='utf-8')
+    assert load(launcher, monkeypatch, cache_path) is None
+
+def test_other_cache_version_is_ignored(launcher, config, monkeypatch, compiled):
+    cache_path, source = compiled
+    write(launcher, cache_path, [source])
+    snapshot = pickle.loads(cache_path.read_bytes())
+    snapshot['version'] -= 1
+    cache_path.write_bytes(pickle.dumps(snapshot))
+    assert load(launcher, monkeypatch, cache_path) is None
+
+def test_corrupt_cache_falls_back_to_importing(launcher, config, monkeypatch, compiled):
+    cache_path, source = compiled
+    cache_path.parent.mkdir()
+    cache_path.write_bytes(b'not a pickle')
+    assert load(launcher, monkeypatch, cache_path) is None
+    assert launcher.BUTTON_ROWS == []
+
+def test_config_with_values_that_cannot_be_stored_is_not_cached(launcher, config, monkeypatch, compiled):
+    cache_path, source = compiled
+    def title(command_key):
+        return command_key.upper()
+    title.__module__ = config.__name__
+    monkeypatch.setattr(config, 'title', title, raising=False)
+    assert not write(launcher, cache_path, [source])
+    assert not cache_path.exists()
+
+def test_imported_names_are_not_stored(launcher, config, monkeypatch, compiled):
+    # Like the 'from pathlib import Path' at the top of the configs
+    cache_path, source = compiled
+    monkeypatch.setattr(config, 'Path', Path, raising=False)
+    monkeypatch.setattr(config, 'os', os, raising=False)
+    assert write(launcher, cache_path, [source])
+    loaded = load(launcher, monkeypatch, cache_path)
+    assert not hasattr(loaded, 'Path') and not hasattr(loaded, 'os')
+
+def test_layout_file_is_absolute(launcher, config, monkeypatch):
+    monkeypatch.setattr(config, 'layout_file', Path('layouts/default.txt'))
+    launcher.set_layout_file()
+    assert config.layout_file == Path('layouts/default.txt').resolve()
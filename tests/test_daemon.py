@@ -0,0 +1,149 @@
+import base64
+import json
+import os
+import socket
+import time
+
+import pytest
+import urwid
+
+@pytest.fixture
+def temp_directory(launcher, monkeypatch, tmp_path):
+    monkeypatch.setattr(launcher.tempfile, 'gettempdir', lambda: str(tmp_path))
+    return tmp_path / f"""tui_launcher-{os.getuid()}"""
+
+def test_socket_directory_is_created_private(launcher, temp_directory):
+    assert launcher.private_temp_directory() == temp_directory
+    assert temp_directory.stat().st_mode & 0o777 == 0o700
+
+def test_socket_directory_that_others_can_access_is_refused(launcher, temp_directory):
+    temp_directory.mkdir(mode=0o755)
+    temp_directory.chmod(0o755)
+    with pytest.raises(SystemExit, match='Refusing to use'):
+        launcher.private_temp_directory()
+
+def test_socket_directory_symlink_is_refused(launcher, temp_directory, tmp_path):
+    target = tmp_path / 'elsewhere'
+    target.mkdir(mode=0o700)
+    temp_directory.symlink_to(target)
+    with pytest.raises(SystemExit, match='Refusing to use'):
+        launcher.private_temp_directory()
+
+def test_decode_messages_keeps_the_unfinished_line(launcher):
+    messages, buffered = launcher.decode_messages(b'', b'{"type": "click", "key": "a"}\n{"type": "ca')
+    assert messages == [{'type': 'click', 'key': 'a'}]
+    messages, buffered = launcher.decode_messages(buffered, b'ncel", "key": "a"}\n')
+    assert (messages, buffered) == ([{'type': 'cancel', 'key': 'a'}], b'')
+
+def test_decode_messages_skips_what_is_not_a_message(launcher):
+    messages, buffered = launcher.decode_messages(b'', b'not json\n[1, 2]\n"text"\n{"type": "click"}\n')
+    assert (messages, buffered) == ([{'type': 'click'}], b'')
+
+def test_encoded_messages_are_single_lines(launcher):
+    data = launcher.encode_message({'type': 'notice', 'text': 'two\nlines'})
+    assert data.count(b'\n') == 1 and data.endswith(b'\n')
+    assert launcher.decode_messages(b'', data) == ([{'type': 'notice', 'text': 'two\nlines'}], b'')
+
+class Client():
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(str(path))
+        self.sock.setblocking(False)
+        self.buffered = b''
+        self.messages = []
+
+    def send(self, **message):
+        self.sock.sendall(json.dumps(message).encode() + b'\n')
+
+    def receive(self, launcher):
+        try:
+            data = self.sock.recv(65536)
+        except BlockingIOError:
+            return
+        messages, self.buffered = launcher.decode_messages(self.buffered, data)
+        self.messages.extend(messages)
+
+    def of_type(self, kind):
+        return [message for message in self.messages if message['type'] == kind]
+
+@pytest.fixture
+def event_loop(launcher, config):
+    event_loop = urwid.SelectEventLoop()
+    config.supervisor = launcher.ProcessSupervisor(event_loop)
+    yield event_loop
+    config.supervisor.shutdown()
+
+@pytest.fixture
+def daemon(launcher, config, monkeypatch, event_loop, tmp_path):
+    monkeypatch.setattr(config, 'commands', {'hello': 'echo hi', 'slow': 'sleep 5'})
+    config.output_pane = launcher.OutputPane(urwid.Text(''))
+    config.daemon = launcher.LauncherDaemon(tmp_path / 'daemon.sock', event_loop)
+    yield config.daemon
+    config.daemon.shutdown()
+
+@pytest.fixture
+def connect():
+    clients = []
+    def connect(path):
+        clients.append(Client(path))
+        return clients[-1]
+    yield connect
+    for client in clients:
+        client.sock.close()
+
+def run_until(launcher, event_loop, client, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    def check():
+        client.receive(launcher)
+        if condition() or time.monotonic() > deadline:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(0.01, check)
+    event_loop.alarm(0.01, check)
+    event_loop.run()
+
+def test_attaching_client_gets_a_snapshot(launcher, config, event_loop, daemon, connect):
+    config.status_widget.set_text('ready')
+    client = connect(daemon.path)
+    run_until(launcher, event_loop, client, lambda: client.messages)
+    assert client.messages[0]['type'] == 'snapshot'
+    assert client.messages[0]['status'] == 'ready'
+    assert client.messages[0]['output'] == {'lines': [], 'partial_lines': {}}
+
+def test_click_runs_the_command_and_broadcasts_its_output(launcher, config, event_loop, daemon, connect):
+    client = connect(daemon.path)
+    client.send(type='click', key='hello')
+    run_until(launcher, event_loop, client, lambda: b'hi\n' in b''.join(base64.b64decode(message['data']) for message in client.of_type('output')))
+    assert {(message['key'], message['stream']) for message in client.of_type('output')} <= {('hello', 'stdout'), ('hello', 'stderr')}
+    assert ('hello', 'hi') in config.output_pane.lines
+
+def test_unknown_commands_are_ignored_and_cancel_replies(launcher, config, event_loop, daemon, connect):
+    client = connect(daemon.path)
+    client.send(type='click', key='rm -rf /')
+    client.send(type='click', key=['hello'])
+    client.send(type='cancel', key='slow')
+    run_until(launcher, event_loop, client, lambda: client.of_type('notice'))
+    assert client.of_type('notice') == [{'type': 'notice', 'text': 'slow is not running'}]
+    assert not config.supervisor.processes
+
+def test_client_that_stops_reading_is_disconnected(launcher, config, event_loop, daemon, connect):
+    daemon.max_client_buffer = 1000
+    client = connect(daemon.path)
+    run_until(launcher, event_loop, client, lambda: daemon.clients)
+    daemon.broadcast(type='notice', text='x' * 2000)
+    assert not daemon.clients
+
+def test_socket_of_a_running_daemon_is_not_taken_over(launcher, config, event_loop, daemon):
+    with pytest.raises(SystemExit, match='already listening'):
+        launcher.LauncherDaemon(daemon.path, event_loop)
+
+def test_stale_socket_is_replaced(launcher, config, event_loop, tmp_path, connect):
+    path = tmp_path / 'stale.sock'
+    stale = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    stale.bind(str(path))
+    stale.close()
+    daemon = launcher.LauncherDaemon(path, event_loop)
+    try:
+        assert connect(path).sock
+    finally:
+        daemon.shutdown()
+    assert not path.exists()
@@ -0,0 +1,83 @@
+import random
+
+import pytest
+
+KEYS = ['restart_nginx', 'Restart API', 'tail nginx log', 'deploy staging', 'backup db', '▶ Play', 'Café menu', 'rsync nginx']
+
+def brute_force(index, query, limit):
+    # Every key matched on its own with score_key(), recent commands included
+    scores = {}
+    for position, lowered_key in enumerate(index.lowered_keys):
+        score = index.score_key(lowered_key, query.lower())
+        if score is not None:
+            scores[position] = score
+    count = len(scores)
+    for rank, key in enumerate(index.recent):
+        if index.positions[key] in scores:
+            scores[index.positions[key]] -= (rank + 1) * index.SPAN_WEIGHT
+    return count, [index.keys[position] for position in sorted(scores, key=lambda position: (scores[position], position))[:limit]]
+
+def test_subsequence_matching(launcher):
+    index = launcher.FuzzyCommandIndex(KEYS)
+    count, keys = index.top('rsng', 10)
+    assert count == 2
+    assert keys == ['rsync nginx', 'restart_nginx']
+
+def test_case_insensitive_and_non_ascii(launcher):
+    index = launcher.FuzzyCommandIndex(KEYS)
+    assert index.top('CAFÉ', 10) == (1, ['Café menu'])
+    assert index.top('▶', 10) == (1, ['▶ Play'])
+
+def test_no_match(launcher):
+    index = launcher.FuzzyCommandIndex(KEYS)
+    assert index.top('zz', 10) == (0, [])
+
+def test_empty_query_lists_commands_in_order(launcher):
+    index = launcher.FuzzyCommandIndex(KEYS)
+    assert index.top('', 3) == (len(KEYS), KEYS[:3])
+
+def test_tighter_and_earlier_matches_first(launcher):
+    index = launcher.FuzzyCommandIndex(['xx nginx', 'n g i n x', 'nginx'])
+    assert index.top('nginx', 10)[1] == ['nginx', 'xx nginx', 'n g i n x']
+
+def test_recent_commands_are_ranked_first(launcher):
+    index = launcher.FuzzyCommandIndex(KEYS, recent_commands=['tail nginx log'])
+    assert index.top('nginx', 10)[1][0] == 'tail nginx log'
+
+def test_typing_and_backspacing_reuses_prefixes(launcher):
+    index = launcher.FuzzyCommandIndex(KEYS)
+    for text in ('r', 're', 'res', 're', 'ren', ''):
+        assert index.top(text, 10) == brute_force(index, text, 10)
+    assert [step[0] for step in index.steps] == ['']
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_brute_force(launcher, seed):
+    generator = random.Random(seed)
+    alphabet = 'abcdeAB _é🚀'
+    keys = list(dict.fromkeys(''.join(generator.choice(alphabet) for _ in range(generator.randint(0, 12))) for _ in range(500)))
+    index = launcher.FuzzyCommandIndex(keys, recent_commands=keys[:3])
+    for _ in range(50):
+        query = ''.join(generator.choice(alphabet + 'z') for _ in range(generator.randint(0, 4)))
+        for limit in (1, 20):
+            assert index.top(query, limit) == brute_force(index, query, limit)
+
+def test_no_commands(launcher):
+    index = launcher.FuzzyCommandIndex([])
+    assert index.top('a', 10) == (0, [])
+    assert index.top('', 10) == (0, [])
+
+def test_more_than_128_distinct_non_ascii_characters(launcher):
+    # Every character needs a code of its own, also once they don't fit in a single byte
+    keys = [chr(0x4E00 + number) for number in range(200)]
+    index = launcher.FuzzyCommandIndex(keys)
+    for key in keys:
+        assert index.top(key, 10) == (1, [key])
+
+def test_large_alphabet_matches_brute_force(launcher):
+    generator = random.Random(0)
+    alphabet = [chr(0x4E00 + number) for number in range(300)] + list('ab ')
+    keys = list(dict.fromkeys(''.join(generator.choice(alphabet) for _ in range(generator.randint(1, 6))) for _ in range(2000)))
+    index = launcher.FuzzyCommandIndex(keys)
+    for _ in range(100):
+        query = ''.join(generator.choice(alphabet) for _ in range(generator.randint(1, 3)))
+        assert index.top(query, 20) == brute_force(index, query, 20)
@@ -0,0 +1,28 @@
+def test_observations_are_counted_in_their_bucket(launcher):
+    histogram = launcher.Histogram((1, 10, 100))
+    for value in (0.5, 1, 5, 50, 500):
+        histogram.observe(value)
+    assert histogram.counts == [2, 1, 1, 1]
+    assert (histogram.count, histogram.sum, histogram.min, histogram.max) == (5, 556.5, 0.5, 500)
+
+def test_quantile_is_the_upper_bound_of_its_bucket(launcher):
+    histogram = launcher.Histogram((1, 10, 100))
+    for value in (2, 3, 4, 5, 50):
+        histogram.observe(value)
+    assert histogram.quantile(0.5) == 10
+    assert histogram.quantile(0.95) == 50
+
+def test_quantile_never_exceeds_the_largest_observation(launcher):
+    histogram = launcher.Histogram((1, 10, 100))
+    histogram.observe(2)
+    assert histogram.quantile(0.5) == 2
+
+def test_quantile_above_the_last_bound_is_the_maximum(launcher):
+    histogram = launcher.Histogram((1, 10))
+    histogram.observe(1000)
+    assert histogram.quantile(0.99) == 1000
+
+def test_empty_histogram(launcher):
+    histogram = launcher.Histogram((1, 10))
+    assert histogram.quantile(0.5) is None
+    assert histogram.as_dict() == {'buckets': [[1, 0], [10, 0], ['+Inf', 0]], 'count': 0, 'sum': 0, 'min': None, 'max': None}
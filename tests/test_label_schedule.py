@@ -0,0 +1,80 @@
+import time
+import types
+
+import pytest
+import urwid
+
+def run_until(event_loop, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    def check():
+        if condition() or time.monotonic() > deadline:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(0.01, check)
+    event_loop.alarm(0.01, check)
+    event_loop.run()
+
+@pytest.fixture
+def event_loop(launcher, config, monkeypatch):
+    event_loop = urwid.SelectEventLoop()
+    monkeypatch.setattr(config, 'loop', types.SimpleNamespace(event_loop=event_loop), raising=False)
+    config.supervisor = launcher.ProcessSupervisor(event_loop)
+    yield event_loop
+    config.supervisor.shutdown()
+
+def label_schedule(launcher, config, monkeypatch, command, **options):
+    monkeypatch.setattr(config, 'commands', {'label': command})
+    monkeypatch.setattr(config, 'DYNAMIC_LABEL_OPTIONS', {'label': dict({'interval': 60}, **options)}, raising=False)
+    return launcher.register_dynamic_label('label', None, urwid.AttrMap(urwid.Text('label'), None))['schedule']
+
+def test_backoff_and_max_interval(launcher, config, monkeypatch):
+    schedule = label_schedule(launcher, config, monkeypatch, 'true', interval=2, backoff=2, max_interval=10)
+    delays = []
+    for failures in range(5):
+        schedule.failures = failures
+        delays.append(schedule.next_delay())
+    assert delays == [2, 4, 8, 10, 10]
+
+def test_jitter_is_added_to_the_delay(launcher, config, monkeypatch):
+    schedule = label_schedule(launcher, config, monkeypatch, 'true', interval=5, jitter=3)
+    monkeypatch.setattr(launcher.random, 'uniform', lambda low, high: high)
+    assert schedule.next_delay() == 8
+    monkeypatch.setattr(launcher.random, 'uniform', lambda low, high: low)
+    assert schedule.next_delay() == 5
+
+def test_output_of_a_run_is_shown_and_the_next_run_scheduled(launcher, config, monkeypatch, event_loop):
+    schedule = label_schedule(launcher, config, monkeypatch, 'echo one; echo two')
+    schedule.failures = 2
+    schedule.run()
+    run_until(event_loop, lambda: schedule.entry is None)
+    schedule.stop()
+    assert config.dynamic_labels['label']['text'] == 'one\ntwo'
+    assert schedule.failures == 0
+
+def test_failures_count_towards_the_backoff(launcher, config, monkeypatch, event_loop):
+    schedule = label_schedule(launcher, config, monkeypatch, 'exit 1', backoff=2)
+    for runs in (1, 2):
+        schedule.run()
+        run_until(event_loop, lambda: schedule.entry is None)
+        assert schedule.failures == runs
+        assert schedule.alarm_handle is not None
+        event_loop.remove_alarm(schedule.alarm_handle)
+    schedule.stop()
+
+def test_timeout_kills_the_run(launcher, config, monkeypatch, event_loop):
+    schedule = label_schedule(launcher, config, monkeypatch, 'echo partial; sleep 5', timeout=0.2)
+    started = time.monotonic()
+    schedule.run()
+    run_until(event_loop, lambda: schedule.failures)
+    schedule.stop()
+    assert schedule.timed_out and schedule.failures == 1
+    assert time.monotonic() - started < 4
+    # What the run wrote before it was killed is still shown
+    assert config.dynamic_labels['label']['text'] == 'partial'
+
+def test_hidden_labels_are_not_run(launcher, config, monkeypatch, event_loop):
+    schedule = label_schedule(launcher, config, monkeypatch, 'echo shown')
+    config.grid = types.SimpleNamespace(visible_widgets=lambda: set())
+    schedule.run()
+    schedule.stop()
+    assert schedule.entry is None and not config.supervisor.processes
+    assert config.dynamic_labels['label']['text'] == 'label'
@@ -0,0 +1,73 @@
+import pytest
+import urwid
+
+@pytest.fixture
+def commands(config, monkeypatch):
+    commands = {}
+    monkeypatch.setattr(config, 'commands', commands)
+    return commands
+
+@pytest.fixture
+def event_loop(launcher, config):
+    event_loop = urwid.SelectEventLoop()
+    config.supervisor = launcher.ProcessSupervisor(event_loop)
+    yield event_loop
+    config.supervisor.shutdown()
+
+@pytest.fixture
+def output():
+    lines = []
+
+    def output_for(label):
+        def on_output(data, stream='stdout'):
+            lines.extend(f"""{label}: {line}""" for line in data.decode().splitlines())
+        return on_output
+    output_for.lines = lines
+    return output_for
+
+def test_valid_macro(launcher, commands):
+    commands.update({'build': 'true', 'test': 'true', 'release': {'steps': {'build': [], 'test': ['build']}}})
+    launcher.validate_macros()
+
+@pytest.mark.parametrize('macro, message', [
+    ({'steps': {}}, "needs a dict of 'steps'"),
+    ({'steps': {'build': ['test'], 'test': ['build']}}, 'dependency cycle'),
+    ({'steps': {'build': ['lint']}}, 'which is not one of its steps'),
+    ({'steps': {'nothing': []}}, 'has a step that is not a command'),
+    ({'steps': {'build': []}, 'on_failure': 'retry'}, "'on_failure' should be"),
+    ({'steps': {'build': []}, 'parallelism': 0}, "'parallelism' should be"),
+])
+def test_invalid_macros(launcher, commands, macro, message):
+    commands.update({'build': 'true', 'test': 'true', 'release': macro})
+    with pytest.raises(SystemExit, match=message):
+        launcher.validate_macros()
+
+def test_step_that_cannot_be_started_fails_the_macro(launcher, config, commands, event_loop, output, tmp_path):
+    # Spawning a list command whose executable doesn't exist raises, rather than starting a process that fails
+    commands.update({
+        'missing binary': [str(tmp_path / 'no-such-binary')],
+        'after': ['true'],
+        'release': {'steps': {'missing binary': [], 'after': ['missing binary']}},
+    })
+    macro_run = launcher.run_macro('release', output)
+    assert macro_run.finished_at is not None
+    assert macro_run.results == {'missing binary': 'failed', 'after': 'skipped'}
+    assert 'release' not in config.macro_runs
+    assert any(line.startswith('release: missing binary: could not be started') for line in output.lines)
+
+def test_steps_run_after_their_dependencies(launcher, config, commands, event_loop, output):
+    commands.update({
+        'first': ['echo', 'one'],
+        'second': ['echo', 'two'],
+        'release': {'steps': {'first': [], 'second': ['first']}},
+    })
+
+    def stop_when_finished():
+        if not config.macro_runs:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(0.01, stop_when_finished)
+    macro_run = launcher.run_macro('release', output)
+    event_loop.alarm(0.01, stop_when_finished)
+    event_loop.run()
+    assert macro_run.results == {'first': 'succeeded', 'second': 'succeeded'}
+    assert output.lines.index('first: one') < output.lines.index('second: two')
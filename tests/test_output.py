@@ -0,0 +1,107 @@
+import os
+import threading
+import time
+
+import pytest
+import urwid
+
+def test_plain_text(launcher):
+    assert launcher.AnsiParser().feed('plain') == [(None, 'plain')]
+
+def test_colours_become_attributes(launcher):
+    assert launcher.AnsiParser().feed('\x1b[31mred\x1b[0m plain') == [('ansi:dark red:', 'red'), (None, ' plain')]
+
+def test_extended_colours_and_settings(launcher):
+    segments = launcher.AnsiParser().feed('\x1b[38;5;200mx\x1b[48;2;255;0;0my\x1b[1mz\x1b[22mw')
+    assert segments == [('ansi:h200:', 'x'), ('ansi:h200:#f00', 'y'), ('ansi:bold,h200:#f00', 'z'), ('ansi:h200:#f00', 'w')]
+
+def test_escape_sequence_split_across_chunks(launcher):
+    parser = launcher.AnsiParser()
+    assert parser.feed('a\x1b[3') == [(None, 'a')]
+    assert parser.feed('1mb') == [('ansi:dark red:', 'b')]
+
+def test_other_escape_sequences_are_removed(launcher):
+    assert launcher.AnsiParser().feed('\x1b]0;title\x07text\x1b[2Kmore') == [(None, 'text'), (None, 'more')]
+
+def test_without_colours(launcher):
+    assert launcher.AnsiParser(colors=False).feed('\x1b[31mred') == [(None, 'red')]
+
+def test_output_buffer_splits_lines(launcher):
+    buffer = launcher.OutputBuffer()
+    assert buffer.feed(b'one\ntwo') == (['one'], 'stdout', 'two')
+    assert buffer.feed(b'\n') == (['two'], 'stdout', None)
+
+def test_output_buffer_decodes_characters_split_across_chunks(launcher):
+    buffer = launcher.OutputBuffer()
+    assert buffer.feed(b'caf\xc3') == ([], 'stdout', 'caf')
+    assert buffer.feed(b'\xa9\n') == (['café'], 'stdout', None)
+
+def test_output_buffer_returns_markup_for_coloured_lines(launcher):
+    assert launcher.OutputBuffer().feed(b'\x1b[32mok\x1b[0m done\n') == ([[('ansi:dark green:', 'ok'), ' done']], 'stdout', None)
+
+def test_output_buffer_finishes_the_last_line_at_the_end_of_the_stream(launcher):
+    buffer = launcher.OutputBuffer()
+    assert buffer.feed(b'tail', 'stderr') == ([], 'stderr', 'tail')
+    assert buffer.feed(b'', 'stderr') == (['tail'], 'stderr', None)
+
+@pytest.fixture
+def output_pane(launcher, config):
+    return launcher.OutputPane(urwid.Text(''), visible_lines=3, scrollback_lines=5)
+
+def test_output_pane_keeps_the_history_of_every_command(launcher, output_pane):
+    output_pane.feed('quiet', b'q1\nq2\n')
+    output_pane.feed('chatty', b''.join(f"""c{number}\n""".encode() for number in range(10)))
+    assert 'quiet' not in {label for label, _ in output_pane.lines}
+    output_pane.set_filter('quiet')
+    assert output_pane.window() == [('quiet', 'q1'), ('quiet', 'q2')]
+    output_pane.set_filter(None)
+    assert output_pane.window() == [('chatty', 'c7'), ('chatty', 'c8'), ('chatty', 'c9')]
+
+def test_output_pane_scrolls_within_the_filtered_command(launcher, output_pane):
+    output_pane.feed('quiet', b'q1\nq2\nq3\nq4\n')
+    output_pane.feed('chatty', b'c1\nc2\n')
+    output_pane.set_filter('quiet')
+    output_pane.scroll(10)
+    assert output_pane.window() == [('quiet', 'q1'), ('quiet', 'q2'), ('quiet', 'q3')]
+
+class SlowBuffer():
+    def __init__(self, started):
+        self.started = started
+
+    def feed(self, data, stream='stdout'):
+        self.started.set()
+        time.sleep(0.2)
+        return ([data.decode()], stream, None)
+
+def stop_loop():
+    raise urwid.ExitMainLoop()
+
+def test_pipeline_delivers_lines_on_the_event_loop(launcher):
+    event_loop = urwid.SelectEventLoop()
+    pipeline = launcher.OutputPipeline(event_loop)
+    delivered = []
+    def on_lines(new_lines, stream, partial_line):
+        delivered.append((new_lines, stream, partial_line))
+        raise urwid.ExitMainLoop()
+    try:
+        pipeline.submit(launcher.OutputBuffer(), b'one\ntw', 'stdout', on_lines)
+        event_loop.alarm(5, stop_loop)
+        event_loop.run()
+    finally:
+        pipeline.stop()
+    assert delivered == [(['one'], 'stdout', 'tw')]
+    assert pipeline.pending == 0
+
+def test_pipeline_stops_its_worker_before_closing_the_wake_pipe(launcher):
+    pipeline = launcher.OutputPipeline(urwid.SelectEventLoop())
+    started = threading.Event()
+    for _ in range(5):
+        pipeline.submit(SlowBuffer(started), b'line\n', 'stdout', lambda *lines: None)
+    assert started.wait(5)
+    pipeline.stop()
+    # Waited for the chunk it was parsing, and skipped the rest
+    assert not pipeline.thread.is_alive()
+    assert pipeline.jobs.qsize() == 4
+    for fd in (pipeline.wake_read, pipeline.wake_write):
+        with pytest.raises(OSError):
+            os.fstat(fd)
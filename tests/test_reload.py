@@ -0,0 +1,163 @@
+import os
+import time
+import types
+
+import pytest
+import urwid
+
+def run_until(event_loop, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    def check():
+        if condition() or time.monotonic() > deadline:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(0.01, check)
+    event_loop.alarm(0.01, check)
+    event_loop.run()
+
+@pytest.fixture
+def watched_file(tmp_path):
+    path = tmp_path / 'config.py'
+    path.write_text('one\n', encoding='utf-8')
+    return path
+
+@pytest.fixture(params=['inotify', 'polling'])
+def watcher(request, launcher, monkeypatch, watched_file):
+    if request.param == 'polling':
+        monkeypatch.setattr(launcher.FileWatcher, 'watch_inotify', lambda self: None)
+    event_loop = urwid.SelectEventLoop()
+    changes = []
+    watcher = launcher.FileWatcher([watched_file], event_loop, lambda: changes.append(time.monotonic()), poll_interval=0.05, settle_time=0.1)
+    assert (watcher.fd is None) == (request.param == 'polling')
+    watcher.changes = changes
+    yield watcher
+    watcher.stop()
+
+def test_watcher_reports_a_change_once_it_has_settled(watcher, watched_file):
+    def save_in_steps():
+        watched_file.write_text('two\n', encoding='utf-8')
+        watcher.event_loop.alarm(0.02, lambda: watched_file.write_text('two and more\n', encoding='utf-8'))
+    watcher.event_loop.alarm(0.1, save_in_steps)
+    run_until(watcher.event_loop, lambda: watcher.changes)
+    # Editors that save in several steps cause a single reload
+    run_until(watcher.event_loop, lambda: False, timeout=0.4)
+    assert len(watcher.changes) == 1
+
+def test_watcher_sees_files_renamed_over_the_watched_one(watcher, watched_file):
+    def save_by_renaming():
+        new_file = watched_file.with_name('config.py.new')
+        new_file.write_text('renamed and longer\n', encoding='utf-8')
+        os.replace(new_file, watched_file)
+    watcher.event_loop.alarm(0.1, save_by_renaming)
+    run_until(watcher.event_loop, lambda: watcher.changes)
+    assert len(watcher.changes) == 1
+
+def test_watcher_ignores_other_files(watcher, watched_file):
+    watcher.event_loop.alarm(0.1, lambda: watched_file.with_name('other.py').write_text('other\n', encoding='utf-8'))
+    run_until(watcher.event_loop, lambda: False, timeout=0.5)
+    assert watcher.changes == []
+
+CONFIG = """from pathlib import Path
+PALETTE = [('button', '', ''), ('focused_button', '', ''), ('dynamic_label', '', '')]
+VERTICAL_PADDING = [0, 0]
+HORIZONTAL_PADDING = [1, 1]
+commands = {commands!r}
+layout_file = Path({layout_file!r})
+"""
+
+class Screen():
+    def register_palette(self, palette):
+        self.palette = palette
+
+    def clear(self):
+        pass
+
+@pytest.fixture
+def reloadable(launcher, config, monkeypatch, tmp_path):
+    # A config of its own in place of the one launcher.py was started with; every global that reload_config() swaps is put back afterwards
+    config_file = tmp_path / 'reload_test_config.py'
+    layout_file = tmp_path / 'layout.txt'
+    monkeypatch.setattr(launcher, 'config_source', config_file)
+    monkeypatch.setattr(launcher, 'module_name', 'reload_test_config')
+    monkeypatch.setattr(launcher, 'config_path', config_file)
+    monkeypatch.setattr(launcher, 'layout_override', None)
+    monkeypatch.setattr(launcher, 'Config', launcher.Config)
+    monkeypatch.setattr(launcher, 'BUTTON_ROWS', [])
+    monkeypatch.setattr(launcher, 'warnings', [])
+    def write(commands, rows):
+        config_file.write_text(CONFIG.format(commands=commands, layout_file=str(layout_file)), encoding='utf-8')
+        layout_file.write_text(''.join(', '.join(row) + '\n' for row in rows), encoding='utf-8')
+    def load(commands, rows):
+        write(commands, rows)
+        launcher.Config = launcher.load_config_module()
+        launcher.set_layout_file()
+        launcher.compile_config()
+        launcher.init_runtime_state()
+        launcher.Config.status_widget = urwid.Text('')
+        launcher.Config.loop = types.SimpleNamespace(screen=Screen(), event_loop=urwid.SelectEventLoop())
+        launcher.Config.reloaded_sources = launcher.config_file_hashes()
+        launcher.Config.grid = launcher.ButtonGrid(launcher.BUTTON_ROWS)
+        launcher.Config.pile = None
+        return launcher.Config
+    return types.SimpleNamespace(write=write, load=load)
+
+COMMANDS = {'a': 'true', 'b': 'true', 'c': 'true', 'd': 'true'}
+
+def built_rows(launcher):
+    grid = launcher.Config.grid
+    return [grid.body[position] for position in range(len(launcher.BUTTON_ROWS))]
+
+def labels(row):
+    return [widget.label for widget, _ in row.contents]
+
+def test_only_changed_rows_are_rebuilt(launcher, reloadable):
+    reloadable.load(COMMANDS, [['a'], ['b'], ['c']])
+    first, second, third = built_rows(launcher)
+    reloadable.write(COMMANDS, [['a'], ['b', 'd'], ['c']])
+    launcher.reload_config()
+    rows = built_rows(launcher)
+    assert rows[0] is first and rows[2] is third
+    assert rows[1] is not second and labels(rows[1]) == ['b', 'd']
+    assert launcher.Config.status_text.endswith('1 of 3 rows rebuilt, 0 dynamic labels (re)started')
+
+def test_inserted_rows_move_the_others(launcher, reloadable):
+    reloadable.load(COMMANDS, [['a'], ['b']])
+    first, second = built_rows(launcher)
+    reloadable.write(COMMANDS, [['d'], ['a'], ['b']])
+    launcher.reload_config()
+    rows = built_rows(launcher)
+    assert (rows[1], rows[2]) == (first, second)
+    assert second.contents[0][0].position == (2, 0)
+
+def test_changes_to_every_button_rebuild_every_row(launcher, reloadable):
+    reloadable.load(COMMANDS, [['a'], ['b']])
+    first, second = built_rows(launcher)
+    old_config = launcher.Config
+    # The layout stays the same; the padding of every button changes
+    source = launcher.config_source.read_text(encoding='utf-8').replace('HORIZONTAL_PADDING = [1, 1]', 'HORIZONTAL_PADDING = [2, 2]')
+    launcher.config_source.write_text(source, encoding='utf-8')
+    launcher.reload_config()
+    rows = built_rows(launcher)
+    assert launcher.Config is not old_config
+    assert rows[0] is not first and rows[1] is not second
+    assert launcher.Config.status_text.endswith('2 of 2 rows rebuilt, 0 dynamic labels (re)started')
+
+def test_unchanged_files_are_not_reloaded(launcher, reloadable):
+    config = reloadable.load(COMMANDS, [['a']])
+    os.utime(launcher.config_source, ns=(0, 0))
+    launcher.reload_config()
+    assert launcher.Config is config
+
+def test_broken_config_keeps_the_running_one(launcher, reloadable):
+    config = reloadable.load(COMMANDS, [['a'], ['b']])
+    launcher.config_source.write_text('commands = {', encoding='utf-8')
+    launcher.reload_config()
+    assert launcher.Config is config
+    assert launcher.BUTTON_ROWS == [['a'], ['b']]
+    assert config.status_text.startswith('Not reloading')
+
+def test_layout_with_an_unknown_command_keeps_the_running_config(launcher, reloadable):
+    config = reloadable.load(COMMANDS, [['a']])
+    reloadable.write(COMMANDS, [['a'], ['missing']])
+    launcher.reload_config()
+    assert launcher.Config is config
+    assert 'could not find command key: missing' in config.status_text
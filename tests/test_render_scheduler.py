@@ -0,0 +1,94 @@
+import types
+
+import pytest
+import urwid
+
+# Alarms are only recorded, and fired by advancing the clock; the intervals in these tests are powers of two, so the clock adds up exactly
+class FakeEventLoop():
+    def __init__(self, clock):
+        self.clock = clock
+        self.alarms = []
+
+    def alarm(self, seconds, callback):
+        handle = [self.clock.now + seconds, callback]
+        self.alarms.append(handle)
+        return handle
+
+    def remove_alarm(self, handle):
+        self.alarms.remove(handle)
+
+    def advance(self, seconds):
+        self.clock.now += seconds
+        for handle in sorted(self.alarms, key=lambda handle: handle[0]):
+            if handle[0] <= self.clock.now and handle in self.alarms:
+                self.alarms.remove(handle)
+                handle[1]()
+
+@pytest.fixture
+def clock(launcher, monkeypatch):
+    clock = types.SimpleNamespace(now=1000.0)
+    monkeypatch.setattr(launcher, 'time', types.SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+@pytest.fixture
+def event_loop(clock):
+    return FakeEventLoop(clock)
+
+def test_updates_of_a_widget_are_coalesced(launcher, event_loop):
+    scheduler = launcher.RenderScheduler(event_loop, max_refresh_rate=8)
+    widget = urwid.Text('')
+    for index in range(100):
+        scheduler.set_text(widget, f"""line {index}""")
+    assert len(event_loop.alarms) == 1
+    assert widget.text == ''
+    event_loop.advance(0)
+    assert widget.text == 'line 99'
+    assert (scheduler.requested, scheduler.flushed, scheduler.saved) == (100, 1, 99)
+
+def test_refresh_rate_is_kept_per_widget(launcher, event_loop):
+    scheduler = launcher.RenderScheduler(event_loop, max_refresh_rate=8)
+    widget = urwid.Text('')
+    scheduler.set_text(widget, 'first')
+    event_loop.advance(0)
+    scheduler.set_text(widget, 'second')
+    event_loop.advance(0.0625)
+    assert widget.text == 'first'
+    event_loop.advance(0.0625)
+    assert widget.text == 'second'
+
+def test_widgets_with_their_own_refresh_rate(launcher, event_loop):
+    scheduler = launcher.RenderScheduler(event_loop, max_refresh_rate=8)
+    fast, slow = urwid.Text(''), urwid.Text('')
+    for widget in (fast, slow):
+        scheduler.set_text(widget, 'first')
+    event_loop.advance(0)
+    scheduler.set_text(fast, 'second')
+    scheduler.set_text(slow, 'second', max_refresh_rate=1)
+    event_loop.advance(0.125)
+    assert (fast.text, slow.text) == ('second', 'first')
+    # The slow label is still pending, so the scheduler woke itself up again for it
+    assert len(event_loop.alarms) == 1
+    event_loop.advance(0.875)
+    assert slow.text == 'second'
+
+def test_an_earlier_update_moves_the_alarm_forward(launcher, event_loop):
+    scheduler = launcher.RenderScheduler(event_loop, max_refresh_rate=8)
+    slow, fast = urwid.Text(''), urwid.Text('')
+    scheduler.set_text(slow, 'first', max_refresh_rate=1)
+    event_loop.advance(0)
+    scheduler.set_text(slow, 'second', max_refresh_rate=1)
+    scheduler.set_text(fast, 'first')
+    assert len(event_loop.alarms) == 1
+    event_loop.advance(0)
+    assert (fast.text, slow.text) == ('first', 'first')
+
+def test_uncounted_updates_and_on_flush(launcher, event_loop):
+    flushes = []
+    scheduler = launcher.RenderScheduler(event_loop, max_refresh_rate=8, on_flush=lambda: flushes.append(scheduler.saved))
+    updates = []
+    for _ in range(3):
+        scheduler.schedule('status_line', lambda: updates.append(1), counted=False)
+    event_loop.advance(0)
+    assert updates == [1]
+    assert flushes == [0]
+    assert scheduler.requested == scheduler.flushed == 0
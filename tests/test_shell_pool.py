@@ -0,0 +1,95 @@
+import os
+import signal
+import time
+
+import pytest
+import urwid
+
+def run_until(event_loop, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    def check():
+        if condition() or time.monotonic() > deadline:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(0.01, check)
+    event_loop.alarm(0.01, check)
+    event_loop.run()
+
+@pytest.fixture
+def event_loop():
+    return urwid.SelectEventLoop()
+
+@pytest.fixture
+def pool(launcher, event_loop):
+    return launcher.ShellPool(event_loop, 2, max_jobs=3)
+
+@pytest.fixture
+def supervisor(launcher, event_loop, pool):
+    supervisor = launcher.ProcessSupervisor(event_loop, shell_pool=pool)
+    yield supervisor
+    supervisor.shutdown()
+
+def run(event_loop, supervisor, cmd, command_key='test'):
+    output = {'stdout': [], 'stderr': []}
+    exited = []
+    entry = supervisor.spawn(command_key, cmd, lambda data, stream='stdout': output[stream].append(data), exited.append)
+    run_until(event_loop, lambda: exited)
+    return entry, b''.join(output['stdout']), b''.join(output['stderr']), exited
+
+def test_jobs_run_in_a_pooled_shell(launcher, event_loop, supervisor):
+    entry, stdout, stderr, exited = run(event_loop, supervisor, 'echo out; echo err >&2')
+    assert isinstance(entry.process, launcher.PooledJob)
+    assert (stdout, stderr, exited) == (b'out\n', b'err\n', [0])
+
+def test_multi_line_commands_and_quoting(event_loop, supervisor):
+    cmd = """printf '%s\\n' "it's" 'a "quote"'
+echo 'second
+line'"""
+    entry, stdout, stderr, exited = run(event_loop, supervisor, cmd)
+    assert stdout == b'it\'s\na "quote"\nsecond\nline\n'
+    assert exited == [0]
+
+def test_workers_are_reused_without_sharing_state(event_loop, supervisor):
+    first = run(event_loop, supervisor, 'leaked=yes; cd /')[0]
+    second, stdout, stderr, exited = run(event_loop, supervisor, 'echo "[$leaked]"; pwd')
+    assert first.pid == second.pid
+    assert stdout == f"""[]\n{os.getcwd()}\n""".encode()
+
+def test_stdin_is_empty(event_loop, supervisor):
+    assert run(event_loop, supervisor, 'cat')[1:] == (b'', b'', [0])
+
+def test_failed_jobs_retire_their_worker(event_loop, supervisor, pool):
+    first = run(event_loop, supervisor, 'exit 4')
+    assert first[3] == [4]
+    second = run(event_loop, supervisor, 'true')[0]
+    assert second.pid != first[0].pid
+    assert len(pool.idle) == 2
+
+def test_workers_retire_after_max_jobs(event_loop, supervisor, pool):
+    pids = [run(event_loop, supervisor, 'true')[0].pid for _ in range(4)]
+    # The most recently used worker takes the next job, until it has done three
+    assert pids[0] == pids[1] == pids[2] != pids[3]
+    assert all(worker.jobs < 3 for worker in pool.idle)
+
+def test_cancelling_a_job(event_loop, supervisor, pool):
+    output = []
+    exited = []
+    entry = supervisor.spawn('slow', 'echo started; sleep 5', lambda data, stream='stdout': output.append(data), exited.append)
+    run_until(event_loop, lambda: output)
+    supervisor.cancel('slow')
+    run_until(event_loop, lambda: exited)
+    assert exited == [-signal.SIGTERM]
+    # The worker went down with its job, and was replaced
+    run_until(event_loop, lambda: len(pool.idle) == 2)
+    assert entry.pid not in [worker.process.pid for worker in pool.idle]
+
+def test_list_commands_are_not_pooled(launcher, event_loop, supervisor):
+    entry = run(event_loop, supervisor, ['echo', 'direct'])[0]
+    assert not isinstance(entry.process, launcher.PooledJob)
+
+def test_shutdown_removes_the_fifo_directory(launcher, event_loop):
+    pool = launcher.ShellPool(event_loop, 1)
+    workers = list(pool.idle)
+    pool.shutdown()
+    assert not pool.directory.exists()
+    for worker in workers:
+        worker.process.wait(timeout=5)
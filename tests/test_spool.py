@@ -0,0 +1,79 @@
+import os
+
+import pytest
+import urwid
+
+def write_lines(path, count):
+    path.write_bytes(b''.join(f"""line {number}\n""".encode() for number in range(count)))
+
+@pytest.fixture
+def small_blocks(launcher, monkeypatch):
+    # A block size that puts a few lines in every block, so the tests cross block boundaries
+    monkeypatch.setattr(launcher.SpoolIndex, 'BLOCK_SIZE', 16)
+
+def test_line_count(launcher, small_blocks, tmp_path):
+    path = tmp_path / 'out.log'
+    write_lines(path, 100)
+    index = launcher.SpoolIndex(path)
+    try:
+        assert index.line_count() == 100
+    finally:
+        index.close()
+
+def test_unterminated_last_line_is_counted(launcher, small_blocks, tmp_path):
+    path = tmp_path / 'out.log'
+    path.write_bytes(b'first\nsecond\nstill being written')
+    index = launcher.SpoolIndex(path)
+    try:
+        assert index.line_count() == 3
+        assert index.lines(index.line_offset(2), 5) == [b'still being written']
+    finally:
+        index.close()
+
+def test_line_offsets_and_lines(launcher, small_blocks, tmp_path):
+    path = tmp_path / 'out.log'
+    write_lines(path, 100)
+    index = launcher.SpoolIndex(path)
+    try:
+        for line in (0, 1, 7, 42, 99):
+            offset = index.line_offset(line)
+            assert index.lines(offset, 2) == [f"""line {number}""".encode() for number in range(line, min(line + 2, 100))]
+            assert index.line_of_offset(offset) == line
+    finally:
+        index.close()
+
+def test_empty_file(launcher, tmp_path):
+    path = tmp_path / 'out.log'
+    path.write_bytes(b'')
+    index = launcher.SpoolIndex(path)
+    try:
+        assert index.line_count() == 0
+        assert index.lines(index.line_offset(3), 1) == []
+    finally:
+        index.close()
+
+def test_growing_file_is_remapped(launcher, small_blocks, tmp_path):
+    path = tmp_path / 'out.log'
+    write_lines(path, 10)
+    index = launcher.SpoolIndex(path)
+    try:
+        assert index.line_count() == 10
+        with path.open('ab') as fp:
+            fp.write(b'line 10\n')
+        assert index.remap()
+        assert index.line_count() == 11
+    finally:
+        index.close()
+
+def test_spool_file_is_discarded_when_the_command_cannot_be_started(launcher, config, monkeypatch, tmp_path):
+    spool_directory = tmp_path / 'spool'
+    monkeypatch.setattr(config, 'commands', {'missing binary': [str(tmp_path / 'no-such-binary')]})
+    config.supervisor = launcher.ProcessSupervisor(urwid.SelectEventLoop())
+    config.spool = launcher.Spool(spool_directory)
+    open_fds = len(os.listdir('/proc/self/fd')) if os.path.isdir('/proc/self/fd') else None
+    with pytest.raises(FileNotFoundError):
+        launcher.run_button_command('missing binary', lambda label: lambda data, stream='stdout': None)
+    assert config.spool.open_files == {}
+    assert list(spool_directory.iterdir()) == []
+    if open_fds is not None:
+        assert len(os.listdir('/proc/self/fd')) == open_fds
@@ -0,0 +1,68 @@
+import json
+
+import pytest
+import urwid
+
+@pytest.fixture
+def label(launcher, config, monkeypatch):
+    monkeypatch.setattr(config, 'commands', {'clock': 'date'})
+    return launcher.register_dynamic_label('clock', None, urwid.AttrMap(urwid.Text('clock'), None))
+
+@pytest.fixture
+def pane(launcher, config):
+    config.output_pane = launcher.OutputPane(urwid.Text(''), visible_lines=3, scrollback_lines=5)
+    return config.output_pane
+
+def write_state(path, state):
+    path.write_text(json.dumps(state), encoding='utf-8')
+    return path
+
+def saved_state(launcher, **changes):
+    state = {'version': launcher.STATE_VERSION, 'labels': {'clock': [['ansi:dark red:', '12:00'], ' UTC']}, 'output': {'lines': [['clock', 'one']], 'partial_lines': {'clock': {'stdout': 'tw'}}}, 'active': None}
+    state.update(changes)
+    return state
+
+def test_restores_labels_and_output(launcher, config, label, pane, tmp_path):
+    assert launcher.restore_state(write_state(tmp_path / 'state.json', saved_state(launcher)))
+    assert label['text'] == [('ansi:dark red:', '12:00'), ' UTC']
+    assert list(pane.lines) == [('clock', 'one')]
+    assert pane.partial_lines == {'clock': {'stdout': 'tw'}}
+
+def test_missing_state_file(launcher, config, label, tmp_path):
+    assert not launcher.restore_state(tmp_path / 'state.json')
+    assert label['text'] == 'clock'
+
+def test_corrupt_state_file(launcher, config, label, tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_bytes(b'\xff\xfe not json')
+    assert not launcher.restore_state(path)
+    assert label['text'] == 'clock'
+
+def test_truncated_state_file(launcher, config, label, pane, tmp_path):
+    path = tmp_path / 'state.json'
+    path.write_text(json.dumps(saved_state(launcher))[:40], encoding='utf-8')
+    assert not launcher.restore_state(path)
+    assert label['text'] == 'clock'
+    assert not pane.lines
+
+@pytest.mark.parametrize('state', [
+    [],
+    {'version': 1},
+    {'version': 1, 'labels': [], 'output': None, 'active': None},
+    {'version': 1, 'labels': {'clock': 5}, 'output': None, 'active': None},
+    {'version': 1, 'labels': {'clock': [['attribute']]}, 'output': None, 'active': None},
+    {'version': 1, 'labels': {'clock': 'restored'}, 'output': {'lines': [['clock']], 'partial_lines': {}}, 'active': None},
+    {'version': 1, 'labels': {'clock': 'restored'}, 'output': {'lines': []}, 'active': None},
+    {'version': 1, 'labels': {'clock': 'restored'}, 'output': None, 'active': {'key': 'clock', 'position': [0], 'status': ''}},
+    {'version': 1, 'labels': {'clock': 'restored'}, 'output': None, 'active': {'key': 'clock', 'position': [0, -1], 'status': ''}},
+    {'version': 1, 'labels': {'clock': 'restored'}, 'output': None, 'active': {'position': [0, 0]}},
+])
+def test_unexpected_contents_are_ignored(launcher, config, label, pane, tmp_path, state):
+    # Nothing is restored from a state file that doesn't have the expected shape, not even the parts that look fine
+    assert not launcher.restore_state(write_state(tmp_path / 'state.json', state))
+    assert label['text'] == 'clock'
+    assert not pane.lines
+
+def test_other_versions_are_ignored(launcher, config, label, tmp_path):
+    assert not launcher.restore_state(write_state(tmp_path / 'state.json', saved_state(launcher, version=launcher.STATE_VERSION + 1)))
+    assert label['text'] == 'clock'
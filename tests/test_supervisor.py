@@ -0,0 +1,90 @@
+import os
+import signal
+import time
+
+import pytest
+import urwid
+
+def run_until(event_loop, condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    def check():
+        if condition() or time.monotonic() > deadline:
+            raise urwid.ExitMainLoop()
+        event_loop.alarm(0.01, check)
+    event_loop.alarm(0.01, check)
+    event_loop.run()
+
+@pytest.fixture
+def event_loop():
+    return urwid.SelectEventLoop()
+
+@pytest.fixture
+def supervisor(launcher, event_loop):
+    supervisor = launcher.ProcessSupervisor(event_loop)
+    yield supervisor
+    supervisor.shutdown()
+
+def spawn(supervisor, cmd, command_key='test'):
+    output = {'stdout': [], 'stderr': []}
+    exited = []
+    entry = supervisor.spawn(command_key, cmd, lambda data, stream='stdout': output[stream].append(data), exited.append)
+    return entry, output, exited
+
+def test_output_and_exit_status(supervisor, event_loop):
+    entry, output, exited = spawn(supervisor, 'echo out; echo err >&2; exit 3')
+    run_until(event_loop, lambda: exited)
+    assert exited == [3]
+    assert b''.join(output['stdout']) == b'out\n' and b''.join(output['stderr']) == b'err\n'
+    # Both streams end with an empty chunk
+    assert output['stdout'][-1] == b'' and output['stderr'][-1] == b''
+
+def test_children_are_reaped(supervisor, event_loop):
+    entries = [spawn(supervisor, ['true'])[0] for _ in range(5)]
+    run_until(event_loop, lambda: not supervisor.processes)
+    assert not supervisor.processes
+    for entry in entries:
+        assert entry.process.returncode == 0
+        # Nothing left to wait for: no zombies
+        with pytest.raises(ChildProcessError):
+            os.waitpid(entry.pid, os.WNOHANG)
+
+def test_finishes_only_once_all_output_is_read(supervisor, event_loop):
+    # The shell has exited long before its background child closes the pipe
+    entry, output, exited = spawn(supervisor, '(sleep 0.3; echo late) &')
+    run_until(event_loop, lambda: exited)
+    assert exited == [0]
+    assert b''.join(output['stdout']) == b'late\n'
+
+def test_timeout_terminates_the_process_group(supervisor, event_loop):
+    supervisor.command_timeouts = {'slow': 0.2}
+    started = time.monotonic()
+    entry, output, exited = spawn(supervisor, 'sleep 5 & sleep 5', command_key='slow')
+    run_until(event_loop, lambda: exited)
+    assert exited == [-signal.SIGTERM]
+    assert entry.stopped_by == 'timeout'
+    assert time.monotonic() - started < 4
+
+def test_processes_ignoring_sigterm_are_killed(supervisor, event_loop, monkeypatch):
+    monkeypatch.setattr(supervisor, 'KILL_GRACE', 0.2)
+    supervisor.command_timeout = 0.2
+    entry, output, exited = spawn(supervisor, "trap '' TERM; sleep 5")
+    run_until(event_loop, lambda: exited)
+    assert exited == [-signal.SIGKILL]
+
+def test_cancel(supervisor, event_loop):
+    entry, output, exited = spawn(supervisor, ['sleep', '5'], command_key='slow')
+    assert supervisor.cancel('slow') == [entry]
+    run_until(event_loop, lambda: exited)
+    assert exited == [-signal.SIGTERM]
+    assert entry.stopped_by == 'cancelled'
+    assert supervisor.cancel('slow') == []
+
+def test_limits(supervisor):
+    supervisor.max_processes_per_command = 1
+    spawn(supervisor, ['sleep', '5'], command_key='slow')
+    assert 'already running 1 time' in supervisor.limit_reached('slow')
+    assert supervisor.limit_reached('other') is None
+    supervisor.process_limits = {'slow': 2}
+    assert supervisor.limit_reached('slow') is None
+    supervisor.max_processes = 1
+    assert 'MAX_PROCESSES = 1' in supervisor.limit_reached('other')
@@ -0,0 +1,39 @@
+import pickle
+
+import pytest
+
+@pytest.mark.parametrize('text, width', [
+    ('abc', 3),
+    ('', 0),
+    ('コマンド', 8),
+    ('🇳🇱', 2),
+    ('👨‍👩‍👧‍👦', 2),
+    ('🏳️‍🌈', 2),
+    ('é', 1),
+    ('1️⃣', 2),
+    ('👍🏽', 2),
+    ('नमस्ते', 4),
+    ('▶ Play', 6),
+])
+def test_display_width(launcher, text, width):
+    assert launcher.display_width(text) == width
+
+def test_clusters_are_never_split(launcher):
+    family = '👨‍👩‍👧‍👦'
+    assert list(launcher.grapheme_clusters(f"""a{family}b""")) == [(1, 1), (1 + len(family), 2), (2 + len(family), 1)]
+    assert launcher.truncate_to_width(f"""a{family}b""", 2) == ('a', 1)
+    assert launcher.truncate_to_width(f"""a{family}b""", 3) == (f"""a{family}""", 3)
+
+def test_truncate_wide_characters(launcher):
+    assert launcher.truncate_to_width('コマンド', 5) == ('コマ', 4)
+    assert launcher.truncate_to_width('abc', 10) == ('abc', 3)
+
+def test_fill_to_width(launcher):
+    assert launcher.fill_to_width('━', 5) == '━━━━━'
+    assert launcher.fill_to_width('コ', 5) == 'ココ '
+
+def test_width_table_is_cached(launcher):
+    launcher.display_width('コ')
+    with launcher.width_table_path().open('rb') as fp:
+        cached = pickle.load(fp)
+    assert cached == launcher.build_width_table()